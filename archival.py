@@ -0,0 +1,233 @@
+"""Soft delete and background archival of employees and projects.
+
+Deleting an employee or project only stamps ``archived_at`` and queues an
+``archive_jobs`` row; active-only queries skip it through partial indexes.
+The archival worker then moves the dependent history (attendance, clock
+events, payroll, assignments, reports) into the ``*_archive`` tables in
+small batches, one short transaction per batch, so a delete never holds
+locks on the hot tables for long.  The archived row itself stays behind as a tombstone for the
+archive tables to refer to.
+
+The worker runs as a daemon thread in the web process (``ARCHIVE_WORKER =
+"thread"``, the default) and is woken after each delete; with ``"off"`` run
+``python archival.py`` from cron instead.  In multi-tenant mode a wake-up
+drains the tenants it came from and the periodic pass drains them all.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+import tenants
+
+BATCH_SIZE = 500
+
+# Dependent tables moved per archived entity, in order, with their filter column.
+DEPENDENTS = {
+    "employee": (
+        ("attendance", "employee_id"),
+        ("clock_events", "employee_id"),
+        ("payroll", "employee_id"),
+        ("project_employees", "employee_id"),
+    ),
+    "project": (
+        ("payroll", "project_id"),
+        ("project_employees", "project_id"),
+        ("reports", "project_id"),
+    ),
+}
+ENTITY_TABLES = {"employee": "employees", "project": "projects"}
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def archive(execute, entity, entity_id, requested_by=None):
+    """Soft-delete one employee/project and queue its history for archival.
+
+    Runs on the caller's transaction; returns ``False`` if the row does not
+    exist or is already archived.
+    """
+    table = ENTITY_TABLES[entity]
+    archived = execute(
+        text(f"""
+            UPDATE {table} SET archived_at = CURRENT_TIMESTAMP
+            WHERE id = :id AND archived_at IS NULL
+            RETURNING id
+        """),
+        {"id": entity_id}
+    ).scalar()
+    if archived is None:
+        return False
+    execute(
+        text("""
+            INSERT INTO archive_jobs (entity, entity_id, requested_by)
+            VALUES (:entity, :entity_id, :requested_by)
+        """),
+        {"entity": entity, "entity_id": entity_id, "requested_by": requested_by}
+    )
+    return True
+
+
+def _columns(conn, table):
+    """``table``'s columns, quoted and comma-separated, in table order."""
+    return conn.execute(
+        text("""
+            SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+            FROM pg_attribute
+            WHERE attrelid = to_regclass(:table) AND attnum > 0 AND NOT attisdropped
+        """),
+        {"table": table}
+    ).scalar()
+
+
+def move_batch(conn, table, column, value, batch_size=BATCH_SIZE):
+    """Move up to ``batch_size`` rows of ``table`` into ``<table>_archive``.
+
+    Rows locked by a concurrent writer are skipped and picked up by a later
+    batch rather than waited on.  Columns are matched by name, since a
+    column added to both tables later lands after ``archived_at`` in the
+    archive.
+    """
+    columns = _columns(conn, table)
+    return conn.execute(
+        text(f"""
+            WITH moved AS (
+                DELETE FROM {table}
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE {column} = :value
+                    ORDER BY id
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            )
+            INSERT INTO {table}_archive ({columns}) SELECT {columns} FROM moved
+        """),
+        {"value": value, "batch_size": batch_size}
+    ).rowcount
+
+
+def _remaining(conn, table, column, value):
+    return conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE {column} = :value)"),
+        {"value": value}
+    ).scalar()
+
+
+def run_job(engine, entity, entity_id, batch_size=BATCH_SIZE, pause=0.05):
+    """Drain every dependent table of one archived entity; returns rows moved."""
+    moved = 0
+    for table, column in DEPENDENTS[entity]:
+        while True:
+            with engine.begin() as conn:
+                # Closed pay periods are frozen, but their rows may still move.
+                conn.execute(text("SELECT set_config('app.archiving', 'on', true)"))
+                count = move_batch(conn, table, column, entity_id, batch_size)
+                more = count == batch_size or _remaining(conn, table, column, entity_id)
+            moved += count
+            if not more:
+                break
+            # Let the hot tables breathe between batches.
+            time.sleep(pause)
+    return moved
+
+
+def run_pending(engine, batch_size=BATCH_SIZE, pause=0.05):
+    """Process queued archive jobs until none are left; returns jobs finished.
+
+    A job is claimed with ``FOR UPDATE SKIP LOCKED`` on a connection held open
+    for its duration, so several workers (threads, processes or cron) can run
+    side by side and a crashed worker's job is simply picked up again.
+    """
+    finished = 0
+    while True:
+        with engine.connect() as claim:
+            with claim.begin():
+                job = claim.execute(
+                    text("""
+                        SELECT id, entity, entity_id FROM archive_jobs
+                        WHERE finished_at IS NULL
+                        ORDER BY id
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    """)
+                ).mappings().first()
+                if job is None:
+                    return finished
+                moved = run_job(engine, job["entity"], job["entity_id"], batch_size, pause)
+                claim.execute(
+                    text("""
+                        UPDATE archive_jobs
+                        SET finished_at = CURRENT_TIMESTAMP, moved_rows = :moved
+                        WHERE id = :id
+                    """),
+                    {"id": job["id"], "moved": moved}
+                )
+        finished += 1
+
+
+class ArchiveWorker(threading.Thread):
+    """Daemon thread that drains ``archive_jobs`` whenever it is woken."""
+
+    def __init__(self, app, db, interval=60):
+        super().__init__(name="archive-worker", daemon=True)
+        self.app = app
+        self.db = db
+        self.interval = interval
+        self.wake = threading.Event()
+        self.woken_for = tenants.Wakeups()
+
+    def run(self):
+        only = None
+        while True:
+            try:
+                with self.app.app_context():
+                    for _ in tenants.each_tenant(self.app, self.db.engine, only):
+                        run_pending(
+                            self.db.engine,
+                            batch_size=self.app.config.get("ARCHIVE_BATCH_SIZE", BATCH_SIZE),
+                            pause=self.app.config.get("ARCHIVE_BATCH_PAUSE", 0.05),
+                        )
+            except Exception as e:
+                self.app.logger.warning("Archive worker failed: %s", e)
+            woken = self.wake.wait(self.interval)
+            self.wake.clear()
+            only = self.woken_for.take() if woken else None
+
+
+def init_app(app, db):
+    app.config.setdefault("ARCHIVE_WORKER", "thread")
+    app.extensions["archival"] = db
+
+
+def kick(app):
+    """Wake this process's archive worker, starting it on first use.
+
+    Started lazily so a ``preload_app`` master never owns the thread; each
+    forked worker gets its own.
+    """
+    global _worker, _worker_pid
+    if app.config.get("ARCHIVE_WORKER") != "thread":
+        return
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid():
+            _worker = ArchiveWorker(app, app.extensions["archival"])
+            _worker_pid = os.getpid()
+            _worker.start()
+        _worker.woken_for.add(tenants.current())
+        _worker.wake.set()
+
+
+if __name__ == "__main__":
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    with app.app_context():
+        finished = sum(run_pending(db.engine) for _ in tenants.each_tenant(app, db.engine))
+        print(f"Archived {finished} job(s)")
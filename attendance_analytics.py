@@ -0,0 +1,149 @@
+"""Attendance trend matrices: department x period x status.
+
+Postgres does the heavy lifting with one ``GROUP BY department_id,
+date_trunc, status`` over the range, optionally narrowed to one unit of the
+department tree and its sub-units.  The sparse group counts are then scattered into a
+dense NumPy array so totals and rates are whole-array operations rather than
+Python loops.  Results are cached per range and attendance data version.
+"""
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+
+import departments as org
+from data_versions import version_token
+from lru import LRUCache
+
+# Mirrors the CHECK constraint on attendance.status in system_db.sql.
+ATTENDANCE_STATUSES = (
+    "Present",
+    "Absent",
+    "Leave",
+    "Late",
+    "Half Day",
+    "Sick Leave",
+    "Work From Home",
+)
+GRANULARITIES = ("day", "week", "month")
+
+# Values are (result, approximate size in bytes).
+_cache = LRUCache(max_entries=256, max_bytes=32 * 1024 * 1024, sizeof=lambda item: item[1])
+
+
+def bucket_starts(start, end, grain):
+    """Every period start between ``start`` and ``end`` as Postgres truncates them."""
+    if grain == "day":
+        first, step = start, None
+    elif grain == "week":
+        first, step = start - timedelta(days=start.weekday()), None
+    else:
+        first, step = start.replace(day=1), "month"
+
+    buckets = []
+    current = first
+    while current <= end:
+        buckets.append(current)
+        if step == "month":
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            current += timedelta(days=1 if grain == "day" else 7)
+    return buckets
+
+
+def _query_groups(execute, start, end, grain, department_id):
+    return execute(
+        text(f"""
+            SELECT e.department_id,
+                   date_trunc(:grain, a.date)::date AS bucket,
+                   a.status,
+                   COUNT(*) AS total
+            FROM attendance a
+            JOIN employees e ON e.id = a.employee_id
+            WHERE a.date BETWEEN :start AND :end
+              {org.subtree_filter('e.department_id', department_id)}
+            GROUP BY e.department_id, bucket, a.status
+        """),
+        {"grain": grain, "start": start, "end": end, "department_id": department_id}
+    ).fetchall()
+
+
+def attendance_matrix(execute, start, end, grain="week", department_id=None):
+    """Return the dense counts matrix and derived rates for a date range.
+
+    ``execute`` runs a read-only statement (``db.session.execute`` or the
+    replica router).  The result is JSON-ready::
+
+        {"departments": [...],  # full paths, e.g. "Operations / Site A"
+         "periods": [...], "statuses": [...],
+         "counts": [[[...]]],   # department x period x status
+         "totals": [[...]],     # department x period
+         "present_rate": [[...]]}
+    """
+    import numpy as np
+
+    token = version_token("attendance", "employees", "departments")
+    key = (start, end, grain, department_id, token)
+    if token is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached[0]
+
+    rows = _query_groups(execute, start, end, grain, department_id)
+    periods = bucket_starts(start, end, grain)
+    paths = org.paths(execute)
+    departments = sorted({row[0] for row in rows}, key=paths.get)
+
+    period_index = {p: i for i, p in enumerate(periods)}
+    department_index = {d: i for i, d in enumerate(departments)}
+    status_index = {s: i for i, s in enumerate(ATTENDANCE_STATUSES)}
+
+    counts = np.zeros((len(departments), len(periods), len(ATTENDANCE_STATUSES)), dtype=np.int64)
+    if rows:
+        d_idx = np.fromiter((department_index[r[0]] for r in rows), dtype=np.intp, count=len(rows))
+        p_idx = np.fromiter((period_index[r[1]] for r in rows), dtype=np.intp, count=len(rows))
+        s_idx = np.fromiter((status_index[r[2]] for r in rows), dtype=np.intp, count=len(rows))
+        values = np.fromiter((r[3] for r in rows), dtype=np.int64, count=len(rows))
+        # Group keys are unique, so a plain scatter is enough.
+        counts[d_idx, p_idx, s_idx] = values
+
+    totals = counts.sum(axis=2)
+    present = counts[:, :, status_index["Present"]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        present_rate = np.where(totals > 0, np.round(present * 100.0 / totals, 2), 0.0)
+
+    result = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "granularity": grain,
+        "departments": [paths[d] for d in departments],
+        "periods": [p.isoformat() for p in periods],
+        "statuses": list(ATTENDANCE_STATUSES),
+        "counts": counts.tolist(),
+        "totals": totals.tolist(),
+        "present_rate": present_rate.tolist(),
+    }
+    if token is not None:
+        # Python lists of ints/floats cost roughly 4x the packed arrays.
+        _cache.set(key, (result, 4 * (counts.nbytes + totals.nbytes + present_rate.nbytes)))
+    return result
+
+
+def parse_range(args, today=None):
+    """Read ``start``/``end``/``granularity``/``department_id`` from query args.
+
+    Defaults to the last 12 weeks.  Raises ``ValueError`` on bad input.
+    """
+    today = today or date.today()
+    end = date.fromisoformat(args["end"]) if args.get("end") else today
+    start = date.fromisoformat(args["start"]) if args.get("start") else end - timedelta(weeks=12)
+    grain = args.get("granularity", "week")
+    if grain not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if start > end:
+        raise ValueError("start must be on or before end")
+    max_days = current_app.config.get("ANALYTICS_MAX_RANGE_DAYS", 3 * 366)
+    if (end - start).days > max_days:
+        raise ValueError(f"range is limited to {max_days} days")
+    department_id = int(args["department_id"]) if args.get("department_id") else None
+    return start, end, grain, department_id
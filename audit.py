@@ -0,0 +1,87 @@
+"""Audit trail: who changed which row, with before/after images.
+
+Row images are captured by statement-level triggers in Postgres (see
+``audit_capture`` in system_db.sql), so a write costs no extra round trips
+per row and cascaded deletes are recorded as well.  The only thing the app
+contributes is the acting username, set as the transaction-local setting
+``app.user`` in the same round trip as the first statement of each write
+transaction.
+"""
+from flask import has_request_context, request, session
+from sqlalchemy import event, text
+
+AUDITED_TABLES = ("employees", "projects", "attendance", "payroll", "project_employees", "users")
+PAGE_SIZE = 50
+
+
+def _tag_transaction(db_session, transaction, connection):
+    if not has_request_context() or request.method in ("GET", "HEAD", "OPTIONS"):
+        return
+    username = session.get("username")
+    if username:
+        connection.info["audit_user"] = username
+
+
+def _prepend_actor(conn, cursor, statement, parameters, context, executemany):
+    """Send ``set_config('app.user', ...)`` in the same round trip as the
+    first statement of a tagged transaction.
+
+    A first statement that cannot carry it (an executemany, or positional
+    parameters) gets it as a round trip of its own instead.
+    """
+    if conn.dialect.name != "postgresql":
+        return statement, parameters
+    username = conn.info.pop("audit_user", None)
+    if username is None:
+        return statement, parameters
+    if executemany or conn.dialect.paramstyle != "pyformat" or not isinstance(parameters, dict):
+        cursor.execute("SELECT set_config('app.user', %(audit_user__)s, true)", {"audit_user__": username})
+        return statement, parameters
+    parameters = dict(parameters, audit_user__=username)
+    return "SELECT set_config('app.user', %(audit_user__)s, true); " + statement, parameters
+
+
+def init_app(app, db):
+    """Tag every write transaction of ``db.session`` with the current user."""
+    event.listen(db.session, "after_begin", _tag_transaction)
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _prepend_actor, retval=True)
+
+
+def query_audit(execute, table_name=None, row_id=None, changed_by=None, page=1):
+    """One page of audit entries, newest first, filtered by entity and/or user."""
+    filters = []
+    params = {"limit": PAGE_SIZE + 1, "offset": (max(page, 1) - 1) * PAGE_SIZE}
+    if table_name:
+        filters.append("table_name = :table_name")
+        params["table_name"] = table_name
+    if row_id is not None:
+        filters.append("row_id = :row_id")
+        params["row_id"] = row_id
+    if changed_by:
+        filters.append("changed_by = :changed_by")
+        params["changed_by"] = changed_by
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+    rows = execute(
+        text(f"""
+            SELECT id, changed_at, table_name, row_id, action, changed_by, old_row, new_row
+            FROM audit_log
+            {where}
+            ORDER BY changed_at DESC, id DESC
+            LIMIT :limit OFFSET :offset
+        """),
+        params
+    ).mappings().all()
+
+    entries = []
+    for row in rows[:PAGE_SIZE]:
+        entry = dict(row)
+        old, new = entry["old_row"] or {}, entry["new_row"] or {}
+        entry["changes"] = [
+            (key, old.get(key), new.get(key))
+            for key in sorted(set(old) | set(new))
+            if old.get(key) != new.get(key)
+        ]
+        entries.append(entry)
+    return entries, len(rows) > PAGE_SIZE
@@ -0,0 +1,47 @@
+"""Measure how long a fresh interpreter takes to import the WSGI app.
+
+Each run starts a new Python process so nothing is cached in memory, imports
+``wsgi`` and reports the wall time.  Exits non-zero when the median exceeds
+the budget, so it can gate CI or a deploy:
+
+    python coldstart.py --runs 10 --budget-ms 1000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = (
+    "import time; t = time.perf_counter(); import wsgi; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("COLD_START_BUDGET_MS", 1000)))
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Importing the app must not connect, so any well-formed URL will do.
+    env.setdefault("DATABASE_URL", "postgresql+psycopg2://localhost/coldstart")
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=here, env=env, capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+
+    median = statistics.median(samples)
+    print(f"import wsgi: median {median:.1f} ms, min {min(samples):.1f} ms, "
+          f"max {max(samples):.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    sys.exit(0 if median <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
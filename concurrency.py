@@ -0,0 +1,95 @@
+"""Optimistic concurrency for edits: version checks and three-way merges.
+
+``payroll`` and ``attendance`` rows carry a ``version`` that every update
+bumps.  Edit forms post back the version they were loaded at and the UPDATE
+only matches that version, so a concurrent change is detected without
+``SELECT ... FOR UPDATE``.  On a mismatch the row as the editor first saw it
+is recovered from ``audit_log``, which sorts every field into "only you
+changed it", "only they changed it" or a real conflict for the merge view.
+"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import text
+
+# (field, kind) pairs of the payroll edit form, in display order.
+PAYROLL_EDIT_FIELDS = (
+    ("employee_id", "int"),
+    ("project_id", "int"),
+    ("pay_period_start", "date"),
+    ("pay_period_end", "date"),
+    ("basic_salary", "money"),
+    ("overtime", "money"),
+    ("deductions", "money"),
+    ("status", "text"),
+)
+
+
+def normalize(kind, value):
+    """Form, database and JSON values of one field as comparable strings."""
+    if value is None or value == "":
+        return ""
+    if kind == "money":
+        try:
+            return f"{Decimal(str(value)):.2f}"
+        except InvalidOperation:
+            return str(value)
+    if kind == "date" and isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def load_base(execute, table_name, row_id, version):
+    """The row as it was at ``version``, from the audit log; ``None`` if unknown."""
+    return execute(
+        text("""
+            SELECT new_row FROM audit_log
+            WHERE table_name = :table_name AND row_id = :row_id
+              AND (new_row ->> 'version')::int = :version
+            ORDER BY changed_at DESC
+            LIMIT 1
+        """),
+        {"table_name": table_name, "row_id": row_id, "version": version}
+    ).scalar()
+
+
+def last_change(execute, table_name, row_id):
+    """``(changed_by, changed_at)`` of the latest audited change, if any."""
+    row = execute(
+        text("""
+            SELECT changed_by, changed_at FROM audit_log
+            WHERE table_name = :table_name AND row_id = :row_id
+            ORDER BY changed_at DESC
+            LIMIT 1
+        """),
+        {"table_name": table_name, "row_id": row_id}
+    ).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def merge(fields, base, mine, theirs):
+    """Three-way merge of one row.
+
+    ``base`` may be ``None`` when the original is unknown, in which case
+    every field that differs is a conflict.  Returns one dict per field with
+    the normalized ``base``/``mine``/``theirs`` values, the proposed
+    ``value`` and whether it is a ``conflict`` the user has to resolve.
+    """
+    merged = []
+    for name, kind in fields:
+        m = normalize(kind, mine.get(name))
+        t = normalize(kind, theirs.get(name))
+        b = normalize(kind, base.get(name)) if base is not None else None
+        if m == t:
+            value, conflict = m, False
+        elif b is not None and m == b:
+            value, conflict = t, False
+        elif b is not None and t == b:
+            value, conflict = m, False
+        else:
+            value, conflict = m, True
+        merged.append({
+            "name": name, "base": b, "mine": m, "theirs": t,
+            "value": value, "conflict": conflict, "changed": m != t,
+        })
+    return merged
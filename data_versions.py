@@ -0,0 +1,80 @@
+"""Per-table data versions used to key HTTP and template caches.
+
+Every tracked table has a row in ``data_versions`` that a statement-level
+trigger bumps on INSERT/UPDATE/DELETE (see system_db.sql).  Because the
+counters live in Postgres they are shared by every gunicorn worker, and the
+whole vector is read with one small query per request.  In multi-tenant
+mode each tenant's schema has its own ``data_versions``, and tokens carry the
+tenant so cache entries of different tenants never collide.
+"""
+from flask import current_app, g, has_request_context
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+import tenants
+
+
+def _load_versions(session):
+    # Read versions from the same place report content comes from, so a
+    # lagging replica can never hand out old rows under a newer version.
+    router = current_app.extensions.get("replica_router")
+    execute = router.execute if router is not None else session.execute
+    try:
+        rows = execute(
+            text("SELECT table_name, version, updated_at FROM data_versions")
+        ).fetchall()
+    except SQLAlchemyError:
+        # Schema predates data_versions: behave as if nothing is cacheable.
+        # A replica read has already been rolled back on its own connection.
+        if router is None or router.read_engine() is router.primary:
+            session.rollback()
+        return None
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def _vector():
+    # The full vector is fetched at most once per request and memoized on g.
+    if has_request_context() and "_data_versions" in g:
+        return g._data_versions
+    session = current_app.extensions["sqlalchemy"].session
+    versions = _load_versions(session)
+    if has_request_context():
+        g._data_versions = versions
+    return versions
+
+
+def get_versions(*tables):
+    """Return ``{table: (version, updated_at)}`` for the given tables.
+
+    Returns ``None`` when versions are unavailable.
+    """
+    versions = _vector()
+    if versions is None:
+        return None
+    return {t: versions.get(t, (0, None)) for t in tables}
+
+
+def versioned_tables():
+    """Names of the tables that have a data version, or ``None`` when unavailable."""
+    versions = _vector()
+    return None if versions is None else frozenset(versions)
+
+
+def version_token(*tables):
+    """Compact string form of the version vector, e.g. ``employees:4,payroll:17``
+    (``acme/employees:4,payroll:17`` for tenant ``acme``)."""
+    versions = get_versions(*tables)
+    if versions is None:
+        return None
+    token = ",".join(f"{t}:{versions[t][0]}" for t in sorted(versions))
+    tenant = tenants.current()
+    return f"{tenant}/{token}" if tenant else token
+
+
+def last_modified(*tables):
+    """Most recent change time across the given tables, or ``None``."""
+    versions = get_versions(*tables)
+    if not versions:
+        return None
+    stamps = [v[1] for v in versions.values() if v[1] is not None]
+    return max(stamps) if stamps else None
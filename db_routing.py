@@ -0,0 +1,171 @@
+"""Read/write routing between the primary database and an optional replica.
+
+Read-only report queries go through ``ReplicaRouter.execute`` /
+``ReplicaRouter.connect``.  They are sent to the replica bound as
+``SQLALCHEMY_BINDS["replica"]`` unless one of these applies, in which case
+the primary is used:
+
+* no replica is configured;
+* the replica is lagging more than ``REPLICA_MAX_LAG_SECONDS``;
+* the replica failed recently (it is retried after ``REPLICA_RETRY_SECONDS``);
+* the current user wrote something within the lag bound (read-after-write).
+
+Writes always use ``db.session`` as before, which is bound to the primary.
+Replica reads run on a connection of their own, kept for the rest of the
+request, so a failing replica can never roll back the request's writes.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, has_request_context, request, session
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+REPLICA_BIND = "replica"
+
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaRouter:
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._lag = 0.0
+        self._lag_checked_at = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("REPLICA_MAX_LAG_SECONDS", 5.0)
+        app.config.setdefault("REPLICA_LAG_CHECK_SECONDS", 2.0)
+        app.config.setdefault("REPLICA_RETRY_SECONDS", 30.0)
+        self.max_lag = float(app.config["REPLICA_MAX_LAG_SECONDS"])
+        self.lag_check_interval = float(app.config["REPLICA_LAG_CHECK_SECONDS"])
+        self.retry_after = float(app.config["REPLICA_RETRY_SECONDS"])
+        app.extensions["replica_router"] = self
+        app.after_request(self._remember_write)
+        app.teardown_appcontext(self._close_replica_connection)
+
+    # -------------------------
+    # Engine selection
+    # -------------------------
+    @property
+    def primary(self):
+        return self.db.engine
+
+    @property
+    def replica(self):
+        return self.db.engines.get(REPLICA_BIND)
+
+    def _remember_write(self, response):
+        """Pin this user's reads to the primary for a while after a write."""
+        if request.method != "GET" and response.status_code < 400 and self.replica is not None:
+            session["_read_primary_until"] = time.time() + self.max_lag
+        return response
+
+    def _mark_down(self):
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_after
+
+    def _replica_is_fresh(self, replica):
+        now = time.monotonic()
+        if now - self._lag_checked_at < self.lag_check_interval:
+            return self._lag <= self.max_lag
+
+        with self._lock:
+            if now - self._lag_checked_at >= self.lag_check_interval:
+                try:
+                    with replica.connect() as conn:
+                        self._lag = float(conn.execute(LAG_SQL).scalar() or 0)
+                except OperationalError:
+                    self._down_until = now + self.retry_after
+                    return False
+                self._lag_checked_at = now
+        return self._lag <= self.max_lag
+
+    def read_engine(self):
+        """Engine for read-only queries in this request (decided once)."""
+        if has_request_context() and "_read_engine" in g:
+            return g._read_engine
+
+        engine = self.primary
+        replica = self.replica
+        if (
+            replica is not None
+            and time.monotonic() >= self._down_until
+            and not (has_request_context() and session.get("_read_primary_until", 0) > time.time())
+            and self._replica_is_fresh(replica)
+        ):
+            engine = replica
+
+        if has_request_context():
+            g._read_engine = engine
+        return engine
+
+    def _fall_back(self):
+        self._mark_down()
+        if has_request_context():
+            g._read_engine = self.primary
+
+    # -------------------------
+    # Query helpers
+    # -------------------------
+    def _replica_connection(self, replica):
+        # One per app context, closed on teardown; results stay readable
+        # until then, as they do with db.session.
+        conn = g.get("_replica_connection")
+        if conn is None:
+            conn = g._replica_connection = replica.connect()
+        return conn
+
+    def _close_replica_connection(self, exc=None):
+        conn = g.pop("_replica_connection", None) if has_app_context() else None
+        if conn is not None:
+            conn.close()
+
+    def execute(self, statement, params=None):
+        """Run a read-only statement on the read engine.
+
+        The primary is read through ``db.session``, so the request sees its
+        own uncommitted writes; the replica through its own connection.
+        """
+        engine = self.read_engine()
+        if engine is self.primary:
+            return self.db.session.execute(statement, params or {}, bind_arguments={"bind": engine})
+        try:
+            conn = self._replica_connection(engine)
+        except OperationalError:
+            self._fall_back()
+            return self.db.session.execute(statement, params or {}, bind_arguments={"bind": self.primary})
+        try:
+            return conn.execute(statement, params or {})
+        except OperationalError:
+            self._close_replica_connection()
+            self._fall_back()
+            return self.db.session.execute(statement, params or {}, bind_arguments={"bind": self.primary})
+        except SQLAlchemyError:
+            # Leave the connection usable for the request's other reads.
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def connect(self):
+        """Connection on the read engine, falling back if the replica is down."""
+        engine = self.read_engine()
+        try:
+            conn = engine.connect()
+        except OperationalError:
+            if engine is self.primary:
+                raise
+            self._fall_back()
+            conn = self.primary.connect()
+        with conn:
+            yield conn
@@ -0,0 +1,197 @@
+"""Department (org-unit) tree with subtree aggregation.
+
+Units live in ``departments`` (``parent_id``) and the closure table
+``department_tree`` holds every ancestor/descendant pair, maintained by
+triggers in system_db.sql when a unit is added or moved.  "Under a unit,
+including its sub-units" is therefore never a recursive walk: it is
+``column IN (SELECT descendant_id FROM department_tree WHERE ancestor_id = :id)``,
+an index-only scan of the closure table's primary key (``in_subtree``).
+Rollups join the closure table once and group by ``ancestor_id``, which
+totals every unit over its whole subtree in one pass.
+"""
+from sqlalchemy import text
+
+from rows import LazyRecords, fetch_records
+
+TREE_SQL = """
+    SELECT d.id, d.name, d.parent_id, p.depth, p.path, p.names
+    FROM departments d
+    CROSS JOIN LATERAL (
+        SELECT MAX(t.depth) AS depth,
+               string_agg(a.name, ' / ' ORDER BY t.depth DESC) AS path,
+               array_agg(a.name ORDER BY t.depth DESC) AS names
+        FROM department_tree t
+        JOIN departments a ON a.id = t.ancestor_id
+        WHERE t.descendant_id = d.id
+    ) p
+    ORDER BY p.names
+"""
+
+
+class DepartmentError(ValueError):
+    """A department change that would break the tree or orphan its members."""
+
+
+def in_subtree(column, param="department_id"):
+    """SQL condition: ``column`` is the unit ``:param`` or one of its sub-units."""
+    return f"{column} IN (SELECT descendant_id FROM department_tree WHERE ancestor_id = :{param})"
+
+
+def subtree_filter(column, department_id, param="department_id"):
+    """``AND in_subtree(...)`` when a unit is given, else an empty string."""
+    return f"AND {in_subtree(column, param)}" if department_id else ""
+
+
+def tree(execute):
+    """Every unit in tree order with its ``depth`` and full ``path``; lazy."""
+    return LazyRecords(execute, text(TREE_SQL))
+
+
+def paths(execute):
+    """``{id: 'Operations / Site A'}`` for every unit."""
+    return {row.id: row.path for row in execute(text(TREE_SQL))}
+
+
+def get(execute, department_id):
+    return execute(
+        text(TREE_SQL.replace("ORDER BY p.names", "WHERE d.id = :id")),
+        {"id": department_id}
+    ).first()
+
+
+def rollup(execute):
+    """Per unit, totals over its whole subtree: active employees, active
+    projects and net pay of its employees' payroll."""
+    return fetch_records(execute(
+        text(f"""
+            WITH staff AS (
+                SELECT t.ancestor_id AS id, COUNT(*) AS employees
+                FROM employees e
+                JOIN department_tree t ON t.descendant_id = e.department_id
+                WHERE e.archived_at IS NULL
+                GROUP BY t.ancestor_id
+            ), work AS (
+                SELECT t.ancestor_id AS id, COUNT(*) AS projects
+                FROM projects p
+                JOIN department_tree t ON t.descendant_id = p.department_id
+                WHERE p.archived_at IS NULL
+                GROUP BY t.ancestor_id
+            ), pay AS (
+                SELECT t.ancestor_id AS id, SUM(p.net_pay) AS net_pay
+                FROM payroll p
+                JOIN employees e ON e.id = p.employee_id
+                JOIN department_tree t ON t.descendant_id = e.department_id
+                GROUP BY t.ancestor_id
+            )
+            SELECT tree.*,
+                   COALESCE(staff.employees, 0) AS employees,
+                   COALESCE(work.projects, 0) AS projects,
+                   COALESCE(pay.net_pay, 0) AS net_pay
+            FROM ({TREE_SQL}) tree
+            LEFT JOIN staff ON staff.id = tree.id
+            LEFT JOIN work ON work.id = tree.id
+            LEFT JOIN pay ON pay.id = tree.id
+            ORDER BY tree.names
+        """)
+    ))
+
+
+def create(execute, name, parent_id=None):
+    if not name:
+        raise DepartmentError("Give the department a name.")
+    created = execute(
+        text("""
+            INSERT INTO departments (name, parent_id) VALUES (:name, :parent_id)
+            ON CONFLICT ((COALESCE(parent_id, 0)), name) DO NOTHING
+            RETURNING id
+        """),
+        {"name": name, "parent_id": parent_id}
+    ).scalar()
+    if created is None:
+        raise DepartmentError("A department with that name already exists there.")
+    return created
+
+
+def update(execute, department_id, name, parent_id=None):
+    """Rename a unit and/or move it, with its whole subtree, under ``parent_id``."""
+    if not name:
+        raise DepartmentError("Give the department a name.")
+    if parent_id is not None and execute(
+        text("SELECT 1 FROM department_tree WHERE ancestor_id = :id AND descendant_id = :parent_id"),
+        {"id": department_id, "parent_id": parent_id}
+    ).first():
+        raise DepartmentError("A department cannot move under itself or one of its sub-units.")
+    if execute(
+        text("""
+            SELECT 1 FROM departments
+            WHERE COALESCE(parent_id, 0) = COALESCE(CAST(:parent_id AS INT), 0) AND name = :name AND id <> :id
+        """),
+        {"id": department_id, "name": name, "parent_id": parent_id}
+    ).first():
+        raise DepartmentError("A department with that name already exists there.")
+    updated = execute(
+        text("UPDATE departments SET name = :name, parent_id = :parent_id WHERE id = :id RETURNING id"),
+        {"id": department_id, "name": name, "parent_id": parent_id}
+    ).scalar()
+    if updated is None:
+        raise DepartmentError("Department not found.")
+
+
+def delete(execute, department_id):
+    """Remove a unit that has no sub-units, employees or projects (archived ones included)."""
+    in_use = execute(
+        text("""
+            SELECT EXISTS (SELECT 1 FROM departments WHERE parent_id = :id)
+                OR EXISTS (SELECT 1 FROM employees WHERE department_id = :id)
+                OR EXISTS (SELECT 1 FROM projects WHERE department_id = :id)
+        """),
+        {"id": department_id}
+    ).scalar()
+    if in_use:
+        raise DepartmentError("Move this department's sub-units, employees and projects elsewhere first.")
+    execute(text("DELETE FROM departments WHERE id = :id"), {"id": department_id})
+
+
+def migrate_free_text(execute):
+    """Move a database from free-text ``department`` columns onto the tree.
+
+    For databases created before the department tree: run the departments
+    section of system_db.sql first.  Every distinct department name becomes
+    a top-level unit (blank ones go to "Unassigned"), employees and projects
+    get its ``department_id`` and the text columns are dropped.  Arrange the
+    units into a hierarchy afterwards on the Departments page.
+    """
+    name = "COALESCE(NULLIF(btrim(department), ''), 'Unassigned')"
+    for table in ("employees", "projects"):
+        execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS department_id INT REFERENCES departments(id)"))
+    execute(text(f"""
+        INSERT INTO departments (name)
+        SELECT {name} FROM employees UNION SELECT {name} FROM projects
+        ON CONFLICT DO NOTHING
+    """))
+    for table in ("employees", "projects"):
+        execute(text(f"""
+            UPDATE {table} t SET department_id = d.id
+            FROM departments d
+            WHERE d.parent_id IS NULL AND d.name = {name.replace('department', 't.department')}
+        """))
+        execute(text(f"ALTER TABLE {table} ALTER COLUMN department_id SET NOT NULL, DROP COLUMN department"))
+        execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_department ON {table} (department_id)"))
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    import tenants
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python departments.py migrate")
+    with app.app_context(), tenants.using(os.getenv("TENANT")):
+        migrate_free_text(db.session.execute)
+        db.session.commit()
+        print("Departments migrated")
@@ -0,0 +1,11 @@
+"""Extension objects shared by the application factory and the views.
+
+They are created unbound so that importing a view never builds an app;
+``app.create_app`` binds them.
+"""
+from flask_sqlalchemy import SQLAlchemy
+
+from db_routing import ReplicaRouter
+
+db = SQLAlchemy()
+replica = ReplicaRouter(db)
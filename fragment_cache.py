@@ -0,0 +1,45 @@
+"""Server-side cache for expensive template fragments.
+
+Templates wrap a block in ``{% call cached_fragment(name, *tables) %}``.  The
+rendered HTML is keyed on the fragment name, the data version of ``tables``
+and, when asked, the user's role and extra ``vary`` values.  Fragments that
+are keyed only by name and tables (e.g. the employee dropdown) are shared by
+every page that renders them.
+"""
+from flask import current_app, session
+from markupsafe import Markup
+
+from data_versions import version_token
+from lru import LRUCache
+
+
+def _utf8_len(html):
+    return len(html.encode("utf-8"))
+
+
+def cached_fragment(name, *tables, vary=None, by_role=False, caller=None):
+    """Render ``caller()`` once per data version and serve it from the LRU."""
+    cache = current_app.extensions.get("fragment_cache")
+    token = version_token(*tables) if cache is not None else None
+    if token is None:
+        return caller()
+
+    role = (session.get("role") or "EMPLOYEE").upper() if by_role else None
+    key = (name, token, role, vary)
+    html = cache.get(key)
+    if html is None:
+        html = str(caller())
+        cache.set(key, html)
+    return Markup(html)
+
+
+def init_app(app):
+    """Create the per-process fragment cache and expose it to templates."""
+    app.config.setdefault("FRAGMENT_CACHE_MAX_ENTRIES", 512)
+    app.config.setdefault("FRAGMENT_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    app.extensions["fragment_cache"] = LRUCache(
+        max_entries=app.config["FRAGMENT_CACHE_MAX_ENTRIES"],
+        max_bytes=app.config["FRAGMENT_CACHE_MAX_BYTES"],
+        sizeof=_utf8_len,
+    )
+    app.jinja_env.globals["cached_fragment"] = cached_fragment
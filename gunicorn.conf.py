@@ -0,0 +1,40 @@
+"""Gunicorn settings (loaded automatically from the working directory).
+
+Two serving modes are supported:
+
+* ``GUNICORN_WORKER_CLASS=sync`` (default): one request per worker process.
+* ``GUNICORN_WORKER_CLASS=gevent``: each worker multiplexes many requests on
+  green threads; psycopg2 is made cooperative with psycogreen so a request
+  waiting on Postgres yields to the others instead of blocking the worker.
+
+See the "Serving" section of README.md for the sizing formula.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+
+_cores = multiprocessing.cpu_count()
+if worker_class == "gevent":
+    workers = int(os.getenv("WEB_CONCURRENCY", _cores))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+else:
+    workers = int(os.getenv("WEB_CONCURRENCY", 2 * _cores + 1))
+
+# Build the app once in the master so workers fork ready to serve. Engines
+# connect lazily and create_app() resets pools after fork, so no connection
+# is shared. gevent must patch before the app is imported, so it is off there.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1" if worker_class == "sync" else "0") == "1"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+        server.log.info("Worker %s: psycopg2 patched for gevent", worker.pid)
@@ -0,0 +1,157 @@
+"""HTTP caching: conditional GET, fingerprinted static URLs and compression."""
+import gzip
+import hashlib
+import importlib.util
+import os
+from datetime import date
+from functools import wraps
+
+from flask import Response, current_app, request, session
+
+from data_versions import last_modified, version_token
+
+# brotli is optional and only imported on the first compressed response.
+_HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+
+
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+COMPRESSIBLE_TYPES = (
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "application/json",
+    "application/javascript",
+)
+MIN_COMPRESS_SIZE = 500
+
+_static_digests = {}
+
+
+def conditional_get(*tables):
+    """Answer repeat GETs with 304 while ``tables`` are unchanged.
+
+    The ETag covers the data version of ``tables``, the full request path,
+    the logged-in user/role (pages render the sidebar per role) and today's
+    date (dashboards use CURRENT_DATE).  Pending flash messages bypass the
+    cache so they are never swallowed by a 304.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or session.get("_flashes"):
+                return view_func(*args, **kwargs)
+
+            token = version_token(*tables)
+            if token is None:
+                return view_func(*args, **kwargs)
+
+            seed = "|".join([
+                token,
+                request.full_path,
+                session.get("username") or "",
+                session.get("role") or "",
+                date.today().isoformat(),
+            ])
+            etag = hashlib.sha1(seed.encode("utf-8")).hexdigest()
+            modified = last_modified(*tables)
+
+            probe = Response()
+            _set_validators(probe, etag, modified)
+            probe.make_conditional(request)
+            if probe.status_code == 304:
+                return probe
+
+            response = current_app.make_response(view_func(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag, modified)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _set_validators(response, etag, modified):
+    response.set_etag(etag, weak=True)
+    if modified is not None:
+        response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+
+
+def _static_fingerprint(endpoint, values):
+    """Append ``?v=<content hash>`` to every ``url_for('static', ...)``."""
+    if endpoint != "static" or "filename" not in values or "v" in values:
+        return
+
+    filename = values["filename"]
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return
+
+    cached = _static_digests.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            digest = hashlib.md5(f.read()).hexdigest()[:12]
+        cached = (mtime, digest)
+        _static_digests[filename] = cached
+    values["v"] = cached[1]
+
+
+def _negotiate_encoding():
+    accepted = request.accept_encodings
+    if _HAS_BROTLI and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _after_request(response):
+    if request.endpoint == "static" and request.args.get("v"):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+
+    if not current_app.config.get("COMPRESS_RESPONSES"):
+        return response
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    encoding = _negotiate_encoding()
+    if encoding == "br":
+        import brotli
+
+        data = brotli.compress(data, quality=5)
+    elif encoding == "gzip":
+        data = gzip.compress(data, compresslevel=6)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_app(app):
+    """Register static fingerprinting and response post-processing."""
+    app.config.setdefault("COMPRESS_RESPONSES", False)
+    app.url_defaults(_static_fingerprint)
+    app.after_request(_after_request)
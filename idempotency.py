@@ -0,0 +1,217 @@
+"""Idempotency keys for retry-safe write endpoints.
+
+Forms carry a hidden ``idempotency_key`` (see the ``idempotency_field()``
+Jinja global) and API clients may send an ``Idempotency-Key`` header.  The
+stored key is a hash of that value, the user, the endpoint and the submitted
+fields, so resubmitting a stale form with different values is a new request
+while a double-click or a client retry is replayed.
+
+The key is claimed with ``INSERT ... ON CONFLICT`` on the view's
+own transaction: it commits together with the write or not at all, and a
+concurrent duplicate waits on the unique index instead of writing twice.
+The response (redirect target, flash messages or body) is stored afterwards
+and replayed for retries until ``IDEMPOTENCY_TTL_SECONDS`` passes.
+
+A per-process Bloom filter of recently completed keys answers "definitely
+new" without a lookup; a "maybe seen" answer is always confirmed against the
+table, so correctness never depends on it.
+"""
+import hashlib
+import json
+import math
+import random
+import secrets
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, flash, make_response, request, session
+from markupsafe import Markup
+from sqlalchemy import text
+
+FIELD_NAME = "idempotency_key"
+HEADER_NAME = "Idempotency-Key"
+IN_FLIGHT_POLLS = 20
+IN_FLIGHT_POLL_SECONDS = 0.1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing."""
+
+    def __init__(self, capacity=100_000, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        with self._lock:
+            if self.count >= self.capacity:
+                # Saturated: start over rather than let false positives climb.
+                self._bits = bytearray(len(self._bits))
+                self.count = 0
+            for pos in self._positions(item):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class IdempotencyStore:
+
+    SWEEP_PROBABILITY = 0.01
+
+    def __init__(self, db, ttl, bloom_capacity=100_000):
+        self.db = db
+        self.ttl = ttl
+        self.seen = BloomFilter(bloom_capacity)
+
+    def claim(self, key):
+        """Reserve ``key`` on the current ``db.session`` transaction.
+
+        Returns ``False`` if another request already holds it; an expired
+        key is taken over.
+        """
+        return self.db.session.execute(
+            text("""
+                INSERT INTO idempotency_keys (key, expires_at)
+                VALUES (:key, timezone('UTC', now()) + make_interval(secs => :ttl))
+                ON CONFLICT (key) DO UPDATE
+                    SET expires_at = EXCLUDED.expires_at, status_code = NULL, location = NULL,
+                        content_type = NULL, body = NULL, flashes = NULL
+                    WHERE idempotency_keys.expires_at <= timezone('UTC', now())
+                RETURNING key
+            """),
+            {"key": key, "ttl": self.ttl}
+        ).scalar() is not None
+
+    def lookup(self, key):
+        """The stored response for ``key``; ``None`` if unknown or expired,
+        ``False`` if claimed but not yet recorded (still in flight)."""
+        row = self.db.session.execute(
+            text("""
+                SELECT status_code, location, content_type, body, flashes
+                FROM idempotency_keys
+                WHERE key = :key AND expires_at > timezone('UTC', now())
+            """),
+            {"key": key}
+        ).mappings().first()
+        if row is None:
+            return None
+        if row["status_code"] is None:
+            return False
+        self.seen.add(key)
+        return row
+
+    def record(self, key, response, flashes):
+        self.db.session.execute(
+            text("""
+                INSERT INTO idempotency_keys (key, status_code, location, content_type, body, flashes, expires_at)
+                VALUES (:key, :status_code, :location, :content_type, :body, :flashes,
+                        timezone('UTC', now()) + make_interval(secs => :ttl))
+                ON CONFLICT (key) DO UPDATE
+                    SET status_code = EXCLUDED.status_code,
+                        location = EXCLUDED.location,
+                        content_type = EXCLUDED.content_type,
+                        body = EXCLUDED.body,
+                        flashes = EXCLUDED.flashes
+            """),
+            {
+                "key": key,
+                "status_code": response.status_code,
+                "location": response.headers.get("Location"),
+                "content_type": response.content_type,
+                "body": None if response.is_streamed or response.location else response.get_data(),
+                "flashes": json.dumps(flashes) if flashes else None,
+                "ttl": self.ttl,
+            }
+        )
+        if random.random() < self.SWEEP_PROBABILITY:
+            self.db.session.execute(
+                text("DELETE FROM idempotency_keys WHERE expires_at <= timezone('UTC', now())")
+            )
+        self.db.session.commit()
+        self.seen.add(key)
+
+
+def _replay(row):
+    for category, message in json.loads(row["flashes"] or "[]"):
+        flash(message, category)
+    response = make_response(bytes(row["body"] or b""), row["status_code"])
+    if row["location"]:
+        response.headers["Location"] = row["location"]
+    if row["content_type"]:
+        response.content_type = row["content_type"]
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def request_key():
+    """Scoped key for the current request, or ``None`` if the client sent none."""
+    client_key = request.headers.get(HEADER_NAME) or request.form.get(FIELD_NAME)
+    if not client_key:
+        return None
+    fields = sorted((k, v) for k, v in request.form.items(multi=True) if k != FIELD_NAME)
+    payload = json.dumps(
+        [client_key, session.get("username"), request.endpoint, request.view_args, fields,
+         request.get_data(as_text=True) if request.is_json else None],
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def idempotent(view_func):
+    """Replay the stored response when a request with the same key repeats."""
+
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        store = current_app.extensions.get("idempotency")
+        key = request_key() if store is not None else None
+        if key is None:
+            return view_func(*args, **kwargs)
+
+        if key in store.seen:
+            stored = store.lookup(key)
+            if stored:
+                return _replay(stored)
+
+        if not store.claim(key):
+            # A twin holds the key; give it a moment to record its response.
+            # Roll back first: the failed upsert still row-locks the key.
+            store.db.session.rollback()
+            for _ in range(IN_FLIGHT_POLLS):
+                stored = store.lookup(key)
+                if stored:
+                    return _replay(stored)
+                time.sleep(IN_FLIGHT_POLL_SECONDS)
+            store.db.session.rollback()
+            return make_response("This request is already being processed.", 409)
+
+        flashes_before = len(session.get("_flashes", []))
+        response = make_response(view_func(*args, **kwargs))
+        if response.status_code < 500:
+            store.record(key, response, session.get("_flashes", [])[flashes_before:])
+        return response
+
+    return wrapper
+
+
+def idempotency_field():
+    """Hidden form input carrying a fresh idempotency key."""
+    return Markup(f'<input type="hidden" name="{FIELD_NAME}" value="{secrets.token_urlsafe(16)}">')
+
+
+def init_app(app, db):
+    ttl = int(app.config.setdefault("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+    app.extensions["idempotency"] = IdempotencyStore(db, ttl)
+    app.jinja_env.globals["idempotency_field"] = idempotency_field
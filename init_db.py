@@ -18,12 +18,9 @@ def init_db():
 
     # Minimal cursor usage
     with conn.cursor() as cur:
-        # Split statements by semicolon in case of multiple CREATE/INSERT
-        statements = sql.split(';')
-        for stmt in statements:
-            stmt = stmt.strip()
-            if stmt:
-                cur.execute(stmt)
+        # Run the script in one go: Postgres handles multiple statements,
+        # and splitting on ';' would break $$-quoted trigger functions.
+        cur.execute(sql)
 
     conn.close()
     print("Database initialized successfully!")
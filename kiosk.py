@@ -0,0 +1,152 @@
+"""Offline attendance kiosk: entries queued on the device, synced in batches.
+
+The kiosk page (templates/kiosk.html) keeps every entry in the browser's
+IndexedDB and a service worker (static/js/kiosk-sw.js) keeps the page
+itself, so a supervisor can go on recording with the connection down.  The
+page posts the queue to ``/kiosk/sync`` once it holds ``KIOSK_SYNC_BATCH``
+entries or its oldest entry is ``KIOSK_SYNC_SECONDS`` old, gzipped, and
+forgets entries only once the server has answered.
+
+A batch is applied by one statement that unnests column arrays into
+``attendance``.  Each entry carries the moment it was recorded on the
+device, and each attendance row remembers when and whether by a supervisor
+it was last written.  An entry for an (employee, date) that already has a
+row replaces it only if it wins under ``KIOSK_CONFLICT_RULE``:
+
+* ``supervisor`` (default) - an entry by a supervisor beats one by anybody
+  else; between two of the same kind the later one wins.
+* ``last-writer`` - the later one wins.
+
+Device clocks are trusted up to the server's own: a time in the future
+counts as now.  Replaying a batch changes nothing, because no entry beats
+itself, so a sync whose answer was lost can simply be sent again.
+"""
+import json
+import zlib
+from datetime import date
+
+from sqlalchemy import text
+
+from timesheets import parse_time
+
+MAX_BATCH = 5000
+MAX_BODY = 2 * 1024 * 1024
+STATUSES = ("Present", "Absent", "Leave", "Late", "Half Day", "Sick Leave", "Work From Home")
+SUPERVISOR_ROLES = ("ADMIN", "MANAGER", "ASSISTANT MANAGER")
+
+# When an incoming entry replaces the stored row.
+RULES = {
+    "supervisor": "(EXCLUDED.recorded_by_supervisor, EXCLUDED.recorded_at)"
+                  " > (attendance.recorded_by_supervisor, attendance.recorded_at)",
+    "last-writer": "EXCLUDED.recorded_at > attendance.recorded_at",
+}
+
+
+class SyncError(ValueError):
+    """A sync request that cannot be read at all."""
+
+
+def decode(body, encoding=None):
+    """The JSON batch in a request body, gunzipped if ``encoding`` says so."""
+    if encoding and encoding.lower() in ("gzip", "x-gzip"):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, MAX_BODY)
+        except zlib.error:
+            raise SyncError("The body is not valid gzip.") from None
+        if inflater.unconsumed_tail:
+            raise SyncError(f"A batch may be at most {MAX_BODY // 1024} KiB uncompressed.")
+    elif encoding and encoding.lower() != "identity":
+        raise SyncError(f"Unsupported Content-Encoding {encoding}.")
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise SyncError("The body is not JSON.") from None
+
+
+def parse_entries(payload):
+    """``(columns, rejected)`` for ``sync`` from a decoded batch.
+
+    ``payload`` is ``{"device_id": ..., "entries": [...]}``; each entry has
+    ``employee_id``, ``date``, ``status`` and ``recorded_at`` (ISO 8601).
+    Entries that cannot be read are left out and reported in ``rejected``
+    as ``{"index": ..., "error": ...}``, so one bad entry never holds up the
+    rest of a device's queue.
+    """
+    entries = payload.get("entries") if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        raise SyncError("Send {\"entries\": [...]}.")
+    if len(entries) > MAX_BATCH:
+        raise SyncError(f"At most {MAX_BATCH} entries per request.")
+
+    columns = {"indexes": [], "employee_ids": [], "dates": [], "statuses": [], "recorded_ats": []}
+    rejected = []
+    for i, entry in enumerate(entries):
+        try:
+            status = entry["status"]
+            if status not in STATUSES:
+                raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+            employee_id = int(entry["employee_id"])
+            day = date.fromisoformat(entry["date"])
+            recorded_at = parse_time(entry["recorded_at"])
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            rejected.append({"index": i, "error": str(e)})
+            continue
+        columns["indexes"].append(i)
+        columns["employee_ids"].append(employee_id)
+        columns["dates"].append(day)
+        columns["statuses"].append(status)
+        columns["recorded_ats"].append(recorded_at)
+    return columns, rejected
+
+
+def sync(execute, columns, supervisor, rule="supervisor"):
+    """Apply one parsed batch on the caller's transaction.
+
+    Returns ``(applied, unknown)``: the number of entries written and the
+    indexes of entries for unknown or archived employees.  The rest lost to
+    a row or a later entry in the same batch that wins under ``rule``.
+    Entries by anyone but a supervisor never replace a row, as with the Add
+    Attendance form.
+    """
+    if rule not in RULES:
+        raise SyncError(f"Unknown conflict rule {rule}.")
+    result = execute(
+        text(f"""
+            WITH incoming AS (
+                SELECT t.*, t.employee_id IN (SELECT id FROM employees WHERE archived_at IS NULL) AS known
+                FROM unnest(
+                    CAST(:indexes AS INT[]), CAST(:employee_ids AS INT[]), CAST(:dates AS DATE[]),
+                    CAST(:statuses AS TEXT[]), CAST(:recorded_ats AS TIMESTAMP[])
+                ) AS t(idx, employee_id, date, status, recorded_at)
+            ), latest AS (
+                SELECT DISTINCT ON (employee_id, date)
+                       employee_id, date, status, LEAST(recorded_at, LOCALTIMESTAMP) AS recorded_at
+                FROM incoming
+                WHERE known
+                ORDER BY employee_id, date, recorded_at DESC, idx DESC
+            ), applied AS (
+                INSERT INTO attendance (employee_id, date, status, recorded_at, recorded_by_supervisor)
+                SELECT employee_id, date, status, recorded_at, :supervisor FROM latest
+                ON CONFLICT (employee_id, date) DO UPDATE
+                    SET status = EXCLUDED.status,
+                        recorded_at = EXCLUDED.recorded_at,
+                        recorded_by_supervisor = EXCLUDED.recorded_by_supervisor,
+                        version = attendance.version + 1
+                    WHERE :supervisor AND {RULES[rule]}
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM applied) AS applied,
+                   ARRAY(SELECT idx FROM incoming WHERE NOT known ORDER BY idx) AS unknown
+        """),
+        {**columns, "supervisor": supervisor}
+    ).first()
+    return result.applied, list(result.unknown)
+
+
+def init_app(app):
+    app.config.setdefault("KIOSK_CONFLICT_RULE", "supervisor")
+    app.config.setdefault("KIOSK_SYNC_BATCH", 200)
+    app.config.setdefault("KIOSK_SYNC_SECONDS", 3600)
+    if app.config["KIOSK_CONFLICT_RULE"] not in RULES:
+        raise SyncError(f"KIOSK_CONFLICT_RULE must be one of {', '.join(RULES)}.")
@@ -0,0 +1,88 @@
+"""Minimal closed-loop load generator for comparing gunicorn worker modes.
+
+Logs in once per client thread, then requests the given paths in a loop and
+reports throughput and latency for each concurrency level.
+
+    python loadtest.py --base http://127.0.0.1:8000 \
+        --user admin --password secret \
+        --paths /report/view/1,/payroll_overview --concurrency 1,8,32,64
+"""
+import argparse
+import http.cookiejar
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+
+def make_client(base, user, password):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({"username": user, "password": password}).encode()
+    opener.open(f"{base}/login", data=data, timeout=30).read()
+    return opener
+
+
+def run_level(base, user, password, paths, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        opener = make_client(base, user, password)
+        i = 0
+        local = []
+        local_errors = 0
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.monotonic()
+            try:
+                # No If-None-Match is sent, so every request does real work.
+                opener.open(f"{base}{path}", timeout=60).read()
+                local.append(time.monotonic() - start)
+            except Exception:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    if not latencies:
+        return concurrency, 0.0, 0.0, 0.0, errors[0]
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    return concurrency, len(latencies) / elapsed, p50, p95, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="http://127.0.0.1:8000")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--paths", default="/dashboard")
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+
+    paths = [p for p in args.paths.split(",") if p]
+    print(f"{'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'errors':>8}")
+    for level in (int(c) for c in args.concurrency.split(",")):
+        c, rps, p50, p95, errs = run_level(
+            args.base, args.user, args.password, paths, level, args.duration
+        )
+        print(f"{c:>8} {rps:>10.1f} {p50:>10.1f} {p95:>10.1f} {errs:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Money: exact amounts, and an integer-cents path for bulk pricing.
+
+An amount is a ``Decimal`` quantized to the cent (``to_money``), the type
+psycopg2 already returns for the ``DECIMAL(10,2)`` payroll columns.  Form
+input is parsed straight from its text, each line item is rounded half-up
+once, and totals are exact sums of the rounded items.  As a result
+``net_pay == gross_pay - total_deductions`` holds for every stored row, and
+a Python total over query results matches SQL ``SUM`` to the cent.
+
+Bulk work, such as pricing a whole pay period in ``pay_rules``, runs on
+NumPy ``int64`` arrays of cents instead.  Rates times hours times
+multipliers are exact integer products.  ``round_div`` turns each line
+item back into cents with the same half-up rounding as ``to_money``, and
+floats never hold an amount.  moneybench.py measures both paths against the
+old float arithmetic.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+class MoneyError(ValueError):
+    """An amount that is not a finite number."""
+
+
+def to_money(value):
+    """``value`` as a ``Decimal`` rounded half-up to the cent.
+
+    Accepts form text (``""`` and ``None`` are zero, thousands separators
+    are ignored), ints, Decimals and, for old callers, floats by their
+    shortest repr.
+    """
+    if value is None or value == "":
+        return ZERO
+    if isinstance(value, (Decimal, int)):
+        amount = Decimal(value)
+    else:
+        if isinstance(value, float):
+            value = repr(value)
+        try:
+            amount = Decimal(str(value).replace(",", "").strip())
+        except InvalidOperation:
+            raise MoneyError(f"{value!r} is not an amount.") from None
+    if not amount.is_finite():
+        raise MoneyError(f"{value!r} is not an amount.")
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def form_money(form, name):
+    """Amount field ``name`` of a submitted form; blank means zero."""
+    try:
+        return to_money(form.get(name))
+    except MoneyError:
+        raise MoneyError(f"{name.replace('_', ' ').capitalize()} must be a number.") from None
+
+
+def to_cents(value):
+    """``value`` rounded to the cent, as an int number of cents."""
+    return int(to_money(value).scaleb(2))
+
+
+def from_cents(cents):
+    """An int (or NumPy integer) number of cents as an amount."""
+    return Decimal(int(cents)).scaleb(-2).quantize(CENT)
+
+
+def total(amounts):
+    """Exact sum of amounts; ``None`` counts as zero."""
+    return sum((a for a in amounts if a is not None), ZERO)
+
+
+def average(amount, count):
+    """``amount / count`` rounded half-up to the cent; zero when ``count`` is 0."""
+    if not count:
+        return ZERO
+    return (Decimal(amount or 0) / count).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def round_div(numerator, denominator):
+    """``numerator / denominator`` rounded half-up (away from zero), element-wise.
+
+    Both are integer arrays or ints and ``denominator`` is positive; the
+    result is ``int64``.  This is how ``int64`` cents-times-quantity
+    products become cents again.
+    """
+    import numpy as np
+
+    numerator = np.asarray(numerator, dtype=np.int64)
+    rounded = (2 * np.abs(numerator) + denominator) // (2 * np.asarray(denominator, dtype=np.int64))
+    return np.where(numerator < 0, -rounded, rounded)
@@ -0,0 +1,183 @@
+"""Exactness and throughput of payroll money arithmetic.
+
+Prices the same synthetic payroll lines four ways and compares each to the
+exact result:
+
+* ``float``        - the old ``add_payroll``: floats per row, each column
+  rounded to the cent only when Postgres stores it
+* ``decimal``      - ``add_payroll`` now: ``money`` Decimals per row
+* ``float-numpy``  - the old bulk path in ``pay_rules.price``: float64
+  arrays and ``.round(2)``
+* ``cents-numpy``  - ``pay_rules.price`` now: ``int64`` cents and
+  ``money.round_div``
+
+A line is ``(daily rate + meal + transpo) x days + daily rate / regular
+hours x OT hours x OT multiplier + others - cash advance``, the Excel-style
+payroll.  The per-row paths parse the form text inside the timing, as the
+view does; the array paths get their columns parsed beforehand, as
+``pay_rules`` gets them from one query.  For each path the report shows how
+many stored rows break ``net = gross - deductions``, how many OT amounts
+differ from the exact ones, and how far the Python total of net pay drifts
+from ``SUM(net_pay)`` over the stored rows.  No database is needed:
+
+    python moneybench.py --rows 1000000
+"""
+import argparse
+import random
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import money
+
+REGULAR_HOURS = 8
+
+
+def generate(rows, seed=1):
+    """``rows`` payroll lines as text, the way the form submits them."""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(rows):
+        lines.append({
+            "daily_rate": f"{rng.randint(40000, 250000) / 100:.2f}",
+            "meal": f"{rng.randint(0, 15000) / 100:.2f}",
+            "transpo": f"{rng.randint(0, 10000) / 100:.2f}",
+            "days_worked": rng.randint(0, 15),
+            "total_ot_hours": f"{rng.randint(0, 4000) / 100:.2f}",
+            "ot_multiplier": rng.choice(("1.250", "1.300", "1.690", "2.600")),
+            "others": f"{rng.randint(0, 50000) / 100:.2f}",
+            "cash_advance": f"{rng.randint(0, 200000) / 100:.2f}",
+        })
+    return lines
+
+
+def stored(value):
+    """What a DECIMAL(10,2) column keeps of a float parameter."""
+    return Decimal(repr(value)).quantize(money.CENT, rounding=ROUND_HALF_UP)
+
+
+def float_rows(lines):
+    out = []
+    for line in lines:
+        rate = float(line["daily_rate"])
+        total_daily_salary = rate + float(line["meal"]) + float(line["transpo"])
+        ot = rate / REGULAR_HOURS * float(line["ot_multiplier"]) * float(line["total_ot_hours"])
+        gross = total_daily_salary * line["days_worked"] + ot + float(line["others"])
+        deductions = float(line["cash_advance"])
+        out.append((ot, gross, deductions, gross - deductions))
+    return out
+
+
+def decimal_rows(lines):
+    out = []
+    regular = Decimal(REGULAR_HOURS)
+    for line in lines:
+        rate = money.to_money(line["daily_rate"])
+        total_daily_salary = rate + money.to_money(line["meal"]) + money.to_money(line["transpo"])
+        ot = money.to_money(rate * Decimal(line["total_ot_hours"]) * Decimal(line["ot_multiplier"]) / regular)
+        gross = total_daily_salary * line["days_worked"] + ot + money.to_money(line["others"])
+        deductions = money.to_money(line["cash_advance"])
+        out.append((ot, gross, deductions, gross - deductions))
+    return out
+
+
+def float_arrays(lines):
+    import numpy as np
+
+    def column(name):
+        return np.array([float(line[name]) for line in lines])
+
+    return {name: column(name) for name in lines[0]}
+
+
+def cents_arrays(lines):
+    import numpy as np
+
+    def column(name, scale):
+        return np.array([int(Decimal(line[name]).scaleb(scale)) for line in lines], dtype=np.int64)
+
+    return {
+        "daily_rate": column("daily_rate", 2), "meal": column("meal", 2), "transpo": column("transpo", 2),
+        "days_worked": column("days_worked", 0), "total_ot_hours": column("total_ot_hours", 2),
+        "ot_multiplier": column("ot_multiplier", 3), "others": column("others", 2),
+        "cash_advance": column("cash_advance", 2),
+    }
+
+
+def float_numpy(a):
+    rate = a["daily_rate"]
+    ot = (rate / REGULAR_HOURS * a["ot_multiplier"] * a["total_ot_hours"]).round(2)
+    gross = ((rate + a["meal"] + a["transpo"]) * a["days_worked"] + ot + a["others"]).round(2)
+    return ot, gross, a["cash_advance"], (gross - a["cash_advance"]).round(2)
+
+
+def cents_numpy(a):
+    rate = a["daily_rate"]
+    ot = money.round_div(rate * a["total_ot_hours"] * a["ot_multiplier"], REGULAR_HOURS * 100 * 1000)
+    gross = (rate + a["meal"] + a["transpo"]) * a["days_worked"] + ot + a["others"]
+    return ot, gross, a["cash_advance"], gross - a["cash_advance"]
+
+
+def timed(fn, data, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def check_rows(rows, exact, python_total):
+    """(broken rows, OT mismatches, drift of the Python total in cents)."""
+    broken = mismatched = 0
+    stored_net = []
+    for (ot, gross, deductions, net), (exact_ot, *_) in zip(rows, exact):
+        ot, gross, deductions, net = (money.to_money(v) if isinstance(v, Decimal) else stored(v)
+                                      for v in (ot, gross, deductions, net))
+        broken += net != gross - deductions
+        mismatched += ot != exact_ot
+        stored_net.append(net)
+    drift = (Decimal(repr(python_total)) if isinstance(python_total, float) else python_total) - money.total(stored_net)
+    return broken, mismatched, abs(drift) * 100
+
+
+def check_arrays(result, exact, cents):
+    ot, gross, deductions, net = result
+    if cents:
+        to_amount = money.from_cents
+        python_total = money.from_cents(int(net.sum()))
+    else:
+        to_amount = stored
+        python_total = Decimal(repr(float(net.sum())))
+    rows = [tuple(to_amount(v) for v in values) for values in zip(ot.tolist(), gross.tolist(),
+                                                                   deductions.tolist(), net.tolist())]
+    return check_rows(rows, exact, python_total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = generate(args.rows)
+    exact = decimal_rows(lines)
+
+    results = []
+    floats, seconds = timed(float_rows, lines, args.repeat)
+    results.append(("float", seconds, check_rows(floats, exact, sum(r[3] for r in floats))))
+    decimals, seconds = timed(decimal_rows, lines, args.repeat)
+    results.append(("decimal", seconds, check_rows(decimals, exact, sum(r[3] for r in decimals))))
+    result, seconds = timed(float_numpy, float_arrays(lines), args.repeat)
+    results.append(("float-numpy", seconds, check_arrays(result, exact, cents=False)))
+    result, seconds = timed(cents_numpy, cents_arrays(lines), args.repeat)
+    results.append(("cents-numpy", seconds, check_arrays(result, exact, cents=True)))
+
+    print(f"{args.rows:,} payroll lines, best of {args.repeat}")
+    print(f"{'path':<12} {'rows/s':>14} {'net != gross-ded':>17} {'OT off by 1c+':>14} {'total drift (c)':>16}")
+    for name, seconds, (broken, mismatched, drift) in results:
+        print(f"{name:<12} {args.rows / seconds:>14,.0f} {broken:>17,} {mismatched:>14,} {drift:>16,.2f}")
+
+
+if __name__ == "__main__":
+    main()
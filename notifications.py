@@ -0,0 +1,498 @@
+"""Payroll and attendance notifications through a transactional outbox.
+
+A view that changes payroll or attendance calls ``publish`` on its own
+transaction.  That adds one ``notification_outbox`` row naming the event,
+however many people it concerns, and the row commits or rolls back with
+the change.  No notification goes out for a change that was rolled back,
+and no committed change goes unannounced.  The request pays for one small
+INSERT and an ``Event.set()`` (``kick``), whatever the number of recipients.
+
+The dispatcher does the rest in the background:
+
+1. Fan-out claims outbox rows (``FOR UPDATE SKIP LOCKED``) and writes one
+   ``notification_deliveries`` row per recipient and sink (``AUDIENCES``):
+   * e-mail to the employee concerned (``employees.email``), or to everyone
+     paid in a closed pay period;
+   * in-app messages to Admins and Managers;
+   * a POST to every ``NOTIFY_WEBHOOKS`` URL.
+2. Delivery claims up to ``NOTIFY_BATCH_SIZE`` due deliveries by pushing
+   their ``next_attempt_at`` one lease ahead.  A dispatcher that dies
+   mid-batch therefore loses nothing: the batch comes due again after
+   ``NOTIFY_LEASE_SECONDS``.  Each sink gets its share of the batch, with at
+   most ``NOTIFY_CONCURRENCY`` sends in flight per sink.  Failures are
+   retried with jittered exponential backoff; after ``NOTIFY_MAX_ATTEMPTS``
+   the delivery is marked failed and keeps its last error.
+
+Sinks are pluggable (``register_sink``):
+
+* ``email`` speaks SMTP to ``NOTIFY_SMTP_HOST``:``NOTIFY_SMTP_PORT``.  The
+  default, localhost:1025, is where local mail catchers listen.
+* ``webhook`` POSTs JSON.
+* ``inapp`` inserts into ``notifications``, read on the Notifications page.
+
+Delivery is at least once.  Webhook receivers can drop repeats by their
+``X-Notification-Id`` header.
+
+The dispatcher runs as a daemon thread in the web process
+(``NOTIFY_DISPATCHER = "thread"``).  With ``"off"``, run ``python
+notifications.py`` from cron instead.  In multi-tenant mode every tenant has
+its own outbox; a wake-up drains the tenants it came from, and the periodic
+pass (which also picks up retries) drains them all.
+"""
+import json
+import os
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+import tenants
+
+FAN_OUT_BATCH = 100
+BATCH_SIZE = 100
+MANAGER_ROLES = ("ADMIN", "MANAGER")
+
+# Subject and body of each event, formatted with its payload plus
+# ``employee`` and ``period`` looked up at fan-out time.
+MESSAGES = {
+    "payroll.added": (
+        "Payroll recorded for {period}",
+        "A payroll record for {employee} for {period} was added. Net pay: {net_pay}.",
+    ),
+    "payroll.updated": (
+        "Payroll updated for {period}",
+        "The payroll record of {employee} for {period} was changed. Net pay: {net_pay}.",
+    ),
+    "pay_period.closed": (
+        "Pay period {period} closed",
+        "Pay period {period} is closed and final; {records} payroll record(s) were frozen.",
+    ),
+    "attendance.added": (
+        "Attendance recorded for {date}",
+        "{employee} is recorded as {status} on {date}.",
+    ),
+    "attendance.updated": (
+        "Attendance corrected for {date}",
+        "The attendance of {employee} on {date} is now recorded as {status}.",
+    ),
+    "attendance.synced": (
+        "Attendance synced from a kiosk",
+        "{recorded_by} synced {applied} attendance entr(ies) from kiosk {device_id}.",
+    ),
+}
+
+# Who hears about each event; see RECIPIENTS_SQL.
+AUDIENCES = {
+    "payroll.added": ("employee", "managers", "webhooks"),
+    "payroll.updated": ("employee", "managers", "webhooks"),
+    "pay_period.closed": ("employees_paid", "managers", "webhooks"),
+    "attendance.added": ("webhooks",),
+    "attendance.updated": ("employee", "webhooks"),
+    "attendance.synced": ("webhooks",),
+}
+
+# (sink, recipient) rows per audience.
+RECIPIENTS_SQL = {
+    "employee": """
+        SELECT 'email', email FROM employees
+        WHERE id = :employee_id AND COALESCE(email, '') <> ''
+    """,
+    "employees_paid": """
+        SELECT 'email', e.email
+        FROM pay_periods pp
+        JOIN payroll p ON p.pay_period_start = pp.period_start AND p.pay_period_end = pp.period_end
+        JOIN employees e ON e.id = p.employee_id
+        WHERE pp.id = :pay_period_id AND COALESCE(e.email, '') <> ''
+    """,
+    "managers": """
+        SELECT 'inapp', username FROM users WHERE upper(account_type) = ANY(:manager_roles)
+    """,
+    "webhooks": """
+        SELECT 'webhook', url FROM unnest(CAST(:webhooks AS TEXT[])) AS url
+    """,
+}
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+class NotificationError(ValueError):
+    """An event this module does not know how to announce."""
+
+
+def publish(execute, event, **payload):
+    """Queue ``event`` on the caller's transaction; ``kick`` after committing.
+
+    ``payload`` is stored as JSON (dates and amounts as strings) and is what
+    webhooks receive.
+    """
+    if event not in AUDIENCES:
+        raise NotificationError(f"Unknown event {event}.")
+    execute(
+        text("INSERT INTO notification_outbox (event, payload) VALUES (:event, CAST(:payload AS JSONB))"),
+        {"event": event, "payload": json.dumps(payload, default=str)}
+    )
+
+
+def _render(conn, event, payload):
+    context = defaultdict(str, payload)
+    if payload.get("employee_id") is not None:
+        context["employee"] = conn.execute(
+            text("SELECT name FROM employees WHERE id = :id"), {"id": payload["employee_id"]}
+        ).scalar() or f"employee #{payload['employee_id']}"
+    if payload.get("pay_period_id") is not None:
+        period = conn.execute(
+            text("SELECT period_start, period_end FROM pay_periods WHERE id = :id"),
+            {"id": payload["pay_period_id"]}
+        ).first()
+        if period is not None:
+            context["start"], context["end"] = period
+    if context["start"]:
+        context["period"] = f"{context['start']} to {context['end']}"
+    subject, body = MESSAGES[event]
+    return subject.format_map(context), body.format_map(context)
+
+
+def fan_out(conn, webhooks=(), limit=FAN_OUT_BATCH):
+    """Expand up to ``limit`` outbox rows into deliveries; returns rows expanded."""
+    events = conn.execute(
+        text("""
+            SELECT id, event, payload FROM notification_outbox
+            WHERE fanned_out_at IS NULL
+            ORDER BY id
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        """),
+        {"limit": limit}
+    ).all()
+    for event in events:
+        subject, body = _render(conn, event.event, event.payload)
+        recipients = " UNION ".join(RECIPIENTS_SQL[audience] for audience in AUDIENCES[event.event])
+        conn.execute(
+            text(f"""
+                INSERT INTO notification_deliveries (outbox_id, sink, recipient, subject, body)
+                SELECT :outbox_id, r.sink, r.recipient, :subject, :body
+                FROM ({recipients}) AS r(sink, recipient)
+                ON CONFLICT DO NOTHING
+            """),
+            {"outbox_id": event.id, "subject": subject, "body": body,
+             "employee_id": event.payload.get("employee_id"),
+             "pay_period_id": event.payload.get("pay_period_id"),
+             "manager_roles": list(MANAGER_ROLES), "webhooks": list(webhooks)}
+        )
+    if events:
+        conn.execute(
+            text("UPDATE notification_outbox SET fanned_out_at = CURRENT_TIMESTAMP WHERE id = ANY(:ids)"),
+            {"ids": [event.id for event in events]}
+        )
+    return len(events)
+
+
+def claim(conn, limit=BATCH_SIZE, lease_seconds=60):
+    """Lease up to ``limit`` due deliveries and count the attempt."""
+    return conn.execute(
+        text("""
+            UPDATE notification_deliveries d
+            SET next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => :lease),
+                attempts = d.attempts + 1
+            FROM notification_outbox o
+            WHERE o.id = d.outbox_id
+              AND d.id IN (
+                  SELECT id FROM notification_deliveries
+                  WHERE sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= CURRENT_TIMESTAMP
+                  ORDER BY next_attempt_at
+                  LIMIT :limit
+                  FOR UPDATE SKIP LOCKED
+              )
+            RETURNING d.id, d.sink, d.recipient, d.subject, d.body, d.attempts,
+                      o.id AS outbox_id, o.event, o.payload, o.created_at
+        """),
+        {"limit": limit, "lease": lease_seconds}
+    ).all()
+
+
+def _parallel(send_chunk, items, limit):
+    """Run ``send_chunk`` over at most ``limit`` slices of ``items`` at once.
+
+    Each slice is sent in order by one thread (one SMTP connection, say);
+    the failures of all slices are merged.
+    """
+    chunks = [items[i::limit] for i in range(min(limit, len(items)))]
+    if len(chunks) <= 1:
+        return send_chunk(items)
+    failures = {}
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        for chunk_failures in pool.map(send_chunk, chunks):
+            failures.update(chunk_failures)
+    return failures
+
+
+class EmailSink:
+    """Plain-text e-mail over SMTP, one connection per slice of the batch."""
+
+    def deliver(self, items, config, engine):
+        # Imported on first delivery; web workers that only enqueue never load them.
+        import smtplib
+        from email.message import EmailMessage
+
+        def send_chunk(chunk):
+            failures, sent = {}, set()
+            try:
+                with smtplib.SMTP(config["NOTIFY_SMTP_HOST"], config["NOTIFY_SMTP_PORT"],
+                                  timeout=config["NOTIFY_TIMEOUT_SECONDS"]) as smtp:
+                    for item in chunk:
+                        message = EmailMessage()
+                        message["From"] = config["NOTIFY_MAIL_FROM"]
+                        message["To"] = item.recipient
+                        message["Subject"] = item.subject
+                        message.set_content(item.body)
+                        try:
+                            smtp.send_message(message)
+                            sent.add(item.id)
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                            failures[item.id] = str(e)
+            except (OSError, smtplib.SMTPException) as e:
+                # Lost the connection: everything not yet sent is retried.
+                failures.update({item.id: str(e) for item in chunk
+                                 if item.id not in sent and item.id not in failures})
+            return failures
+
+        return _parallel(send_chunk, items, config["NOTIFY_CONCURRENCY"])
+
+
+class WebhookSink:
+    """JSON POST of the event to the recipient URL; any 2xx is success."""
+
+    def deliver(self, items, config, engine):
+        import urllib.request
+
+        tenant = tenants.current()
+
+        def send_chunk(chunk):
+            failures = {}
+            for item in chunk:
+                body = json.dumps({
+                    "id": item.outbox_id, "event": item.event, "tenant": tenant,
+                    "created_at": item.created_at.isoformat(), "subject": item.subject,
+                    "payload": item.payload,
+                }).encode()
+                request = urllib.request.Request(item.recipient, data=body, method="POST", headers={
+                    "Content-Type": "application/json", "X-Notification-Id": str(item.outbox_id),
+                })
+                try:
+                    with urllib.request.urlopen(request, timeout=config["NOTIFY_TIMEOUT_SECONDS"]) as response:
+                        response.read()
+                except (OSError, ValueError) as e:
+                    failures[item.id] = str(e)
+            return failures
+
+        return _parallel(send_chunk, items, config["NOTIFY_CONCURRENCY"])
+
+
+class InAppSink:
+    """Messages in ``notifications``, the whole batch in one INSERT."""
+
+    def deliver(self, items, config, engine):
+        with engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO notifications (username, subject, body, delivery_id)
+                    SELECT * FROM unnest(CAST(:usernames AS TEXT[]), CAST(:subjects AS TEXT[]),
+                                         CAST(:bodies AS TEXT[]), CAST(:ids AS BIGINT[]))
+                    ON CONFLICT (delivery_id) DO NOTHING
+                """),
+                {"usernames": [i.recipient for i in items], "subjects": [i.subject for i in items],
+                 "bodies": [i.body for i in items], "ids": [i.id for i in items]}
+            )
+        return {}
+
+
+SINKS = {"email": EmailSink(), "webhook": WebhookSink(), "inapp": InAppSink()}
+
+
+def register_sink(name, sink):
+    """Add or replace a sink: an object with ``deliver(items, config, engine)``.
+
+    ``deliver`` gets the claimed deliveries of its sink and returns
+    ``{delivery_id: error}`` for the ones that failed.
+    """
+    SINKS[name] = sink
+
+
+def _backoff(attempts, config):
+    delay = min(config["NOTIFY_RETRY_MAX_SECONDS"], config["NOTIFY_RETRY_BASE_SECONDS"] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _record(engine, items, failures, config):
+    sent = [item.id for item in items if item.id not in failures]
+    failed = [item for item in items if item.id in failures]
+    with engine.begin() as conn:
+        if sent:
+            conn.execute(
+                text("""
+                    UPDATE notification_deliveries
+                    SET sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                    WHERE id = ANY(:ids)
+                """),
+                {"ids": sent}
+            )
+        if failed:
+            conn.execute(
+                text("""
+                    UPDATE notification_deliveries d
+                    SET last_error = u.error,
+                        next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => u.delay),
+                        failed_at = CASE WHEN d.attempts >= :max_attempts THEN CURRENT_TIMESTAMP END
+                    FROM unnest(CAST(:ids AS BIGINT[]), CAST(:errors AS TEXT[]), CAST(:delays AS FLOAT8[]))
+                         AS u(id, error, delay)
+                    WHERE d.id = u.id
+                """),
+                {"ids": [item.id for item in failed],
+                 "errors": [failures[item.id][:500] for item in failed],
+                 "delays": [_backoff(item.attempts, config) for item in failed],
+                 "max_attempts": config["NOTIFY_MAX_ATTEMPTS"]}
+            )
+
+
+def deliver_batch(engine, config):
+    """Send one batch of due deliveries; returns how many were claimed."""
+    with engine.begin() as conn:
+        items = claim(conn, config["NOTIFY_BATCH_SIZE"], config["NOTIFY_LEASE_SECONDS"])
+    if not items:
+        return 0
+    by_sink = defaultdict(list)
+    for item in items:
+        by_sink[item.sink].append(item)
+    failures = {}
+    for name, batch in by_sink.items():
+        sink = SINKS.get(name)
+        if sink is None:
+            failures.update({item.id: f"No sink named {name}." for item in batch})
+            continue
+        try:
+            failures.update(sink.deliver(batch, config, engine))
+        except Exception as e:
+            failures.update({item.id: str(e) or type(e).__name__ for item in batch})
+    _record(engine, items, failures, config)
+    return len(items)
+
+
+def purge(engine, keep_days):
+    """Drop outbox rows older than ``keep_days`` whose deliveries are all settled."""
+    with engine.begin() as conn:
+        return conn.execute(
+            text("""
+                DELETE FROM notification_outbox o
+                WHERE o.fanned_out_at < CURRENT_TIMESTAMP - make_interval(days => :days)
+                  AND NOT EXISTS (SELECT 1 FROM notification_deliveries d
+                                  WHERE d.outbox_id = o.id AND d.sent_at IS NULL AND d.failed_at IS NULL)
+            """),
+            {"days": keep_days}
+        ).rowcount
+
+
+def run_pending(engine, config):
+    """Fan out the whole outbox, then send until nothing is due; returns deliveries tried."""
+    while True:
+        with engine.begin() as conn:
+            if fan_out(conn, config["NOTIFY_WEBHOOKS"]) < FAN_OUT_BATCH:
+                break
+    tried = 0
+    while True:
+        count = deliver_batch(engine, config)
+        tried += count
+        if count < config["NOTIFY_BATCH_SIZE"]:
+            return tried
+
+
+def inbox(execute, username, limit=50):
+    return execute(
+        text("""
+            SELECT id, subject, body, created_at, read_at FROM notifications
+            WHERE username = :username
+            ORDER BY id DESC
+            LIMIT :limit
+        """),
+        {"username": username, "limit": limit}
+    ).all()
+
+
+def mark_read(execute, username):
+    execute(
+        text("UPDATE notifications SET read_at = CURRENT_TIMESTAMP WHERE username = :username AND read_at IS NULL"),
+        {"username": username}
+    )
+
+
+class NotificationDispatcher(threading.Thread):
+    """Daemon thread that drains the outbox whenever it is woken, and
+    periodically for retries."""
+
+    def __init__(self, app, db):
+        super().__init__(name="notification-dispatcher", daemon=True)
+        self.app = app
+        self.db = db
+        self.wake = threading.Event()
+        self.woken_for = tenants.Wakeups()
+
+    def run(self):
+        only = None
+        while True:
+            try:
+                with self.app.app_context():
+                    for _ in tenants.each_tenant(self.app, self.db.engine, only):
+                        run_pending(self.db.engine, self.app.config)
+                        if only is None:
+                            purge(self.db.engine, self.app.config["NOTIFY_KEEP_DAYS"])
+            except Exception as e:
+                self.app.logger.warning("Notification dispatcher failed: %s", e)
+            woken = self.wake.wait(self.app.config["NOTIFY_POLL_SECONDS"])
+            self.wake.clear()
+            only = self.woken_for.take() if woken else None
+
+
+def init_app(app, db):
+    app.config.setdefault("NOTIFY_DISPATCHER", "thread")
+    app.config.setdefault("NOTIFY_WEBHOOKS", ())
+    app.config.setdefault("NOTIFY_SMTP_HOST", "localhost")
+    app.config.setdefault("NOTIFY_SMTP_PORT", 1025)
+    app.config.setdefault("NOTIFY_MAIL_FROM", "payroll@localhost")
+    app.config.setdefault("NOTIFY_BATCH_SIZE", BATCH_SIZE)
+    app.config.setdefault("NOTIFY_CONCURRENCY", 4)
+    app.config.setdefault("NOTIFY_TIMEOUT_SECONDS", 10)
+    app.config.setdefault("NOTIFY_LEASE_SECONDS", 60)
+    app.config.setdefault("NOTIFY_MAX_ATTEMPTS", 8)
+    app.config.setdefault("NOTIFY_RETRY_BASE_SECONDS", 30)
+    app.config.setdefault("NOTIFY_RETRY_MAX_SECONDS", 3600)
+    app.config.setdefault("NOTIFY_POLL_SECONDS", 30)
+    app.config.setdefault("NOTIFY_KEEP_DAYS", 30)
+    app.extensions["notifications"] = db
+
+
+def kick(app):
+    """Wake this process's dispatcher, starting it on first use."""
+    global _worker, _worker_pid
+    if app.config.get("NOTIFY_DISPATCHER") != "thread":
+        return
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid():
+            _worker = NotificationDispatcher(app, app.extensions["notifications"])
+            _worker_pid = os.getpid()
+            _worker.start()
+        _worker.woken_for.add(tenants.current())
+        _worker.wake.set()
+
+
+if __name__ == "__main__":
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    with app.app_context():
+        tried = sum(run_pending(db.engine, app.config) for _ in tenants.each_tenant(app, db.engine))
+        print(f"Tried {tried} delivery attempt(s)")
@@ -0,0 +1,225 @@
+"""Pay period lifecycle and pre-aggregated payroll totals.
+
+A period moves ``open -> approved -> closed``.  Closing it marks its payroll
+rows ``period_closed`` (a trigger then rejects edits to them) and writes
+immutable per-period, per-project and per-employee rows to
+``payroll_period_totals`` in one ``GROUPING SETS`` pass.  Summaries add those
+small totals to a live aggregate over rows that are not closed yet, which
+the partial index ``idx_payroll_open_project`` keeps cheap.
+"""
+from sqlalchemy import text
+
+STATUSES = ("open", "approved", "closed")
+
+# How the summaries value one payroll row; mirrors the original SUMs.
+GROSS = "COALESCE(gross_pay, basic_salary + overtime)"
+DEDUCTIONS = "COALESCE(total_deductions, deductions)"
+
+
+class PeriodError(ValueError):
+    """A lifecycle step that is not allowed from the period's current state."""
+
+
+def list_periods(execute):
+    """All periods, newest first, with live record counts and net pay."""
+    return execute(
+        text("""
+            SELECT pp.*,
+                   COALESCE(t.records, l.records, 0) AS records,
+                   COALESCE(t.net_pay, l.net_pay, 0) AS net_pay
+            FROM pay_periods pp
+            LEFT JOIN payroll_period_totals t
+                   ON t.pay_period_id = pp.id AND t.scope = 'period'
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS records, SUM(net_pay) AS net_pay
+                FROM payroll p
+                WHERE p.pay_period_start = pp.period_start
+                  AND p.pay_period_end = pp.period_end
+                  AND pp.status <> 'closed'
+            ) l ON TRUE
+            ORDER BY pp.period_start DESC, pp.period_end DESC
+        """)
+    ).mappings().all()
+
+
+def create_period(execute, period_start, period_end):
+    if period_end < period_start:
+        raise PeriodError("The period end must be on or after its start.")
+    created = execute(
+        text("""
+            INSERT INTO pay_periods (period_start, period_end)
+            VALUES (:period_start, :period_end)
+            ON CONFLICT (period_start, period_end) DO NOTHING
+            RETURNING id
+        """),
+        {"period_start": period_start, "period_end": period_end}
+    ).scalar()
+    if created is None:
+        raise PeriodError("That pay period already exists.")
+    return created
+
+
+def _lock(execute, period_id):
+    period = execute(
+        text("SELECT * FROM pay_periods WHERE id = :id FOR UPDATE"),
+        {"id": period_id}
+    ).mappings().first()
+    if period is None:
+        raise PeriodError("Pay period not found.")
+    return period
+
+
+def approve_period(execute, period_id, username):
+    period = _lock(execute, period_id)
+    if period["status"] != "open":
+        raise PeriodError(f"Only open periods can be approved (this one is {period['status']}).")
+    execute(
+        text("""
+            UPDATE pay_periods
+            SET status = 'approved', approved_by = :username, approved_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """),
+        {"id": period_id, "username": username}
+    )
+
+
+def reopen_period(execute, period_id):
+    period = _lock(execute, period_id)
+    if period["status"] != "approved":
+        raise PeriodError("Only approved periods can be reopened; closed periods are final.")
+    execute(
+        text("""
+            UPDATE pay_periods
+            SET status = 'open', approved_by = NULL, approved_at = NULL
+            WHERE id = :id
+        """),
+        {"id": period_id}
+    )
+
+
+def close_period(execute, period_id, username):
+    """Freeze an approved period and write its totals; returns rows frozen.
+
+    Runs on the caller's transaction.  The ``FOR UPDATE`` lock on the period
+    waits for in-flight payroll writes (they hold ``FOR KEY SHARE`` on it via
+    the guard trigger), so the totals cannot miss a concurrent change.
+    """
+    period = _lock(execute, period_id)
+    if period["status"] != "approved":
+        raise PeriodError("A period must be approved before it can be closed.")
+
+    params = {"id": period_id, "start": period["period_start"], "end": period["period_end"]}
+    frozen = execute(
+        text("""
+            UPDATE payroll SET period_closed = TRUE
+            WHERE pay_period_start = :start AND pay_period_end = :end AND NOT period_closed
+        """),
+        params
+    ).rowcount
+
+    execute(
+        text(f"""
+            INSERT INTO payroll_period_totals (
+                pay_period_id, scope, project_id, employee_id, records, employees_paid,
+                gross_pay, total_deductions, net_pay, latest_pay_period_end
+            )
+            SELECT :id,
+                   CASE
+                       WHEN GROUPING(project_id) = 0 THEN 'project'
+                       WHEN GROUPING(employee_id) = 0 THEN 'employee'
+                       ELSE 'period'
+                   END,
+                   CASE WHEN GROUPING(project_id) = 0 THEN project_id END,
+                   CASE WHEN GROUPING(employee_id) = 0 THEN employee_id END,
+                   COUNT(*),
+                   COUNT(DISTINCT employee_id),
+                   COALESCE(SUM({GROSS}), 0),
+                   COALESCE(SUM({DEDUCTIONS}), 0),
+                   COALESCE(SUM(net_pay), 0),
+                   MAX(pay_period_end)
+            FROM payroll
+            WHERE pay_period_start = :start AND pay_period_end = :end
+            GROUP BY GROUPING SETS ((), (project_id), (employee_id))
+        """),
+        params
+    )
+
+    execute(
+        text("""
+            UPDATE pay_periods
+            SET status = 'closed', closed_by = :username, closed_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """),
+        {"id": period_id, "username": username}
+    )
+    return frozen
+
+
+def period_is_closed(execute, period_start, period_end):
+    return execute(
+        text("""
+            SELECT EXISTS (
+                SELECT 1 FROM pay_periods
+                WHERE period_start = :start AND period_end = :end AND status = 'closed'
+            )
+        """),
+        {"start": period_start, "end": period_end}
+    ).scalar()
+
+
+def payroll_summary(execute, project_id=None):
+    """Summary cards for payroll pages: closed totals plus the open rows live.
+
+    ``employees_paid`` counts payroll records, as the pages always have.
+    """
+    if project_id is None:
+        closed_filter, open_filter, params = "scope = 'period'", "", {}
+    else:
+        closed_filter = "scope = 'project' AND project_id = :project_id"
+        open_filter = "AND project_id = :project_id"
+        params = {"project_id": project_id}
+    return execute(
+        text(f"""
+            SELECT COALESCE(SUM(records), 0) AS employees_paid,
+                   COALESCE(SUM(gross_pay), 0) AS total_gross_pay,
+                   COALESCE(SUM(total_deductions), 0) AS total_deductions,
+                   COALESCE(SUM(net_pay), 0) AS total_net_pay
+            FROM (
+                SELECT records, gross_pay, total_deductions, net_pay
+                FROM payroll_period_totals
+                WHERE {closed_filter}
+                UNION ALL
+                SELECT COUNT(*), SUM({GROSS}), SUM({DEDUCTIONS}), SUM(net_pay)
+                FROM payroll
+                WHERE NOT period_closed {open_filter}
+            ) parts
+        """),
+        params
+    ).mappings().first()
+
+
+def totals_by(execute, scope):
+    """``{project_id|employee_id: {records, net_pay, latest_pay_period_end}}``
+    over all periods, closed totals plus open rows live."""
+    column = {"project": "project_id", "employee": "employee_id"}[scope]
+    rows = execute(
+        text(f"""
+            SELECT {column} AS key,
+                   SUM(records) AS records,
+                   SUM(net_pay) AS net_pay,
+                   MAX(latest_pay_period_end) AS latest_pay_period_end
+            FROM (
+                SELECT {column}, records, net_pay, latest_pay_period_end
+                FROM payroll_period_totals
+                WHERE scope = :scope
+                UNION ALL
+                SELECT {column}, COUNT(*), SUM(net_pay), MAX(pay_period_end)
+                FROM payroll
+                WHERE NOT period_closed
+                GROUP BY {column}
+            ) parts
+            GROUP BY {column}
+        """),
+        {"scope": scope}
+    ).mappings().all()
+    return {row["key"]: row for row in rows}
@@ -0,0 +1,224 @@
+"""Monte Carlo payroll cost forecast for a project's remaining horizon.
+
+For every scenario the simulator draws, per employee and per draw:
+
+* an attendance rate from a Beta distribution with the scenario's mean/sd,
+* days worked ~ Binomial(remaining workdays, attendance rate),
+* OT hours ~ Poisson(days worked * expected OT hours per day),
+
+and prices them with each employee's latest ``daily_rate``/``meal``/``transpo``
+as regular days, with OT at the default regular-day rule (``daily_rate / 8 *
+1.25``; holiday and rest-day rules in pay_rules.py are not simulated).
+Draws are a (draws x employees) NumPy array; large jobs are split across a
+process pool with independent random streams.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+OT_MULTIPLIER = 1.25
+PERCENTILES = (5, 50, 95)
+# Below this many (draw x employee) cells the pool costs more than it saves.
+INLINE_CELLS = 200_000
+MAX_DRAWS = 100_000
+MAX_SCENARIOS = 20
+# Draws x employees x scenarios per request; draws are reduced to fit.
+MAX_CELLS = 10_000_000
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_count():
+    return int(os.getenv("FORECAST_WORKERS", os.cpu_count() or 1))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Not fork: the web process runs threads (dispatcher, aggregator,
+            # replica checks) whose locks a forked child would inherit held.
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=_worker_count(), mp_context=context)
+        return _pool
+
+
+def count_workdays(start, end, workdays_per_week=6):
+    """Working days in [start, end]; Mon-Sat by default, Mon-Fri when 5."""
+    if end < start:
+        return 0
+    days = 0
+    current = start
+    while current <= end:
+        if current.weekday() < workdays_per_week:
+            days += 1
+        current += timedelta(days=1)
+    return days
+
+
+def load_staff(execute, project_id):
+    """Project row plus assigned staff with their latest pay rates."""
+    project = execute(
+        text("SELECT id, project_name, start_date, end_date FROM projects WHERE id = :id AND archived_at IS NULL"),
+        {"id": project_id}
+    ).mappings().first()
+    if project is None:
+        return None, []
+
+    # Prefer the latest rate on this project, fall back to the latest anywhere.
+    staff = execute(
+        text("""
+            SELECT e.id AS employee_id, e.name,
+                   COALESCE(r.daily_rate, 0) AS daily_rate,
+                   COALESCE(r.meal, 0) AS meal,
+                   COALESCE(r.transpo, 0) AS transpo
+            FROM project_employees pe
+            JOIN employees e ON e.id = pe.employee_id
+            LEFT JOIN LATERAL (
+                SELECT p.daily_rate, p.meal, p.transpo
+                FROM payroll p
+                WHERE p.employee_id = e.id
+                ORDER BY (p.project_id = :project_id) DESC NULLS LAST,
+                         p.pay_period_end DESC, p.created_at DESC
+                LIMIT 1
+            ) r ON TRUE
+            WHERE pe.project_id = :project_id
+            ORDER BY e.name
+        """),
+        {"project_id": project_id}
+    ).mappings().all()
+
+    spent = execute(
+        text("SELECT COALESCE(SUM(net_pay), 0) FROM payroll WHERE project_id = :id"),
+        {"id": project_id}
+    ).scalar()
+    return dict(project, spent_to_date=float(spent)), [dict(s) for s in staff]
+
+
+def _beta_params(mean, sd):
+    """Beta(a, b) with the given mean and standard deviation."""
+    mean = min(max(mean, 1e-6), 1 - 1e-6)
+    var = min(max(sd, 1e-6) ** 2, mean * (1 - mean) * 0.999)
+    common = mean * (1 - mean) / var - 1
+    return mean * common, (1 - mean) * common
+
+
+def _simulate_chunk(args):
+    """Simulate ``draws`` rows; runs inline or in a pool worker."""
+    import numpy as np
+
+    seed, draws, workdays, rates, daily_cost, scenario = args
+    rng = np.random.default_rng(seed)
+    n = len(rates)
+
+    a, b = _beta_params(scenario["attendance_rate"], scenario["attendance_sd"])
+    attendance = rng.beta(a, b, size=(draws, n))
+    days = rng.binomial(workdays, attendance)
+    ot_hours = rng.poisson(days * scenario["ot_hours_per_day"])
+
+    cost = days * daily_cost + ot_hours * (rates / 8 * OT_MULTIPLIER)
+    return cost.sum(axis=1), cost.sum(axis=0), days.sum(axis=0)
+
+
+def simulate(staff, workdays, scenario, draws, seed=None):
+    """Run one scenario; returns totals percentiles and per-employee means."""
+    import numpy as np
+
+    rates = np.array([float(s["daily_rate"]) for s in staff])
+    daily_cost = rates + np.array([float(s["meal"]) + float(s["transpo"]) for s in staff])
+
+    seeds = np.random.SeedSequence(seed)
+    cells = draws * max(len(staff), 1)
+    chunks = 1 if cells <= INLINE_CELLS else min(_worker_count(), max(draws // 1000, 1))
+    sizes = [draws // chunks + (1 if i < draws % chunks else 0) for i in range(chunks)]
+    jobs = [
+        (child, size, workdays, rates, daily_cost, scenario)
+        for child, size in zip(seeds.spawn(chunks), sizes)
+    ]
+
+    if chunks == 1:
+        results = [_simulate_chunk(jobs[0])]
+    else:
+        results = list(_get_pool().map(_simulate_chunk, jobs))
+
+    totals = np.concatenate([r[0] for r in results])
+    per_employee_cost = sum(r[1] for r in results) / draws
+    per_employee_days = sum(r[2] for r in results) / draws
+
+    return {
+        "name": scenario.get("name"),
+        "inputs": {k: scenario[k] for k in ("attendance_rate", "attendance_sd", "ot_hours_per_day")},
+        "mean": round(float(totals.mean()), 2),
+        "percentiles": {
+            f"p{p}": round(float(v), 2)
+            for p, v in zip(PERCENTILES, np.percentile(totals, PERCENTILES))
+        },
+        "employees": [
+            {
+                "employee_id": s["employee_id"],
+                "name": s["name"],
+                "expected_days": round(float(d), 1),
+                "expected_cost": round(float(c), 2),
+            }
+            for s, d, c in zip(staff, per_employee_days, per_employee_cost)
+        ],
+    }
+
+
+def parse_scenarios(payload):
+    """Validate scenario dicts from a request; raises ``ValueError``."""
+    scenarios = payload.get("scenarios") or [{}]
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"at most {MAX_SCENARIOS} scenarios per request")
+    parsed = []
+    for i, raw in enumerate(scenarios):
+        scenario = {
+            "name": str(raw.get("name") or f"Scenario {i + 1}"),
+            "attendance_rate": float(raw.get("attendance_rate", 0.9)),
+            "attendance_sd": float(raw.get("attendance_sd", 0.05)),
+            "ot_hours_per_day": float(raw.get("ot_hours_per_day", 0.5)),
+        }
+        if not 0 < scenario["attendance_rate"] <= 1:
+            raise ValueError("attendance_rate must be in (0, 1]")
+        if scenario["attendance_sd"] < 0 or scenario["ot_hours_per_day"] < 0:
+            raise ValueError("attendance_sd and ot_hours_per_day must be non-negative")
+        parsed.append(scenario)
+    return parsed
+
+
+def forecast_project(execute, project_id, payload, today=None):
+    """Forecast remaining payroll cost of a project under several scenarios.
+
+    ``execute`` runs read-only statements (``db.session.execute`` or the
+    replica router).  Returns ``None`` for an unknown project.
+    """
+    project, staff = load_staff(execute, project_id)
+    if project is None:
+        return None
+
+    today = today or date.today()
+    draws = min(max(int(payload.get("draws", 10_000)), 1), MAX_DRAWS)
+    workdays_per_week = int(payload.get("workdays_per_week", 6))
+    scenarios = parse_scenarios(payload)
+
+    start = max(today, project["start_date"] or today)
+    end = project["end_date"] or start
+    workdays = count_workdays(start, end, workdays_per_week)
+    draws = min(draws, max(MAX_CELLS // (max(len(staff), 1) * len(scenarios)), 1))
+
+    results = [simulate(staff, workdays, s, draws) for s in scenarios] if staff and workdays else []
+    return {
+        "project_id": project["id"],
+        "project_name": project["project_name"],
+        "horizon": {"start": start.isoformat(), "end": end.isoformat(), "workdays": workdays},
+        "staff_count": len(staff),
+        "spent_to_date": round(project["spent_to_date"], 2),
+        "draws": draws,
+        "scenarios": results,
+    }
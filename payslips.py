@@ -0,0 +1,389 @@
+"""Batch payslip rendering: one PDF per payroll row, zipped.
+
+A batch covers a pay period, a project or both.  It is queued as a
+``payslip_jobs`` row and run on a background thread: payroll rows are
+streamed from a server-side cursor in chunks, each chunk is rendered to PDF
+on a process pool, and finished chunks are appended to a ZIP on disk in
+order.  Only a few chunks are in flight at once, so memory stays flat however
+large the batch is.  Progress is written back to the job row after every
+chunk for ``/api/payslip_jobs/<id>`` to report, and the finished ZIP is
+streamed from disk on download.
+
+The PDFs are written by hand (a single page of Type1 Helvetica text), so no
+PDF library is needed.
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from sqlalchemy import text
+
+import tenants
+
+CHUNK_SIZE = 100
+COMPANY = "Jedidiah Construction"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+ROWS_SQL = """
+    SELECT p.id, p.pay_period_start, p.pay_period_end, p.status,
+           COALESCE(NULLIF(p.position, ''), e.position) AS position,
+           e.name AS employee_name, pr.project_name,
+           p.daily_rate, p.meal, p.transpo, p.total_daily_salary, p.days_worked,
+           p.total_ot_hours, p.holiday_pay, p.holiday_pay_amount, p.night_diff, p.others,
+           p.basic_salary, p.overtime, p.cash_advance,
+           COALESCE(p.total_deductions, p.deductions) AS total_deductions,
+           COALESCE(p.gross_pay, p.basic_salary + p.overtime) AS gross_pay,
+           p.net_pay
+    FROM payroll p
+    JOIN employees e ON e.id = p.employee_id
+    LEFT JOIN projects pr ON pr.id = p.project_id
+    WHERE {where}
+    ORDER BY e.name, p.id
+"""
+
+
+def _worker_count():
+    return int(os.getenv("PAYSLIP_WORKERS", os.cpu_count() or 1))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Not fork: this runs beside the app's daemon threads, whose
+            # locks (logging, the connection pool) a forked child could
+            # inherit held.
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=_worker_count(), mp_context=context)
+        return _pool
+
+
+# --------------------------------------------------------
+# PDF rendering (runs in pool workers)
+# --------------------------------------------------------
+PAGE_WIDTH, PAGE_HEIGHT = 420, 595  # A5 portrait, in points
+LEFT, RIGHT = 40, 380
+
+# Helvetica advance widths (1/1000 em) for the characters amounts use.
+_AMOUNT_WIDTHS = {",": 278, ".": 278, "-": 333, " ": 278}
+
+
+def _amount_width(value, size):
+    return sum(_AMOUNT_WIDTHS.get(ch, 556) for ch in value) * size / 1000
+
+
+def _pdf_string(value):
+    raw = str(value).encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _money(value):
+    return f"{Decimal(value or 0):,.2f}"
+
+
+def _build_pdf(content):
+    """A one-page PDF whose page draws ``content`` (a PDF content stream)."""
+    stream = zlib.compress(content)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class _Page:
+    """Collects text lines and rules top-down into a content stream."""
+
+    def __init__(self):
+        self.ops = []
+        self.y = PAGE_HEIGHT - 50
+
+    def text(self, x, value, size=9, bold=False):
+        font = b"F2" if bold else b"F1"
+        self.ops.append(b"BT /%s %d Tf %.2f %.2f Td %s Tj ET" % (font, size, x, self.y, _pdf_string(value)))
+
+    def row(self, label, amount="", size=9, bold=False, gap=14):
+        self.text(LEFT, label, size, bold)
+        if amount != "":
+            self.text(RIGHT - _amount_width(amount, size), amount, size, bold)
+        self.y -= gap
+
+    def rule(self, gap=12):
+        self.ops.append(b"0.5 w %d %.2f m %d %.2f l S" % (LEFT, self.y + 8, RIGHT, self.y + 8))
+        self.y -= gap
+
+    def render(self):
+        return _build_pdf(b"\n".join(self.ops))
+
+
+def render_payslip(row):
+    """PDF bytes of one payslip; ``row`` is a mapping shaped like ``ROWS_SQL``."""
+    page = _Page()
+    page.row(COMPANY, size=14, bold=True, gap=18)
+    page.row("PAYSLIP", size=11, bold=True, gap=22)
+
+    page.row(f"Employee: {row['employee_name']}")
+    if row["position"]:
+        page.row(f"Position: {row['position']}")
+    page.row(f"Project: {row['project_name'] or 'Unassigned'}")
+    page.row(f"Pay period: {row['pay_period_start']} to {row['pay_period_end']}")
+    page.row(f"Payroll #{row['id']} ({row['status'] or 'Pending'})", gap=20)
+
+    page.row("EARNINGS", bold=True)
+    page.rule()
+    daily = Decimal(row["total_daily_salary"] or 0)
+    if daily:
+        page.row(f"Daily rate {_money(daily)} x {row['days_worked'] or 0} day(s)", _money(row["basic_salary"]))
+    else:
+        page.row("Basic salary", _money(row["basic_salary"]))
+    hours = Decimal(row["total_ot_hours"] or 0)
+    if hours:
+        # The OT rate depends on the day type (pay_rules.py), so only hours show.
+        page.row(f"Overtime {hours.normalize():f} h", _money(row["overtime"]))
+    else:
+        page.row("Overtime", _money(row["overtime"]))
+    page.row("Holiday pay", _money(row["holiday_pay_amount"]))
+    if row["night_diff"]:
+        page.row("Night differential", _money(row["night_diff"]))
+    if row["others"]:
+        page.row("Others", _money(row["others"]))
+    page.row("Gross pay", _money(row["gross_pay"]), bold=True, gap=20)
+
+    page.row("DEDUCTIONS", bold=True)
+    page.rule()
+    page.row("Cash advance", _money(row["cash_advance"]))
+    page.row("Total deductions", _money(row["total_deductions"]), bold=True, gap=20)
+
+    page.rule(gap=10)
+    page.row("NET PAY (PHP)", _money(row["net_pay"]), size=12, bold=True)
+    return page.render()
+
+
+def payslip_filename(row):
+    name = re.sub(r"[^A-Za-z0-9]+", "_", row["employee_name"] or "employee").strip("_")
+    return f"{row['pay_period_end']}_{name}_{row['id']}.pdf"
+
+
+def render_batch(rows):
+    """``[(filename, pdf bytes)]`` for a chunk of rows; runs in a pool worker."""
+    return [(payslip_filename(row), render_payslip(row)) for row in rows]
+
+
+# --------------------------------------------------------
+# Jobs
+# --------------------------------------------------------
+def _filters(job):
+    clauses, params = [], {}
+    if job["pay_period_id"] is not None:
+        clauses.append("""
+            (p.pay_period_start, p.pay_period_end) =
+            (SELECT period_start, period_end FROM pay_periods WHERE id = :pay_period_id)
+        """)
+        params["pay_period_id"] = job["pay_period_id"]
+    if job["project_id"] is not None:
+        clauses.append("p.project_id = :project_id")
+        params["project_id"] = job["project_id"]
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def create_job(execute, pay_period_id=None, project_id=None, requested_by=None):
+    """Queue a batch on the caller's transaction; returns the job id."""
+    if pay_period_id is None and project_id is None:
+        raise ValueError("Pick a pay period or a project.")
+    return execute(
+        text("""
+            INSERT INTO payslip_jobs (pay_period_id, project_id, requested_by)
+            VALUES (:pay_period_id, :project_id, :requested_by)
+            RETURNING id
+        """),
+        {"pay_period_id": pay_period_id, "project_id": project_id, "requested_by": requested_by}
+    ).scalar()
+
+
+def get_job(execute, job_id):
+    return execute(
+        text("""
+            SELECT j.*, pp.period_start, pp.period_end, pr.project_name
+            FROM payslip_jobs j
+            LEFT JOIN pay_periods pp ON pp.id = j.pay_period_id
+            LEFT JOIN projects pr ON pr.id = j.project_id
+            WHERE j.id = :id
+        """),
+        {"id": job_id}
+    ).mappings().first()
+
+
+def recent_jobs(execute, limit=20):
+    return execute(
+        text("""
+            SELECT j.*, pp.period_start, pp.period_end, pr.project_name
+            FROM payslip_jobs j
+            LEFT JOIN pay_periods pp ON pp.id = j.pay_period_id
+            LEFT JOIN projects pr ON pr.id = j.project_id
+            ORDER BY j.id DESC
+            LIMIT :limit
+        """),
+        {"limit": limit}
+    ).mappings().all()
+
+
+def _update(engine, job_id, finished=False, **fields):
+    assignments = ", ".join([f"{name} = :{name}" for name in fields]
+                            + (["finished_at = CURRENT_TIMESTAMP"] if finished else []))
+    with engine.begin() as conn:
+        conn.execute(text(f"UPDATE payslip_jobs SET {assignments} WHERE id = :id"), dict(fields, id=job_id))
+
+
+def run_job(engine, job_id, out_dir, chunk_size=CHUNK_SIZE, workers=None):
+    """Render one queued job into ``<out_dir>/payslips-<id>.zip``.
+
+    Returns the number of payslips written, or ``None`` if the job was not
+    queued (another worker took it).
+    """
+    with engine.begin() as conn:
+        job = conn.execute(
+            text("""
+                UPDATE payslip_jobs SET status = 'running', started_at = CURRENT_TIMESTAMP
+                WHERE id = :id AND status = 'queued'
+                RETURNING pay_period_id, project_id
+            """),
+            {"id": job_id}
+        ).mappings().first()
+    if job is None:
+        return None
+
+    workers = _worker_count() if workers is None else workers
+    where, params = _filters(job)
+    path = os.path.join(out_dir, f"payslips-{job_id}.zip")
+    partial = path + ".part"
+    rendered = 0
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        with engine.connect() as conn:
+            total = conn.execute(
+                text(f"SELECT COUNT(*) FROM payroll p WHERE {where}"), params
+            ).scalar()
+            _update(engine, job_id, total=total)
+
+            # PDFs are already deflated, so the ZIP only stores them.
+            with zipfile.ZipFile(partial, "w", zipfile.ZIP_STORED) as archive:
+                result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                    text(ROWS_SQL.format(where=where)), params
+                ).mappings()
+                pending = deque()
+
+                def drain_one():
+                    nonlocal rendered
+                    for name, pdf in pending.popleft().result():
+                        archive.writestr(name, pdf)
+                        rendered += 1
+                    _update(engine, job_id, rendered=rendered)
+
+                for chunk in result.partitions():
+                    rows = [dict(row) for row in chunk]
+                    if workers <= 1 or total <= chunk_size:
+                        pending.append(_Done(render_batch(rows)))
+                    else:
+                        pending.append(_get_pool().submit(render_batch, rows))
+                    # Bound memory: at most two chunks per worker in flight.
+                    if len(pending) >= max(workers, 1) * 2:
+                        drain_one()
+                while pending:
+                    drain_one()
+
+        os.replace(partial, path)
+        _update(engine, job_id, finished=True, status="done", rendered=rendered, file_path=path)
+        return rendered
+    except Exception as e:
+        if os.path.exists(partial):
+            os.remove(partial)
+        _update(engine, job_id, finished=True, status="failed", error=str(e)[:500])
+        raise
+
+
+class _Done:
+    """Stands in for a future when a chunk is rendered inline."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def start(app, job_id):
+    """Run ``job_id`` on a daemon thread of this process, for the current tenant."""
+    tenant = tenants.current()
+
+    def target():
+        with app.app_context(), tenants.using(tenant):
+            try:
+                run_job(
+                    app.extensions["payslips"].engine, job_id,
+                    output_dir(app, tenant),
+                    chunk_size=app.config.get("PAYSLIP_CHUNK_SIZE", CHUNK_SIZE),
+                )
+            except Exception as e:
+                app.logger.warning("Payslip job %s failed: %s", job_id, e)
+
+    threading.Thread(target=target, name=f"payslips-{job_id}", daemon=True).start()
+
+
+def output_dir(app, tenant=None):
+    """Where a tenant's ZIPs go; job ids are only unique within a tenant."""
+    if tenant is None:
+        return app.config["PAYSLIP_DIR"]
+    return os.path.join(app.config["PAYSLIP_DIR"], tenant)
+
+
+def init_app(app, db):
+    app.config.setdefault("PAYSLIP_DIR", os.path.join(tempfile.gettempdir(), "payslips"))
+    app.extensions["payslips"] = db
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    tenant = os.getenv("TENANT")
+    with app.app_context(), tenants.using(tenant):
+        job_ids = [int(arg) for arg in sys.argv[1:]] or [
+            row[0] for row in db.session.execute(
+                text("SELECT id FROM payslip_jobs WHERE status = 'queued' ORDER BY id")
+            )
+        ]
+        db.session.rollback()
+        for job_id in job_ids:
+            started = time.perf_counter()
+            count = run_job(db.engine, job_id, output_dir(app, tenant))
+            print(f"Job {job_id}: {count} payslip(s) in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,345 @@
+"""Result cache for read-only report queries.
+
+``fetch(execute, sql, params)`` returns the rows of a SELECT as records
+(rows.py), the same as ``fetch_records(execute(sql, params))``, but runs the
+query only once per data version.  An entry is keyed on:
+
+* the SQL with its whitespace normalized, and the parameters;
+* the tenant and the ``data_versions`` counter of every table the SQL reads.
+
+Tables are found by name after FROM and JOIN.  The counters are bumped by
+triggers in the same transaction as every write, so a changed table always
+means a new key and a cached result is never stale.  A query that reads
+anything without a counter is simply run every time, and so is one whose
+tables that rule might miss: comma-separated FROM lists, table functions,
+quoted names.  ``department_tree`` follows ``departments``.
+Versions are read before the query runs.  A write that lands in between
+can then only label newer rows with the older version, never older rows
+with the newer one.
+
+Entries live in a per-process LRU bounded by count and bytes.  With
+``QUERY_CACHE_DIR`` set they are also written to that directory as tagged
+JSON, so every worker (and every worker after a restart) can reuse them.
+The directory is trimmed to ``QUERY_CACHE_DISK_MAX_BYTES``, least recently
+used first.  Only use it for queries that run outside a transaction that
+has written, as the report views do.
+"""
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask import current_app
+from flask.json.tag import JSONTag, TaggedJSONSerializer
+from sqlalchemy import text
+
+from data_versions import version_token, versioned_tables
+from lru import LRUCache
+from rows import fetch_records, record_type
+
+# Tables maintained by triggers on another table, which carries their version.
+DERIVED_TABLES = {"department_tree": "departments"}
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--|/\*|[a-z_][a-z0-9_$]*|\S", re.IGNORECASE)
+_IDENT = re.compile(r"[a-z_][a-z0-9_$]*", re.IGNORECASE)
+# Keywords that end a FROM list at their nesting level.
+_FROM_END = {"where", "group", "having", "window", "order", "limit", "offset", "fetch", "for",
+             "union", "intersect", "except", "returning"}
+_CTE = re.compile(r"\b([a-z_][a-z0-9_]*)\s+as\s+(?:materialized\s+|not\s+materialized\s+)?\(", re.IGNORECASE)
+_SPACE = re.compile(r"('(?:[^']|'')*')|\s+")
+
+
+class QueryCacheError(ValueError):
+    """A query that cannot be cached."""
+
+
+class _TagDecimal(JSONTag):
+    __slots__ = ()
+    key = " dec"
+
+    def check(self, value):
+        return isinstance(value, Decimal)
+
+    def to_json(self, value):
+        return str(value)
+
+    def to_python(self, value):
+        return Decimal(value)
+
+
+class _TagDateTime(JSONTag):
+    __slots__ = ()
+    key = " dt"
+
+    def check(self, value):
+        return isinstance(value, datetime)
+
+    def to_json(self, value):
+        return value.isoformat()
+
+    def to_python(self, value):
+        return datetime.fromisoformat(value)
+
+
+class _TagDate(JSONTag):
+    __slots__ = ()
+    key = " da"
+
+    def check(self, value):
+        return isinstance(value, date)
+
+    def to_json(self, value):
+        return value.isoformat()
+
+    def to_python(self, value):
+        return date.fromisoformat(value)
+
+
+class _TagTime(JSONTag):
+    __slots__ = ()
+    key = " ti"
+
+    def check(self, value):
+        return isinstance(value, time)
+
+    def to_json(self, value):
+        return value.isoformat()
+
+    def to_python(self, value):
+        return time.fromisoformat(value)
+
+
+# Flask's tags round-trip datetimes to the second and not dates or Decimals
+# at all; these keep every value a report query returns exact.
+serializer = TaggedJSONSerializer()
+for _tag in (_TagDecimal, _TagTime, _TagDate, _TagDateTime):
+    serializer.register(_tag, index=0)
+
+
+def normalize(sql):
+    """``sql`` with runs of whitespace outside string literals made one space."""
+    return _SPACE.sub(lambda m: m.group(1) or " ", str(sql)).strip()
+
+
+def tables_read(sql):
+    """Names after FROM/JOIN in ``sql``, without CTE names, lower-cased.
+
+    Raises ``QueryCacheError`` for anything that could hide a table from
+    that rule: a comma in a FROM list, a function or quoted name after
+    FROM/JOIN, or a comment.
+    """
+    tokens = _TOKEN.findall(sql)
+    tables = set()
+    in_from = [False]  # per parenthesis level
+    for i, token in enumerate(tokens):
+        word = token.lower()
+        if token in ("--", "/*"):
+            raise QueryCacheError("Queries with comments are not cached.")
+        if token in ("(", "["):
+            in_from.append(False)
+        elif token in (")", "]"):
+            if len(in_from) > 1:
+                in_from.pop()
+        elif token == ",":
+            if in_from[-1]:
+                raise QueryCacheError("Comma-separated FROM lists are not cached; use JOIN.")
+        elif word in ("from", "join"):
+            in_from[-1] = True
+            following = tokens[i + 1:i + 3]
+            if following[:1] == ["("]:
+                continue  # a subquery, read on its own level
+            if not following or not _IDENT.fullmatch(following[0]) or following[1:] == ["("]:
+                raise QueryCacheError(f"Cannot tell what {token.upper()} {following[0] if following else ''} reads.")
+            tables.add(following[0].lower())
+        elif word in _FROM_END:
+            in_from[-1] = False
+    return tables - {name.lower() for name in _CTE.findall(sql)}
+
+
+def _estimate(rows):
+    # Rough in-memory size; exact accounting would cost more than the query.
+    if not rows:
+        return 64
+    sample = rows[0]
+    per_row = sys.getsizeof(sample) + sum(sys.getsizeof(v) for v in sample)
+    return 64 + per_row * len(rows)
+
+
+class QueryCache:
+    """Per-process LRU of query results, optionally backed by a shared directory."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, directory=None,
+                 disk_max_bytes=512 * 1024 * 1024):
+        # Values are (records, approximate size in bytes).
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=lambda item: item[1])
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        item = self.memory.get(key)
+        if item is not None:
+            return item[0]
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                columns, rows = serializer.loads(f.read())
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        make = record_type(columns)._make
+        records = [make(row) for row in rows]
+        self.memory.set(key, (records, _estimate(records)))
+        return records
+
+    def set(self, key, columns, records):
+        self.memory.set(key, (records, _estimate(records)))
+        if self.directory:
+            try:
+                self._write(key, serializer.dumps([list(columns), [list(r) for r in records]]).encode("utf-8"))
+            except TypeError:
+                # A value the serializer does not know; the memory tier still has it.
+                pass
+
+    def _write(self, key, data):
+        if len(data) > self.disk_max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_bytes()
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._trim()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _trim(self):
+        # Other workers write here too, so start from what is really there
+        # and leave some headroom rather than trimming on every write.
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.8
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+    def clear(self):
+        self.memory.clear()
+        if self.directory:
+            with self._disk_lock:
+                for _, _, path in self._entries():
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                self._disk_bytes = 0
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["disk_bytes"] = self._disk_bytes
+        return stats
+
+
+def cache_key(sql, params=None, extra=()):
+    """The key of ``sql`` with ``params`` at the current data versions.
+
+    Raises ``QueryCacheError`` when the query reads something without a
+    data version or versions are unavailable.
+    """
+    normalized = normalize(sql)
+    if not normalized[:6].lower() == "select":
+        raise QueryCacheError("Only plain SELECT statements are cached.")
+    known = versioned_tables()
+    if known is None:
+        raise QueryCacheError("Data versions are unavailable.")
+    tables = {DERIVED_TABLES.get(t, t) for t in tables_read(normalized)}
+    unknown = tables - known
+    if unknown:
+        raise QueryCacheError(f"No data version for {', '.join(sorted(unknown))}.")
+    token = version_token(*sorted(tables))
+    digest = hashlib.sha256()
+    for part in (token, normalized, repr(sorted((params or {}).items())), repr(tuple(extra))):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def fetch(execute, sql, params=None, extra=()):
+    """Rows of the SELECT ``sql`` as records, from the cache when possible.
+
+    Takes ``extra`` like ``rows.fetch_records``.  The list is the caller's
+    to modify; records are immutable, so sharing them is safe.
+    """
+    cache = current_app.extensions.get("query_cache")
+    key = None
+    if cache is not None:
+        try:
+            key = cache_key(sql, params, extra)
+        except QueryCacheError:
+            pass
+    if key is not None:
+        records = cache.get(key)
+        if records is not None:
+            return list(records)
+
+    result = execute(text(sql) if isinstance(sql, str) else sql, params or {})
+    columns = tuple(result.keys()) + tuple(extra)
+    records = fetch_records(result, extra)
+    if key is not None:
+        cache.set(key, columns, records)
+        return list(records)
+    return records
+
+
+def init_app(app):
+    app.config.setdefault("QUERY_CACHE", True)
+    app.config.setdefault("QUERY_CACHE_MAX_ENTRIES", 256)
+    app.config.setdefault("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+    app.config.setdefault("QUERY_CACHE_DIR", None)
+    app.config.setdefault("QUERY_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024)
+    if app.config["QUERY_CACHE"]:
+        app.extensions["query_cache"] = QueryCache(
+            max_entries=app.config["QUERY_CACHE_MAX_ENTRIES"],
+            max_bytes=app.config["QUERY_CACHE_MAX_BYTES"],
+            directory=app.config["QUERY_CACHE_DIR"],
+            disk_max_bytes=app.config["QUERY_CACHE_DISK_MAX_BYTES"],
+        )
@@ -0,0 +1,139 @@
+"""Memory benchmark for the payroll list page's row handling.
+
+Runs the payroll page query three ways, each in a fresh interpreter, and
+reports wall time, the peak of Python allocations (tracemalloc) and the peak
+RSS of the process:
+
+* ``dicts``   - ``SELECT p.*`` with ``fetchall()`` and one dict per row (the
+  old view code)
+* ``records`` - the page's columns only, as records from ``fetch_records``
+* ``lazy``    - the page's columns only, streamed through ``LazyRecords``
+  the way the template consumes them
+
+Point ``DATABASE_URL`` at a scratch database; ``--seed`` fills it first:
+
+    python rowbench.py --seed 500000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine, text
+
+OLD_SQL = """
+    SELECT p.*, e.name, e.position, pr.project_name, pr.id as project_id
+    FROM payroll p
+    JOIN employees e ON p.employee_id = e.id
+    LEFT JOIN projects pr ON p.project_id = pr.id
+    ORDER BY p.pay_period_end DESC, p.created_at DESC
+"""
+
+PAGE_SQL = """
+    SELECT p.id, e.name, e.position, pr.project_name,
+           p.pay_period_start, p.pay_period_end, p.basic_salary, p.overtime,
+           p.deductions, p.net_pay, p.status, p.period_closed
+    FROM payroll p
+    JOIN employees e ON p.employee_id = e.id
+    LEFT JOIN projects pr ON p.project_id = pr.id
+    ORDER BY p.pay_period_end DESC, p.created_at DESC
+"""
+
+
+def seed(engine, rows):
+    """Insert ``rows`` payroll rows spread over 1,000 employees and 20 projects."""
+    with engine.begin() as conn:
+        department_id = conn.execute(text("""
+            INSERT INTO departments (name) VALUES ('Bench')
+            ON CONFLICT ((COALESCE(parent_id, 0)), name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING id
+        """)).scalar()
+        conn.execute(text("""
+            INSERT INTO employees (name, position, department_id)
+            SELECT 'Bench ' || g, 'Mason', :department_id FROM generate_series(1, 1000) g
+        """), {"department_id": department_id})
+        conn.execute(text("""
+            INSERT INTO projects (project_name, department_id)
+            SELECT 'Bench project ' || g, :department_id FROM generate_series(1, 20) g
+        """), {"department_id": department_id})
+        conn.execute(text("""
+            INSERT INTO payroll (employee_id, project_id, pay_period_start, pay_period_end,
+                                 daily_rate, days_worked, basic_salary, overtime,
+                                 gross_pay, net_pay)
+            WITH e AS (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n
+                FROM employees WHERE name LIKE 'Bench %'
+            ), pr AS (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n
+                FROM projects WHERE project_name LIKE 'Bench project %'
+            )
+            SELECT e.id, pr.id,
+                   DATE '2000-01-01' + (g / 20000) * 15,
+                   DATE '2000-01-01' + (g / 20000) * 15 + 14,
+                   600, 12, 7200, 150, 7350, 7350
+            FROM generate_series(0, :rows - 1) g
+            JOIN e ON e.n = g % 1000
+            JOIN pr ON pr.n = g / 1000 % 20
+        """), {"rows": rows})
+
+
+def run_mode(engine, mode):
+    from rows import LazyRecords, fetch_records
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        if mode == "dicts":
+            rows = [dict(row._mapping) for row in conn.execute(text(OLD_SQL)).fetchall()]
+            rendered = sum(len(f"{r['name']}{r['net_pay']}{r['status']}") for r in rows)
+        elif mode == "records":
+            rows = fetch_records(conn.execute(text(PAGE_SQL)))
+            rendered = sum(len(f"{r.name}{r.net_pay}{r.status}") for r in rows)
+        else:
+            rows = LazyRecords(conn.execute, text(PAGE_SQL))
+            rendered = sum(len(f"{r.name}{r.net_pay}{r.status}") for r in rows) if rows else 0
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 2),
+        "python_peak_mb": round(peak / 2 ** 20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rendered_chars": rendered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0, help="insert this many payroll rows first")
+    parser.add_argument("--modes", default="dicts,records,lazy")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    if args.mode:
+        print(json.dumps(run_mode(engine, args.mode)))
+        return
+
+    if args.seed:
+        seed(engine, args.seed)
+    with engine.connect() as conn:
+        total = conn.execute(text("SELECT COUNT(*) FROM payroll")).scalar()
+    print(f"payroll rows: {total}")
+    print(f"{'mode':<8} {'seconds':>8} {'python peak MB':>15} {'max RSS MB':>11}")
+    here = os.path.dirname(os.path.abspath(__file__))
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode],
+            cwd=here, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{mode:<8} {result['seconds']:>8} {result['python_peak_mb']:>15} {result['max_rss_mb']:>11}")
+
+
+if __name__ == "__main__":
+    main()
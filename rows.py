@@ -0,0 +1,116 @@
+"""Lightweight records for list views.
+
+``dict(row)`` per row costs a hash table on top of the ``Row`` it was built
+from, and ``fetchall()`` keeps every ``Row`` alive until the page is done.
+Views instead get records: ``namedtuple`` subclasses (one class per column
+list, cached) that hold the values in a single tuple and still answer
+``record.name``, ``record['name']`` and ``record.get('name')`` in Python and
+in Jinja.
+
+``fetch_records`` is the eager form for small lists and JSON.
+``LazyRecords`` is for big pages: the query only runs when the template first
+touches the list, so a cached fragment skips it entirely.  Rows then stream
+from a server-side cursor in batches and are dropped once rendered.
+"""
+from collections import namedtuple
+
+STREAM_BATCH = 1000
+
+_record_types = {}
+
+
+class _RecordMixin:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self._fields
+
+
+def record_type(fields):
+    """Record class for a column list; ``fields`` must be valid identifiers."""
+    fields = tuple(fields)
+    cls = _record_types.get(fields)
+    if cls is None:
+        cls = type("Record", (_RecordMixin, namedtuple("Record", fields)), {"__slots__": ()})
+        _record_types[fields] = cls
+    return cls
+
+
+def _maker(result, extra):
+    make = record_type(tuple(result.keys()) + tuple(extra))._make
+    if not extra:
+        return make
+    padding = (None,) * len(extra)
+    return lambda row: make(tuple(row) + padding)
+
+
+def as_record(row, extra=()):
+    """One ``Row`` as a record, or ``None``."""
+    if row is None:
+        return None
+    return record_type(tuple(row._fields) + tuple(extra))._make(tuple(row) + (None,) * len(extra))
+
+
+def fetch_records(result, extra=()):
+    """Every row of ``result`` as a record.
+
+    ``extra`` names fields the view fills in afterwards (with ``_replace``);
+    they start out as ``None``.
+    """
+    make = _maker(result, extra)
+    return [make(row) for row in result]
+
+
+class LazyRecords:
+    """Records of a query that runs on first use and streams its rows.
+
+    Truthiness fetches only the first batch, so ``{% if rows %}...{% for %}``
+    runs the query once.  Iterating again re-runs it.
+    """
+
+    def __init__(self, execute, statement, params=None, batch_size=STREAM_BATCH):
+        self._execute = execute
+        self._statement = statement.execution_options(stream_results=True, max_row_buffer=batch_size)
+        self._params = params or {}
+        self._batch_size = batch_size
+        self._pending = None
+
+    def _batches(self, result):
+        # Plain fetchmany(): Result.partitions() holds on to the rows it has
+        # already handed out.
+        while True:
+            batch = result.fetchmany(self._batch_size)
+            if not batch:
+                return
+            yield batch
+
+    def _open(self):
+        result = self._execute(self._statement, self._params)
+        make = _maker(result, ())
+        batches = self._batches(result)
+        head = [make(row) for row in next(batches, [])]
+        return head, make, batches
+
+    def __bool__(self):
+        if self._pending is None:
+            self._pending = self._open()
+        return bool(self._pending[0])
+
+    def __iter__(self):
+        head, make, batches = self._pending or self._open()
+        self._pending = None
+        yield from head
+        for batch in batches:
+            for row in batch:
+                yield make(row)
@@ -0,0 +1,148 @@
+"""Global search over reports, employees and payroll history.
+
+Every searchable row has one ``tsvector`` in ``search_documents``, built and
+kept current by triggers in system_db.sql.  A search is one ranked query
+against that table's GIN index, followed by a lookup of the page's rows in
+their own tables, so the cost follows the number of matches, not the size
+of the history.
+
+Queries are free text.  Every word matches as a prefix (``jua`` finds
+Juan), all words must match, and ISO dates match as typed (``2025-01-15``,
+or ``2025-01`` for the whole month).  Month names work too: ``march 2025``.
+What a user may find follows the pages they may open (``SCOPES``).
+"""
+import re
+
+from sqlalchemy import text
+
+from rows import fetch_records
+
+PER_PAGE = 20
+MAX_TERMS = 8
+
+KINDS = {"report": "Report", "employee": "Employee", "payroll": "Payroll"}
+
+# Kinds each role may search, matching the pages they can open.
+SCOPES = {
+    "ADMIN": ("report", "employee", "payroll"),
+    "MANAGER": ("report", "employee", "payroll"),
+    "ASSISTANT MANAGER": ("report", "employee", "payroll"),
+    "EMPLOYEE": ("employee", "payroll"),
+}
+
+# Display columns of a page of hits, per kind.
+DETAILS_SQL = {
+    "report": """
+        SELECT id, title, report_date, created_by, description
+        FROM reports WHERE id = ANY(:ids)
+    """,
+    "employee": """
+        SELECT e.id, e.name, e.position, d.name AS department, e.status
+        FROM employees e
+        JOIN departments d ON d.id = e.department_id
+        WHERE e.id = ANY(:ids)
+    """,
+    "payroll": """
+        SELECT p.id, e.name, p.project_id, pr.project_name, p.pay_period_start, p.pay_period_end,
+               p.status, p.net_pay
+        FROM payroll p
+        JOIN employees e ON e.id = p.employee_id
+        LEFT JOIN projects pr ON pr.id = p.project_id
+        WHERE p.id = ANY(:ids)
+    """,
+}
+
+_DATE = re.compile(r"^\d{4}(-\d{1,2}){0,2}$")
+_WORD = re.compile(r"\w+")
+
+
+def _lexeme(word):
+    return "'" + word.lower().replace("'", "''") + "'"
+
+
+def to_tsquery(query):
+    """``query`` as ``to_tsquery('simple', ...)`` text, or ``None`` if it has no words.
+
+    Dates become phrases of the tokens Postgres splits them into
+    (``2025 <-> -01``); other words become prefix matches.
+    """
+    terms = []
+    for term in query.split()[:MAX_TERMS]:
+        if _DATE.match(term):
+            year, *rest = term.split("-")
+            parts = [_lexeme(year)] + [_lexeme("-" + part.zfill(2)) for part in rest]
+            terms.append("(" + " <-> ".join(parts) + ")")
+        else:
+            terms.extend(_lexeme(word) + ":*" for word in _WORD.findall(term))
+    return " & ".join(terms) or None
+
+
+def kinds_for(role, kind=None):
+    """Kinds ``role`` may search, narrowed to ``kind`` if one is asked for."""
+    allowed = SCOPES.get((role or "").upper(), ())
+    if kind:
+        return (kind,) if kind in allowed else ()
+    return allowed
+
+
+def search(execute, query, kinds, page=1, per_page=PER_PAGE):
+    """One page of hits for ``query`` among ``kinds``, best first.
+
+    Returns ``(hits, total, counts)``: ``hits`` is a list of ``(kind,
+    record)``, ``total`` the number of matches over all pages and ``counts``
+    the matches per kind.
+    """
+    tsquery = to_tsquery(query or "")
+    if tsquery is None or not kinds:
+        return [], 0, {}
+
+    found = execute(
+        text("""
+            WITH hits AS (
+                SELECT d.kind, d.ref_id, ts_rank_cd(d.document, q) AS rank
+                FROM search_documents d, to_tsquery('simple', :query) AS q
+                WHERE d.document @@ q AND d.kind = ANY(:kinds)
+                  AND (d.kind <> 'employee'
+                       OR d.ref_id IN (SELECT id FROM employees WHERE archived_at IS NULL))
+            ), page AS (
+                SELECT kind, ref_id, rank FROM hits
+                ORDER BY rank DESC, kind, ref_id DESC
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT (SELECT json_object_agg(kind, n) FROM (SELECT kind, COUNT(*) AS n FROM hits GROUP BY kind) c)
+                       AS counts,
+                   (SELECT json_agg(json_build_array(kind, ref_id) ORDER BY rank DESC, kind, ref_id DESC) FROM page)
+                       AS page
+        """),
+        {"query": tsquery, "kinds": list(kinds), "limit": per_page, "offset": (max(page, 1) - 1) * per_page}
+    ).first()
+    counts = found.counts or {}
+    ranked = found.page or []
+
+    details = {}
+    for kind in {kind for kind, _ in ranked}:
+        ids = [ref_id for k, ref_id in ranked if k == kind]
+        details[kind] = {r.id: r for r in fetch_records(execute(text(DETAILS_SQL[kind]), {"ids": ids}))}
+    hits = [(kind, details[kind][ref_id]) for kind, ref_id in ranked if ref_id in details[kind]]
+    return hits, sum(counts.values()), counts
+
+
+def reindex(execute):
+    """Rebuild every document, e.g. after loading rows with triggers disabled."""
+    execute(text("TRUNCATE search_documents"))
+    for kind, table in (("employee", "employees"), ("report", "reports"), ("payroll", "payroll")):
+        execute(text(f"SELECT search_reindex(:kind, ARRAY(SELECT id FROM {table}))"), {"kind": kind})
+
+
+if __name__ == "__main__":
+    import tenants
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    with app.app_context():
+        for _ in tenants.each_tenant(app, db.engine):
+            with db.engine.begin() as conn:
+                reindex(conn.execute)
+        print("Search index rebuilt")
@@ -0,0 +1,298 @@
+"""Server-side sessions: the cookie carries only an opaque session id.
+
+Session data (username, role, pending flash messages) lives in a store:
+
+* ``MemorySessionStore`` – per-process LRU with TTL (single-process/dev use).
+* ``PostgresSessionStore`` – the ``user_sessions`` table, fronted by a small
+  per-process LRU so most authenticated requests never reach the database.
+  Entries in the front cache are trusted for ``SESSION_CACHE_SECONDS``, which
+  bounds how long a revocation done by another worker can take to apply.
+
+Sessions are loaded lazily on first access, so requests that never look at
+``session`` (static files, public JSON) do not touch the store at all.
+Anonymous visitors get a stored id too (a flash message is enough), so the
+id is replaced whenever privileges change (``regenerate``): an id planted
+before login never becomes an authenticated session.
+
+In multi-tenant mode every tenant shares one store.  Sessions record their
+tenant, and revoking or counting sessions by username stays within the
+current tenant.
+"""
+import random
+import secrets
+import time
+
+from flask import current_app
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import text
+
+import tenants
+from lru import LRUCache
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(SessionMixin):
+    """Session whose data is fetched from the store on first access."""
+
+    def __init__(self, store, sid=None):
+        self._store = store
+        self.sid = sid
+        self._data = None
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+
+    @property
+    def new(self):
+        return self.sid is None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _load(self):
+        if self._data is None:
+            self._data = (self._store.load(self.sid) if self.sid else None) or {}
+            if self.sid and not self._data:
+                # Unknown, expired or revoked id: start a fresh session.
+                self.sid = None
+        self.accessed = True
+        return self._data
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def clear(self):
+        self._load()
+        if self._data:
+            self._data.clear()
+            self.modified = True
+
+    def regenerate(self):
+        """Keep the data but move it to a new id when the response is saved."""
+        self._load()
+        self.rotate = True
+        self.modified = True
+
+
+class MemorySessionStore:
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=64 * 1024 * 1024,
+                               sizeof=lambda item: len(item[2]))
+
+    def load(self, sid):
+        item = self._cache.get(sid)
+        if item is None:
+            return None
+        expires_at, _, payload = item
+        if expires_at < time.time():
+            self._cache.pop(sid)
+            return None
+        return serializer.loads(payload)
+
+    def save(self, sid, data):
+        owner = (data.get("tenant") or "", data.get("username"))
+        self._cache.set(sid, (time.time() + self.ttl, owner, serializer.dumps(data)))
+
+    def delete(self, sid):
+        self._cache.pop(sid)
+
+    def revoke_user(self, username, tenant=""):
+        sids = [sid for sid, (_, owner, _) in self._cache.items() if owner == (tenant, username)]
+        for sid in sids:
+            self._cache.pop(sid)
+        return len(sids)
+
+    def count_by_user(self, tenant=""):
+        now = time.time()
+        counts = {}
+        for _, (expires_at, (owner_tenant, owner), _) in self._cache.items():
+            if owner and owner_tenant == tenant and expires_at >= now:
+                counts[owner] = counts.get(owner, 0) + 1
+        return counts
+
+
+class PostgresSessionStore:
+
+    SWEEP_PROBABILITY = 0.005
+
+    def __init__(self, db, ttl, cache_seconds=5, max_entries=10000):
+        self.db = db
+        self.ttl = ttl
+        self.cache_seconds = cache_seconds
+        self._front = LRUCache(max_entries=max_entries, max_bytes=32 * 1024 * 1024,
+                               sizeof=lambda item: len(item[1]))
+
+    def load(self, sid):
+        cached = self._front.get(sid)
+        if cached is not None and cached[0] > time.monotonic():
+            return serializer.loads(cached[1])
+
+        with self.db.engine.connect() as conn:
+            payload = conn.execute(
+                text("""
+                    SELECT data FROM user_sessions
+                    WHERE id = :id AND expires_at > timezone('UTC', now())
+                """),
+                {"id": sid}
+            ).scalar()
+        if payload is None:
+            self._front.pop(sid)
+            return None
+        self._front.set(sid, (time.monotonic() + self.cache_seconds, payload))
+        return serializer.loads(payload)
+
+    def save(self, sid, data):
+        payload = serializer.dumps(data)
+        with self.db.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO user_sessions (id, tenant, username, data, expires_at)
+                    VALUES (:id, :tenant, :username, :data,
+                            timezone('UTC', now()) + make_interval(secs => :ttl))
+                    ON CONFLICT (id) DO UPDATE
+                        SET tenant = EXCLUDED.tenant,
+                            username = EXCLUDED.username,
+                            data = EXCLUDED.data,
+                            expires_at = EXCLUDED.expires_at
+                """),
+                {"id": sid, "tenant": data.get("tenant") or "", "username": data.get("username"),
+                 "data": payload, "ttl": self.ttl}
+            )
+            if random.random() < self.SWEEP_PROBABILITY:
+                conn.execute(text("DELETE FROM user_sessions WHERE expires_at <= timezone('UTC', now())"))
+        self._front.set(sid, (time.monotonic() + self.cache_seconds, payload))
+
+    def delete(self, sid):
+        self._front.pop(sid)
+        with self.db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM user_sessions WHERE id = :id"), {"id": sid})
+
+    def revoke_user(self, username, tenant=""):
+        with self.db.engine.begin() as conn:
+            sids = conn.execute(
+                text("DELETE FROM user_sessions WHERE tenant = :tenant AND username = :username RETURNING id"),
+                {"tenant": tenant, "username": username}
+            ).scalars().all()
+        for sid in sids:
+            self._front.pop(sid)
+        return len(sids)
+
+    def count_by_user(self, tenant=""):
+        with self.db.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT username, COUNT(*) FROM user_sessions
+                    WHERE expires_at > timezone('UTC', now()) AND username IS NOT NULL
+                      AND tenant = :tenant
+                    GROUP BY username
+                """),
+                {"tenant": tenant}
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+class ServerSideSessionInterface(SessionInterface):
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        return ServerSession(self.store, sid)
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            return
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        response.vary.add("Cookie")
+
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified and session.sid:
+            return
+
+        if session.rotate and session.sid:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, dict(session))
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app, db):
+    """Install the configured session backend (``SESSION_BACKEND``)."""
+    backend = app.config.setdefault("SESSION_BACKEND", "postgres")
+    ttl = int(app.config.setdefault("SESSION_TTL_SECONDS", 12 * 60 * 60))
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        store = MemorySessionStore(ttl)
+    elif backend == "postgres":
+        store = PostgresSessionStore(db, ttl, cache_seconds=app.config.get("SESSION_CACHE_SECONDS", 5))
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    app.session_interface = ServerSideSessionInterface(store)
+    app.extensions["session_store"] = store
+    return store
+
+
+def regenerate(session):
+    """Give ``session`` a fresh id; call on login and on a change of role.
+
+    Signed-cookie sessions have no id to fix, so they are left alone.
+    """
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+def revoke_user_sessions(username):
+    """Sign ``username`` of the current tenant out everywhere.
+
+    Returns the number of sessions ended.
+    """
+    store = current_app.extensions.get("session_store")
+    if store is None or not username:
+        return 0
+    return store.revoke_user(username, tenants.current() or "")
+
+
+def active_session_counts():
+    """``{username: active session count}``, empty for cookie sessions."""
+    store = current_app.extensions.get("session_store")
+    return store.count_by_user(tenants.current() or "") if store is not None else {}
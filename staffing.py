@@ -0,0 +1,122 @@
+"""Staffing: who is assigned where and when, and overlapping assignments.
+
+Every ``project_employees`` row carries its project's dates as a
+``daterange`` (``period``).  Triggers in system_db.sql keep it in step when
+a project's dates change or it is archived; archiving empties it.  Two
+indexes answer every question here without scanning the table:
+
+* a GiST index on ``period``, an interval index over all assignments.
+  "Which assignments overlap this window" is one ``&&`` probe into it,
+  logarithmic in the number of assignments plus the matches.
+* a B-tree on ``(employee_id, project_id)``.  "Is this employee free" and
+  "what overlaps this employee's assignment" look at that employee's few
+  rows only.
+
+An employee is booked once per project, and two assignments of the same
+employee whose periods overlap are a conflict.  Conflicts are reported when
+assignments are saved, and listed on the Staffing page.  They are not
+refused: a foreman may well cover two sites.
+"""
+from datetime import date
+
+from sqlalchemy import text
+
+from departments import subtree_filter
+from rows import fetch_records
+
+CONFLICTS_SHOWN = 5
+
+# Overlapping pairs of assignments, each pair once.
+CONFLICTS_SQL = """
+    SELECT a.employee_id, e.name, a.project_id, pa.project_name,
+           b.project_id AS other_project_id, pb.project_name AS other_project_name,
+           lower(a.period * b.period) AS overlap_start,
+           upper(a.period * b.period) - 1 AS overlap_end
+    FROM project_employees a
+    JOIN project_employees b
+      ON b.employee_id = a.employee_id AND b.project_id <> a.project_id AND b.period && a.period
+    JOIN employees e ON e.id = a.employee_id AND e.archived_at IS NULL
+    JOIN projects pa ON pa.id = a.project_id
+    JOIN projects pb ON pb.id = b.project_id
+    WHERE {where}
+    ORDER BY e.name, lower(a.period * b.period), pa.project_name
+"""
+
+
+class StaffingError(ValueError):
+    """A date window that is not valid."""
+
+
+def window(start, end):
+    """``(start, end)`` as dates from ISO strings, blanks meaning open-ended."""
+    try:
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except (TypeError, ValueError):
+        raise StaffingError("Dates must look like 2026-01-31.") from None
+    if start and end and end < start:
+        raise StaffingError("The end date is before the start date.")
+    return start, end
+
+
+def _range_params(start, end):
+    return {"start": start, "end": end}
+
+
+# Both ends inclusive, NULL for open; a parameterless form of daterange().
+WINDOW = "daterange(CAST(:start AS DATE), CAST(:end AS DATE), '[]')"
+
+
+def free_employees(execute, start, end, department_id=None):
+    """Active employees with no assignment overlapping ``start..end``."""
+    return fetch_records(execute(
+        text(f"""
+            SELECT e.id, e.name, e.position, d.name AS department
+            FROM employees e
+            JOIN departments d ON d.id = e.department_id
+            WHERE e.archived_at IS NULL AND e.status = 'active'
+              {subtree_filter('e.department_id', department_id)}
+              AND NOT EXISTS (
+                  SELECT 1 FROM project_employees pe
+                  WHERE pe.employee_id = e.id AND pe.period && {WINDOW}
+              )
+            ORDER BY e.name
+        """),
+        {**_range_params(start, end), "department_id": department_id}
+    ))
+
+
+def conflicts(execute, start=None, end=None):
+    """Overlapping assignment pairs with any overlap inside ``start..end``."""
+    return fetch_records(execute(
+        text(CONFLICTS_SQL.format(
+            where=f"a.project_id < b.project_id AND a.period && {WINDOW} AND b.period && {WINDOW} "
+                  f"AND (a.period * b.period) && {WINDOW}"
+        )),
+        _range_params(start, end)
+    ))
+
+
+def project_conflicts(execute, project_id, employee_ids=None):
+    """Assignments elsewhere that overlap ``project_id``'s, optionally for some employees."""
+    return fetch_records(execute(
+        text(CONFLICTS_SQL.format(
+            where="a.project_id = :project_id"
+                  + (" AND a.employee_id = ANY(:employee_ids)" if employee_ids is not None else "")
+        )),
+        {"project_id": project_id,
+         "employee_ids": [int(e) for e in employee_ids] if employee_ids is not None else None}
+    ))
+
+
+def describe(rows, limit=CONFLICTS_SHOWN):
+    """One-line summary of conflicts for a flash message, or ``None``."""
+    if not rows:
+        return None
+    shown = "; ".join(
+        f"{r.name} is also on {r.other_project_name} "
+        f"({r.overlap_start or 'open'} to {r.overlap_end or 'open'})"
+        for r in rows[:limit]
+    )
+    more = f" and {len(rows) - limit} more" if len(rows) > limit else ""
+    return f"Overlapping assignments: {shown}{more}."
@@ -0,0 +1,55 @@
+// Keeps the attendance kiosk usable offline (see kiosk.py). The page is
+// fetched from the network when possible and from the cache otherwise;
+// stylesheets, fonts and images come from the cache first. Syncs are
+// never cached: the page keeps unsent entries in IndexedDB itself.
+const CACHE = "kiosk-v1";
+const PAGE = new URL(self.registration.scope).pathname;
+const ASSETS = ["style", "font", "image"];
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE)
+      .then((cache) => fetch(PAGE, { credentials: "same-origin" })
+        .then((response) => (response.ok && !response.redirected ? cache.put(PAGE, response) : null)))
+      .catch(() => null)
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => key !== CACHE).map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") {
+    return;
+  }
+
+  if (request.mode === "navigate" && new URL(request.url).pathname === PAGE) {
+    event.respondWith(
+      fetch(request)
+        .then((response) => {
+          // A redirect means the session ended; keep the last good page.
+          if (response.ok && !response.redirected) {
+            const copy = response.clone();
+            caches.open(CACHE).then((cache) => cache.put(PAGE, copy));
+          }
+          return response;
+        })
+        .catch(() => caches.match(PAGE))
+    );
+  } else if (ASSETS.includes(request.destination)) {
+    event.respondWith(
+      caches.match(request).then((cached) => cached || fetch(request).then((response) => {
+        const copy = response.clone();
+        caches.open(CACHE).then((cache) => cache.put(request, copy));
+        return response;
+      }))
+    );
+  }
+});
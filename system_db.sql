@@ -1,5 +1,71 @@
 -- PostgreSQL-compatible Employee DB with ENUMs converted to CHECKs
 
+-- --------------------------------------------------------
+-- Table: departments
+-- Org-unit tree. department_tree is its closure table: one row per
+-- (ancestor, descendant) pair, each unit paired with itself at depth 0,
+-- kept up to date by the triggers below. Everything under a unit is then
+-- one indexed lookup: descendant_id IN (... WHERE ancestor_id = :id).
+-- --------------------------------------------------------
+CREATE TABLE departments (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    parent_id INT DEFAULT NULL,
+    CONSTRAINT fk_departments_parent FOREIGN KEY (parent_id) REFERENCES departments(id) ON DELETE RESTRICT
+);
+
+CREATE UNIQUE INDEX uq_departments_parent_name ON departments ((COALESCE(parent_id, 0)), name);
+
+CREATE TABLE department_tree (
+    ancestor_id INT NOT NULL REFERENCES departments(id) ON DELETE CASCADE,
+    descendant_id INT NOT NULL REFERENCES departments(id) ON DELETE CASCADE,
+    depth INT NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX idx_department_tree_descendant ON department_tree (descendant_id, depth);
+
+CREATE OR REPLACE FUNCTION department_tree_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO department_tree (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, NEW.id, depth + 1 FROM department_tree WHERE descendant_id = NEW.parent_id
+    UNION ALL
+    SELECT NEW.id, NEW.id, 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Moving a unit re-links its whole subtree: paths from the unit's old
+-- ancestors into the subtree are dropped and paths from the new parent's
+-- ancestors added.
+CREATE OR REPLACE FUNCTION department_tree_move() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM department_tree WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id) THEN
+        RAISE EXCEPTION 'A department cannot move under itself or one of its sub-units'
+            USING ERRCODE = 'check_violation';
+    END IF;
+
+    DELETE FROM department_tree t
+    USING department_tree sub, department_tree sup
+    WHERE sub.ancestor_id = NEW.id
+      AND sup.descendant_id = NEW.id AND sup.ancestor_id <> NEW.id
+      AND t.ancestor_id = sup.ancestor_id AND t.descendant_id = sub.descendant_id;
+
+    INSERT INTO department_tree (ancestor_id, descendant_id, depth)
+    SELECT sup.ancestor_id, sub.descendant_id, sup.depth + sub.depth + 1
+    FROM department_tree sup
+    JOIN department_tree sub ON sub.ancestor_id = NEW.id
+    WHERE sup.descendant_id = NEW.parent_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_departments_tree_insert AFTER INSERT ON departments
+    FOR EACH ROW EXECUTE FUNCTION department_tree_insert();
+CREATE TRIGGER trg_departments_tree_move AFTER UPDATE OF parent_id ON departments
+    FOR EACH ROW WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+    EXECUTE FUNCTION department_tree_move();
+
 -- --------------------------------------------------------
 -- Table: employees
 -- --------------------------------------------------------
@@ -7,23 +73,37 @@ CREATE TABLE employees (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
     position VARCHAR(100) NOT NULL,
-    department VARCHAR(100) NOT NULL,
+    department_id INT NOT NULL,
+    email VARCHAR(255) DEFAULT NULL,
     status TEXT DEFAULT 'active' CHECK (status IN ('active','inactive','leave')),
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT NULL,
+    CONSTRAINT fk_employees_department FOREIGN KEY (department_id) REFERENCES departments(id) ON DELETE RESTRICT
 );
 
+-- Active-only lookups; archived (soft-deleted) rows stay out of the index.
+CREATE INDEX idx_employees_active_name ON employees (name) WHERE archived_at IS NULL;
+CREATE INDEX idx_employees_department ON employees (department_id);
+
 -- --------------------------------------------------------
 -- Table: projects
 -- --------------------------------------------------------
 CREATE TABLE projects (
     id SERIAL PRIMARY KEY,
     project_name VARCHAR(150) NOT NULL,
-    department VARCHAR(100) NOT NULL,
+    department_id INT NOT NULL,
     start_date DATE,
     end_date DATE,
-    status TEXT DEFAULT 'Ongoing' CHECK (status IN ('Ongoing','Completed','On Hold'))
+    status TEXT DEFAULT 'Ongoing' CHECK (status IN ('Ongoing','Completed','On Hold')),
+    archived_at TIMESTAMP DEFAULT NULL,
+    CONSTRAINT fk_projects_department FOREIGN KEY (department_id) REFERENCES departments(id) ON DELETE RESTRICT
 );
 
+CREATE INDEX idx_projects_department ON projects (department_id);
+
+-- Natural key: one active project per name (also serves active-only lookups).
+CREATE UNIQUE INDEX uq_projects_active_name ON projects (project_name) WHERE archived_at IS NULL;
+
 -- --------------------------------------------------------
 -- Table: attendance
 -- --------------------------------------------------------
@@ -32,9 +112,49 @@ CREATE TABLE attendance (
     employee_id INT NOT NULL,
     date DATE NOT NULL,
     status TEXT DEFAULT 'Present' CHECK (status IN ('Present','Absent','Leave','Late','Half Day','Sick Leave','Work From Home')),
+    -- Bumped by every edit; edits only apply to the version they were loaded at.
+    version INT NOT NULL DEFAULT 1,
+    -- Filled from clock_events by timesheets.py; NULL for manual entries.
+    clock_in TIMESTAMP,
+    clock_out TIMESTAMP,
+    worked_hours DECIMAL(5,2),
+    -- When, and whether by a supervisor, the status was last set; offline
+    -- kiosk syncs resolve conflicts with them (see kiosk.py).
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    recorded_by_supervisor BOOLEAN NOT NULL DEFAULT FALSE,
     CONSTRAINT fk_attendance_employee FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
 );
 
+CREATE INDEX idx_attendance_date ON attendance (date);
+-- Natural key: one attendance record per employee per day.
+CREATE UNIQUE INDEX uq_attendance_employee_date ON attendance (employee_id, date);
+
+-- --------------------------------------------------------
+-- Table: clock_events
+-- Raw clock-in/out punches from kiosks and biometric devices. Append-only
+-- and not audited; timesheets.py folds them into attendance.
+-- --------------------------------------------------------
+CREATE TABLE clock_events (
+    id BIGSERIAL PRIMARY KEY,
+    employee_id INT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    event_time TIMESTAMP NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('in','out')),
+    device_id TEXT NOT NULL,
+    -- The device's own id for the punch, so a resent batch is not counted twice.
+    device_event_id TEXT,
+    received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_clock_events_employee_time ON clock_events (employee_id, event_time);
+CREATE UNIQUE INDEX uq_clock_events_device_event ON clock_events (device_id, device_event_id);
+
+-- Employee-days with new punches, waiting to be folded into attendance.
+CREATE TABLE clock_dirty_days (
+    employee_id INT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    work_date DATE NOT NULL,
+    PRIMARY KEY (employee_id, work_date)
+);
+
 -- --------------------------------------------------------
 -- Table: payroll
 -- --------------------------------------------------------
@@ -54,6 +174,7 @@ CREATE TABLE payroll (
     ot_amount DECIMAL(10,2) DEFAULT 0.00,
     holiday_pay DECIMAL(10,2) DEFAULT 0.00,
     holiday_pay_amount DECIMAL(10,2) DEFAULT 0.00,
+    night_diff DECIMAL(10,2) DEFAULT 0.00,
     others DECIMAL(10,2) DEFAULT 0.00,
     cash_advance DECIMAL(10,2) DEFAULT 0.00,
     total_deductions DECIMAL(10,2) DEFAULT 0.00,
@@ -64,10 +185,58 @@ CREATE TABLE payroll (
     deductions DECIMAL(10,2) DEFAULT 0.00,
     status TEXT DEFAULT 'Pending',
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INT NOT NULL DEFAULT 1,
+    -- Set when the row's pay period is closed; closed rows are read-only.
+    period_closed BOOLEAN NOT NULL DEFAULT FALSE,
     CONSTRAINT fk_payroll_employee FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE,
     CONSTRAINT fk_payroll_project FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
 );
 
+-- Natural key: one payroll row per employee, project and pay period
+-- (COALESCE so rows without a project are covered too).
+CREATE UNIQUE INDEX uq_payroll_employee_project_period
+    ON payroll (employee_id, (COALESCE(project_id, 0)), pay_period_start, pay_period_end);
+
+-- Live aggregation only ever reads rows of periods that are not closed.
+CREATE INDEX idx_payroll_open_project ON payroll (project_id) WHERE NOT period_closed;
+CREATE INDEX idx_payroll_period ON payroll (pay_period_start, pay_period_end);
+
+-- --------------------------------------------------------
+-- Table: holidays
+-- Holiday calendar read by pay_rules.py; other dates are regular days or
+-- rest days.
+-- --------------------------------------------------------
+CREATE TABLE holidays (
+    id SERIAL PRIMARY KEY,
+    holiday_date DATE NOT NULL UNIQUE,
+    name VARCHAR(100) NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('Special Holiday','Regular Holiday'))
+);
+
+-- --------------------------------------------------------
+-- Table: pay_rules
+-- Pay multipliers per day type (see pay_rules.py). Rows without a project
+-- are the defaults; a project row overrides its day type for that project.
+-- --------------------------------------------------------
+CREATE TABLE pay_rules (
+    id SERIAL PRIMARY KEY,
+    project_id INT DEFAULT NULL,
+    day_type TEXT NOT NULL CHECK (day_type IN ('Regular Day','Rest Day','Special Holiday','Regular Holiday')),
+    worked_multiplier DECIMAL(5,3) NOT NULL,
+    ot_multiplier DECIMAL(5,3) NOT NULL,
+    night_multiplier DECIMAL(5,3) NOT NULL,
+    unworked_multiplier DECIMAL(5,3) NOT NULL DEFAULT 0,
+    CONSTRAINT fk_pay_rules_project FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+CREATE UNIQUE INDEX uq_pay_rules_project_day_type ON pay_rules ((COALESCE(project_id, 0)), day_type);
+
+INSERT INTO pay_rules (day_type, worked_multiplier, ot_multiplier, night_multiplier, unworked_multiplier) VALUES
+('Regular Day', 1.00, 1.25, 0.10, 0),
+('Rest Day', 1.30, 1.69, 0.13, 0),
+('Special Holiday', 1.30, 1.69, 0.13, 0),
+('Regular Holiday', 2.00, 2.60, 0.20, 1.00);
+
 -- --------------------------------------------------------
 -- Table: project_employees
 -- --------------------------------------------------------
@@ -75,10 +244,49 @@ CREATE TABLE project_employees (
     id SERIAL PRIMARY KEY,
     project_id INT NOT NULL,
     employee_id INT NOT NULL,
+    -- The project's dates, copied in by trigger (see staffing.py); empty
+    -- once the project is archived.
+    period DATERANGE NOT NULL DEFAULT 'empty',
     CONSTRAINT fk_project_emp_project FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
     CONSTRAINT fk_project_emp_employee FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
 );
 
+CREATE INDEX idx_project_employees_employee ON project_employees (employee_id, project_id);
+CREATE INDEX idx_project_employees_project ON project_employees (project_id);
+CREATE INDEX idx_project_employees_period ON project_employees USING gist (period);
+
+-- Missing dates leave that end open; archived projects staff nobody.
+CREATE OR REPLACE FUNCTION project_staffing_period(start_date DATE, end_date DATE, archived_at TIMESTAMP)
+RETURNS DATERANGE AS $$
+    SELECT CASE WHEN archived_at IS NOT NULL OR end_date < start_date THEN 'empty'::daterange
+                ELSE daterange(start_date, end_date, '[]') END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION project_employees_set_period() RETURNS trigger AS $$
+BEGIN
+    SELECT project_staffing_period(start_date, end_date, archived_at) INTO NEW.period
+    FROM projects WHERE id = NEW.project_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION projects_sync_staffing() RETURNS trigger AS $$
+BEGIN
+    UPDATE project_employees
+    SET period = project_staffing_period(NEW.start_date, NEW.end_date, NEW.archived_at)
+    WHERE project_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_project_employees_period BEFORE INSERT OR UPDATE OF project_id ON project_employees
+    FOR EACH ROW EXECUTE FUNCTION project_employees_set_period();
+CREATE TRIGGER trg_projects_staffing AFTER UPDATE OF start_date, end_date, archived_at ON projects
+    FOR EACH ROW WHEN (OLD.start_date IS DISTINCT FROM NEW.start_date
+                       OR OLD.end_date IS DISTINCT FROM NEW.end_date
+                       OR OLD.archived_at IS DISTINCT FROM NEW.archived_at)
+    EXECUTE FUNCTION projects_sync_staffing();
+
 -- --------------------------------------------------------
 -- Table: reports
 -- --------------------------------------------------------
@@ -89,7 +297,10 @@ CREATE TABLE reports (
     description TEXT,
     created_by VARCHAR(100),
     project_id INT,
-    CONSTRAINT fk_reports_project FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+    -- Limits the report to a department and its sub-units; NULL is everyone.
+    department_id INT,
+    CONSTRAINT fk_reports_project FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    CONSTRAINT fk_reports_department FOREIGN KEY (department_id) REFERENCES departments(id) ON DELETE SET NULL
 );
 
 -- --------------------------------------------------------
@@ -102,6 +313,538 @@ CREATE TABLE users (
     account_type TEXT DEFAULT 'employee'
 );
 
+-- --------------------------------------------------------
+-- Table: data_versions
+-- One row per tracked table, bumped by a statement-level trigger on every
+-- write. Used as the cache key for ETags and server-side caches.
+-- --------------------------------------------------------
+CREATE TABLE data_versions (
+    table_name VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT (timezone('UTC', CURRENT_TIMESTAMP))
+);
+
+INSERT INTO data_versions (table_name) VALUES
+('employees'), ('projects'), ('attendance'), ('payroll'),
+('project_employees'), ('reports'), ('users'), ('holidays'), ('pay_rules'), ('departments');
+
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO data_versions (table_name, version, updated_at)
+    VALUES (TG_TABLE_NAME, 1, date_trunc('second', timezone('UTC', clock_timestamp())))
+    ON CONFLICT (table_name) DO UPDATE
+        SET version = data_versions.version + 1,
+            updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_employees_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON employees
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_projects_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON projects
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_attendance_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON attendance
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_payroll_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON payroll
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_project_employees_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON project_employees
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_reports_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON reports
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_users_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_holidays_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON holidays
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_pay_rules_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pay_rules
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+CREATE TRIGGER trg_departments_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON departments
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+-- --------------------------------------------------------
+-- Table: tenants
+-- Registry of companies/sites in multi-tenant mode (TENANCY=schema). Each
+-- tenant's data lives in its own schema, tenant_<slug>, created from this
+-- file by tenants.py. This table and user_sessions are shared: they are
+-- only used from the public schema and are dropped from tenant schemas.
+-- --------------------------------------------------------
+CREATE TABLE tenants (
+    id SERIAL PRIMARY KEY,
+    slug VARCHAR(40) NOT NULL UNIQUE CHECK (slug ~ '^[a-z][a-z0-9_]*$'),
+    name VARCHAR(150) NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- --------------------------------------------------------
+-- Table: user_sessions
+-- Server-side session store (SESSION_BACKEND=postgres). The cookie only
+-- carries the id; expires_at is UTC. tenant is '' outside multi-tenant mode.
+-- --------------------------------------------------------
+CREATE TABLE user_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    tenant VARCHAR(40) NOT NULL DEFAULT '',
+    username VARCHAR(50),
+    data TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_user_sessions_username ON user_sessions (tenant, username);
+CREATE INDEX idx_user_sessions_expires_at ON user_sessions (expires_at);
+
+-- --------------------------------------------------------
+-- Table: audit_log
+-- Append-only change history, partitioned by month. Statement-level
+-- triggers copy before/after row images in one INSERT ... SELECT per
+-- statement, so ON DELETE CASCADE deletes are captured too. The acting user
+-- comes from the transaction-local setting app.user (set by audit.py).
+-- --------------------------------------------------------
+CREATE TABLE audit_log (
+    id BIGSERIAL,
+    changed_at TIMESTAMP NOT NULL DEFAULT (timezone('UTC', now())),
+    table_name VARCHAR(63) NOT NULL,
+    row_id INT,
+    action VARCHAR(6) NOT NULL,
+    changed_by VARCHAR(50),
+    old_row JSONB,
+    new_row JSONB,
+    PRIMARY KEY (id, changed_at)
+) PARTITION BY RANGE (changed_at);
+
+CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT;
+
+CREATE INDEX idx_audit_log_entity ON audit_log (table_name, row_id, changed_at DESC);
+CREATE INDEX idx_audit_log_user ON audit_log (changed_by, changed_at DESC);
+
+-- Create monthly partitions from the current month; run monthly (e.g. cron)
+-- so rows never land in the default partition.
+CREATE OR REPLACE FUNCTION create_audit_partitions(months_ahead INT DEFAULT 3) RETURNS void AS $$
+DECLARE
+    month_start DATE;
+    part_name TEXT;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := (date_trunc('month', timezone('UTC', now())) + make_interval(months => i))::date;
+        part_name := 'audit_log_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF audit_log FOR VALUES FROM (%L) TO (%L)',
+                part_name, month_start, (month_start + INTERVAL '1 month')::date
+            );
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_audit_partitions(3);
+
+CREATE OR REPLACE FUNCTION audit_log_is_append_only() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'audit_log is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log
+    FOR EACH ROW EXECUTE FUNCTION audit_log_is_append_only();
+
+CREATE OR REPLACE FUNCTION audit_capture() RETURNS trigger AS $$
+DECLARE
+    actor TEXT := NULLIF(current_setting('app.user', true), '');
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO audit_log (table_name, row_id, action, changed_by, new_row)
+        SELECT TG_TABLE_NAME, n.id, TG_OP, actor, to_jsonb(n) - 'password'
+        FROM audit_new n;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO audit_log (table_name, row_id, action, changed_by, old_row, new_row)
+        SELECT TG_TABLE_NAME, n.id, TG_OP, actor, to_jsonb(o) - 'password', to_jsonb(n) - 'password'
+        FROM audit_new n
+        JOIN audit_old o ON o.id = n.id
+        WHERE to_jsonb(o) IS DISTINCT FROM to_jsonb(n);
+    ELSE
+        INSERT INTO audit_log (table_name, row_id, action, changed_by, old_row)
+        SELECT TG_TABLE_NAME, o.id, TG_OP, actor, to_jsonb(o) - 'password'
+        FROM audit_old o;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['employees', 'projects', 'attendance', 'payroll', 'project_employees', 'users',
+                           'holidays', 'pay_rules', 'departments'] LOOP
+        EXECUTE format('CREATE TRIGGER trg_%s_audit_ins AFTER INSERT ON %I
+            REFERENCING NEW TABLE AS audit_new FOR EACH STATEMENT EXECUTE FUNCTION audit_capture()', t, t);
+        EXECUTE format('CREATE TRIGGER trg_%s_audit_upd AFTER UPDATE ON %I
+            REFERENCING OLD TABLE AS audit_old NEW TABLE AS audit_new FOR EACH STATEMENT EXECUTE FUNCTION audit_capture()', t, t);
+        EXECUTE format('CREATE TRIGGER trg_%s_audit_del AFTER DELETE ON %I
+            REFERENCING OLD TABLE AS audit_old FOR EACH STATEMENT EXECUTE FUNCTION audit_capture()', t, t);
+    END LOOP;
+END;
+$$;
+
+-- --------------------------------------------------------
+-- Table: pay_periods
+-- Pay period lifecycle: open -> approved -> closed. Closing a period (see
+-- pay_periods.py) freezes its payroll rows and writes payroll_period_totals.
+-- Payroll rows belong to the period with the same start and end dates.
+-- --------------------------------------------------------
+CREATE TABLE pay_periods (
+    id SERIAL PRIMARY KEY,
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open','approved','closed')),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    approved_by VARCHAR(50),
+    approved_at TIMESTAMP,
+    closed_by VARCHAR(50),
+    closed_at TIMESTAMP,
+    CONSTRAINT uq_pay_periods_dates UNIQUE (period_start, period_end),
+    CONSTRAINT chk_pay_periods_dates CHECK (period_end >= period_start)
+);
+
+-- Immutable totals of closed periods: one 'period' row, one 'project' row
+-- per project (project_id NULL = payroll without a project) and one
+-- 'employee' row per employee.
+CREATE TABLE payroll_period_totals (
+    id SERIAL PRIMARY KEY,
+    pay_period_id INT NOT NULL REFERENCES pay_periods(id),
+    scope TEXT NOT NULL CHECK (scope IN ('period','project','employee')),
+    project_id INT,
+    employee_id INT,
+    records INT NOT NULL,
+    employees_paid INT NOT NULL,
+    gross_pay DECIMAL(14,2) NOT NULL,
+    total_deductions DECIMAL(14,2) NOT NULL,
+    net_pay DECIMAL(14,2) NOT NULL,
+    latest_pay_period_end DATE
+);
+
+CREATE INDEX idx_payroll_period_totals_project ON payroll_period_totals (project_id) WHERE scope = 'project';
+CREATE INDEX idx_payroll_period_totals_employee ON payroll_period_totals (employee_id) WHERE scope = 'employee';
+CREATE INDEX idx_payroll_period_totals_period ON payroll_period_totals (pay_period_id, scope);
+
+CREATE OR REPLACE FUNCTION payroll_period_totals_immutable() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'payroll_period_totals is immutable';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_payroll_period_totals_immutable BEFORE UPDATE OR DELETE ON payroll_period_totals
+    FOR EACH ROW EXECUTE FUNCTION payroll_period_totals_immutable();
+
+-- Reject writes to payroll rows of closed periods. The FOR KEY SHARE lock
+-- on the period makes a concurrent close wait for in-flight writes, so its
+-- totals always include them. Archival (app.archiving = 'on') may still
+-- move closed rows out; their totals stay behind.
+CREATE OR REPLACE FUNCTION payroll_guard_closed_period() RETURNS trigger AS $$
+DECLARE
+    period_status TEXT;
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.period_closed THEN
+        IF TG_OP = 'DELETE' AND current_setting('app.archiving', true) = 'on' THEN
+            RETURN OLD;
+        END IF;
+        RAISE EXCEPTION 'pay period % to % is closed', OLD.pay_period_start, OLD.pay_period_end
+            USING ERRCODE = 'check_violation';
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        PERFORM 1 FROM pay_periods
+        WHERE period_start = OLD.pay_period_start AND period_end = OLD.pay_period_end
+        FOR KEY SHARE;
+        RETURN OLD;
+    END IF;
+
+    SELECT status INTO period_status FROM pay_periods
+    WHERE period_start = NEW.pay_period_start AND period_end = NEW.pay_period_end
+    FOR KEY SHARE;
+    IF period_status = 'closed' THEN
+        RAISE EXCEPTION 'pay period % to % is closed', NEW.pay_period_start, NEW.pay_period_end
+            USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_payroll_guard_closed_period BEFORE INSERT OR UPDATE OR DELETE ON payroll
+    FOR EACH ROW EXECUTE FUNCTION payroll_guard_closed_period();
+
+-- --------------------------------------------------------
+-- Table: idempotency_keys
+-- Keys of retried write requests (idempotency.py) with the response to
+-- replay. key is a SHA-256 of the client key, user, endpoint and payload.
+-- --------------------------------------------------------
+CREATE TABLE idempotency_keys (
+    key CHAR(64) PRIMARY KEY,
+    status_code INT,
+    location TEXT,
+    content_type TEXT,
+    body BYTEA,
+    flashes TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT (timezone('UTC', now())),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+
+-- --------------------------------------------------------
+-- Archive tables
+-- History of soft-deleted employees/projects, moved out of the hot tables in
+-- small batches by archival.py. Each mirrors its source table's columns
+-- (archival.py copies them by name), so an ALTER TABLE on a source table
+-- must be repeated on its archive.
+-- --------------------------------------------------------
+CREATE TABLE attendance_archive (
+    LIKE attendance,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+CREATE INDEX idx_attendance_archive_employee ON attendance_archive (employee_id, date);
+
+CREATE TABLE payroll_archive (
+    LIKE payroll,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+CREATE INDEX idx_payroll_archive_employee ON payroll_archive (employee_id, pay_period_end);
+CREATE INDEX idx_payroll_archive_project ON payroll_archive (project_id);
+
+CREATE TABLE project_employees_archive (
+    LIKE project_employees,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE clock_events_archive (
+    LIKE clock_events,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE reports_archive (
+    LIKE reports,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+
+-- Queue of archival work, claimed with FOR UPDATE SKIP LOCKED.
+CREATE TABLE archive_jobs (
+    id SERIAL PRIMARY KEY,
+    entity TEXT NOT NULL CHECK (entity IN ('employee','project')),
+    entity_id INT NOT NULL,
+    requested_by VARCHAR(50),
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    moved_rows INT
+);
+
+CREATE INDEX idx_archive_jobs_pending ON archive_jobs (id) WHERE finished_at IS NULL;
+
+-- Payslip batches (see payslips.py); progress is updated after every chunk.
+CREATE TABLE payslip_jobs (
+    id SERIAL PRIMARY KEY,
+    pay_period_id INT REFERENCES pay_periods(id) ON DELETE CASCADE,
+    project_id INT REFERENCES projects(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued','running','done','failed')),
+    total INT,
+    rendered INT NOT NULL DEFAULT 0,
+    file_path TEXT,
+    error TEXT,
+    requested_by VARCHAR(50),
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    CHECK (pay_period_id IS NOT NULL OR project_id IS NOT NULL)
+);
+
+-- Transactional outbox (see notifications.py): one row per payroll or
+-- attendance event, written in the transaction that made the change.
+CREATE TABLE notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    event TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fanned_out_at TIMESTAMP
+);
+
+CREATE INDEX idx_notification_outbox_pending ON notification_outbox (id) WHERE fanned_out_at IS NULL;
+
+-- One row per recipient and sink, fanned out from the outbox by the
+-- dispatcher and retried with backoff until sent or given up.
+CREATE TABLE notification_deliveries (
+    id BIGSERIAL PRIMARY KEY,
+    outbox_id BIGINT NOT NULL REFERENCES notification_outbox(id) ON DELETE CASCADE,
+    sink TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    sent_at TIMESTAMP,
+    failed_at TIMESTAMP,
+    UNIQUE (outbox_id, sink, recipient)
+);
+
+CREATE INDEX idx_notification_deliveries_due ON notification_deliveries (next_attempt_at)
+    WHERE sent_at IS NULL AND failed_at IS NULL;
+
+-- In-app messages, shown on the Notifications page.
+CREATE TABLE notifications (
+    id BIGSERIAL PRIMARY KEY,
+    username VARCHAR(50) NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    delivery_id BIGINT UNIQUE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    read_at TIMESTAMP
+);
+
+CREATE INDEX idx_notifications_user ON notifications (username, id DESC);
+
+-- --------------------------------------------------------
+-- Table: search_documents
+-- One tsvector per searchable report, employee and payroll row (search.py),
+-- kept current by the statement-level triggers below. Payroll documents
+-- include the employee and project names, so renaming either reindexes
+-- them. A separate table keeps the vectors out of the audit log and lets
+-- renames reach payroll rows of closed periods.
+-- --------------------------------------------------------
+CREATE TABLE search_documents (
+    kind TEXT NOT NULL CHECK (kind IN ('report','employee','payroll')),
+    ref_id INT NOT NULL,
+    document TSVECTOR NOT NULL,
+    PRIMARY KEY (kind, ref_id)
+);
+
+CREATE INDEX idx_search_documents_document ON search_documents USING gin (document);
+
+-- Weights: A names and titles, B positions, projects and descriptions,
+-- C e-mail, authors and periods, D statuses and dates.
+CREATE OR REPLACE FUNCTION search_reindex(doc_kind TEXT, ids INT[]) RETURNS void AS $$
+BEGIN
+    IF doc_kind = 'employee' THEN
+        INSERT INTO search_documents (kind, ref_id, document)
+        SELECT 'employee', e.id,
+               setweight(to_tsvector('simple', e.name), 'A')
+               || setweight(to_tsvector('simple', COALESCE(e.position, '')), 'B')
+               || setweight(to_tsvector('simple', COALESCE(e.email, '')), 'C')
+               || setweight(to_tsvector('simple', COALESCE(e.status, '')), 'D')
+        FROM employees e
+        WHERE e.id = ANY(ids)
+        ON CONFLICT (kind, ref_id) DO UPDATE SET document = EXCLUDED.document;
+    ELSIF doc_kind = 'report' THEN
+        INSERT INTO search_documents (kind, ref_id, document)
+        SELECT 'report', r.id,
+               setweight(to_tsvector('simple', r.title), 'A')
+               || setweight(to_tsvector('simple', COALESCE(r.description, '')), 'B')
+               || setweight(to_tsvector('simple', COALESCE(r.created_by, '')), 'C')
+               || setweight(to_tsvector('simple', COALESCE(to_char(r.report_date, 'YYYY-MM-DD FMMonth YYYY'), '')), 'D')
+        FROM reports r
+        WHERE r.id = ANY(ids)
+        ON CONFLICT (kind, ref_id) DO UPDATE SET document = EXCLUDED.document;
+    ELSIF doc_kind = 'payroll' THEN
+        INSERT INTO search_documents (kind, ref_id, document)
+        SELECT 'payroll', p.id,
+               setweight(to_tsvector('simple', e.name), 'A')
+               || setweight(to_tsvector('simple', COALESCE(pr.project_name, '')), 'B')
+               || setweight(to_tsvector('simple', concat_ws(' ',
+                      to_char(p.pay_period_start, 'YYYY-MM-DD FMMonth YYYY'),
+                      to_char(p.pay_period_end, 'YYYY-MM-DD FMMonth YYYY'))), 'C')
+               || setweight(to_tsvector('simple', COALESCE(p.status, '')), 'D')
+        FROM payroll p
+        JOIN employees e ON e.id = p.employee_id
+        LEFT JOIN projects pr ON pr.id = p.project_id
+        WHERE p.id = ANY(ids)
+        ON CONFLICT (kind, ref_id) DO UPDATE SET document = EXCLUDED.document;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_track_employees() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM search_reindex('employee', ARRAY(SELECT id FROM search_new));
+        RETURN NULL;
+    END IF;
+    PERFORM search_reindex('employee', ARRAY(
+        SELECT n.id FROM search_new n JOIN search_old o ON o.id = n.id
+        WHERE (n.name, n.position, n.email, n.status) IS DISTINCT FROM (o.name, o.position, o.email, o.status)));
+    PERFORM search_reindex('payroll', ARRAY(
+        SELECT p.id FROM search_new n JOIN search_old o ON o.id = n.id
+        JOIN payroll p ON p.employee_id = n.id
+        WHERE n.name IS DISTINCT FROM o.name));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_track_projects() RETURNS trigger AS $$
+BEGIN
+    PERFORM search_reindex('payroll', ARRAY(
+        SELECT p.id FROM search_new n JOIN search_old o ON o.id = n.id
+        JOIN payroll p ON p.project_id = n.id
+        WHERE n.project_name IS DISTINCT FROM o.project_name));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_track_reports() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE kind = 'report' AND ref_id IN (SELECT id FROM search_old);
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM search_reindex('report', ARRAY(SELECT id FROM search_new));
+    ELSE
+        PERFORM search_reindex('report', ARRAY(
+            SELECT n.id FROM search_new n JOIN search_old o ON o.id = n.id
+            WHERE (n.title, n.description, n.created_by, n.report_date)
+                  IS DISTINCT FROM (o.title, o.description, o.created_by, o.report_date)));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_track_payroll() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE kind = 'payroll' AND ref_id IN (SELECT id FROM search_old);
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM search_reindex('payroll', ARRAY(SELECT id FROM search_new));
+    ELSE
+        -- Repricing rewrites amounts only; those are not searchable.
+        PERFORM search_reindex('payroll', ARRAY(
+            SELECT n.id FROM search_new n JOIN search_old o ON o.id = n.id
+            WHERE (n.employee_id, n.project_id, n.pay_period_start, n.pay_period_end, n.status)
+                  IS DISTINCT FROM (o.employee_id, o.project_id, o.pay_period_start, o.pay_period_end, o.status)));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['employees', 'reports', 'payroll'] LOOP
+        EXECUTE format('CREATE TRIGGER trg_%s_search_ins AFTER INSERT ON %I
+            REFERENCING NEW TABLE AS search_new FOR EACH STATEMENT EXECUTE FUNCTION search_track_%s()', t, t, t);
+    END LOOP;
+    FOREACH t IN ARRAY ARRAY['employees', 'projects', 'reports', 'payroll'] LOOP
+        EXECUTE format('CREATE TRIGGER trg_%s_search_upd AFTER UPDATE ON %I
+            REFERENCING OLD TABLE AS search_old NEW TABLE AS search_new
+            FOR EACH STATEMENT EXECUTE FUNCTION search_track_%s()', t, t, t);
+    END LOOP;
+    FOREACH t IN ARRAY ARRAY['reports', 'payroll'] LOOP
+        EXECUTE format('CREATE TRIGGER trg_%s_search_del AFTER DELETE ON %I
+            REFERENCING OLD TABLE AS search_old FOR EACH STATEMENT EXECUTE FUNCTION search_track_%s()', t, t, t);
+    END LOOP;
+END;
+$$;
+
 -- --------------------------------------------------------
 -- Example inserts (optional)
 -- --------------------------------------------------------
@@ -0,0 +1,305 @@
+"""Multi-tenant mode: many companies or sites served by one deployment.
+
+With ``TENANCY = "schema"`` every tenant gets its own Postgres schema,
+``tenant_<slug>``, holding a full copy of the tables in system_db.sql.  Only
+the registry (``tenants``) and ``user_sessions`` are shared; they stay in
+``public``.  No query in the app names a tenant.  Each pooled connection's
+``search_path`` points at the current tenant's schema when the connection is
+checked out, and a ``SET`` is only sent when the connection last served a
+different tenant.  Every tenant therefore keeps its own rows, sequences,
+unique constraints and indexes.  One pool serves all tenants, so the number
+of connections does not grow with the number of tenants.
+
+The tenant is chosen at login (the "Company" field) and kept in the session.
+Clock devices name theirs in an ``X-Tenant`` header, which must match the
+tenant their token is bound to (``timesheets.device_authorized``).
+Background workers visit every active tenant on their periodic pass, but a
+wake-up only visits the tenants it came from (``each_tenant``,
+``Wakeups``).  Cache keys built
+from data versions include the tenant (``data_versions.version_token``).
+Tenants therefore never see each other's cached pages, while still sharing
+the LRU budgets, so idle tenants' entries are the first to be evicted.
+
+    python tenants.py create acme "Acme Builders" --admin alice secret
+    python tenants.py list
+    python tenants.py suspend acme
+"""
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, flash, jsonify, redirect, request, session, url_for
+from sqlalchemy import event, text
+
+from lru import LRUCache
+
+SHARED_SCHEMA = "public"
+# Created by system_db.sql in every schema but only used from SHARED_SCHEMA.
+SHARED_TABLES = ("tenants", "user_sessions")
+SLUG_PATTERN = re.compile(r"^[a-z][a-z0-9_]{0,39}$")
+TENANT_HEADER = "X-Tenant"
+# Endpoints that run before a tenant is known.
+OPEN_ENDPOINTS = ("auth.home", "auth.login", "auth.register", "auth.logout", "static")
+
+_current = contextvars.ContextVar("tenant", default=None)
+# slug -> (expires_at, registry row or None)
+_lookups = LRUCache(max_entries=4096, max_bytes=4 * 1024 * 1024, sizeof=lambda item: 256)
+
+
+class TenantError(ValueError):
+    """An unknown, suspended or badly named tenant."""
+
+
+def enabled(app=None):
+    return (app or current_app).config.get("TENANCY") == "schema"
+
+
+def schema_name(slug):
+    return f"tenant_{slug}"
+
+
+def current():
+    """Slug of the tenant this request or job runs for, or ``None``."""
+    return _current.get()
+
+
+@contextmanager
+def using(slug):
+    """Run the block for tenant ``slug``; connections checked out inside use its schema."""
+    token = _current.set(slug)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _search_path(slug):
+    if slug is None:
+        return SHARED_SCHEMA
+    return f'"{schema_name(slug)}", {SHARED_SCHEMA}'
+
+
+def _forget_path(dbapi_conn, record):
+    record.info.pop("search_path", None)
+
+
+def _route_connection(dbapi_conn, record, proxy):
+    path = _search_path(_current.get())
+    if record.info.get("search_path") == path:
+        return
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute(f"SET search_path TO {path}")
+    finally:
+        cursor.close()
+    # Committed, so a later rollback on this connection cannot undo it.
+    dbapi_conn.commit()
+    record.info["search_path"] = path
+
+
+def lookup(engine, slug):
+    """The active tenant ``slug``'s registry row, or ``None``.
+
+    Answers are cached for ``TENANT_LOOKUP_SECONDS``, which bounds how long a
+    suspension takes to apply in other workers.
+    """
+    now = time.monotonic()
+    cached = _lookups.get(slug)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(f"SELECT id, slug, name FROM {SHARED_SCHEMA}.tenants WHERE slug = :slug AND active"),
+            {"slug": slug}
+        ).first()
+    _lookups.set(slug, (now + current_app.config["TENANT_LOOKUP_SECONDS"], row))
+    return row
+
+
+def activate(slug):
+    """Select ``slug`` for the rest of this request (login and registration).
+
+    Call it before the request's first query: connections already checked
+    out keep the schema they were given.
+    """
+    if not slug or not SLUG_PATTERN.match(slug) or lookup(_engine(), slug) is None:
+        raise TenantError("Unknown company.")
+    _current.set(slug)
+
+
+def each_tenant(app, engine, only=None):
+    """Yield once per active tenant (or per slug in ``only``) with it selected.
+
+    Without multi-tenant mode this yields once and changes nothing, so
+    background jobs can always loop over it.
+    """
+    if not enabled(app):
+        yield None
+        return
+    if only is None:
+        with engine.connect() as conn:
+            only = conn.execute(
+                text(f"SELECT slug FROM {SHARED_SCHEMA}.tenants WHERE active ORDER BY slug")
+            ).scalars().all()
+    for slug in only:
+        with using(slug):
+            yield slug
+
+
+class Wakeups:
+    """Tenants a background worker was woken for since its last pass."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slugs = set()
+
+    def add(self, slug):
+        if slug is not None:
+            with self._lock:
+                self._slugs.add(slug)
+
+    def take(self):
+        with self._lock:
+            slugs, self._slugs = self._slugs, set()
+        return sorted(slugs)
+
+
+def _engine():
+    return current_app.extensions["tenants"].engine
+
+
+def _resolve_request():
+    _current.set(None)
+    if request.endpoint is None or request.endpoint in OPEN_ENDPOINTS:
+        return None
+    slug = session.get("tenant") or request.headers.get(TENANT_HEADER)
+    if slug and SLUG_PATTERN.match(slug) and lookup(_engine(), slug) is not None:
+        _current.set(slug)
+        return None
+    if session.get("tenant"):
+        # Suspended since this session logged in.
+        session.clear()
+    if request.path.startswith("/api/"):
+        return jsonify({"error": "Unknown or suspended tenant"}), 401
+    flash("Please log in to continue.", "danger")
+    return redirect(url_for("auth.home"))
+
+
+def _end_request(exc):
+    _current.set(None)
+
+
+def init_app(app, db):
+    """Route connections by tenant when ``TENANCY = "schema"``.
+
+    Must run before any other extension registers a ``before_request`` hook
+    that queries the database.
+    """
+    app.config.setdefault("TENANCY", "off")
+    app.config.setdefault("TENANT_LOOKUP_SECONDS", 30)
+    app.extensions["tenants"] = db
+    app.jinja_env.globals["multi_tenant"] = enabled(app)
+    if not enabled(app):
+        return
+    app.before_request(_resolve_request)
+    app.teardown_request(_end_request)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "connect", _forget_path)
+            event.listen(engine, "checkout", _route_connection)
+
+
+def create_tenant(engine, slug, name, admin=None):
+    """Create schema ``tenant_<slug>`` from system_db.sql and register it.
+
+    ``admin`` is an optional ``(username, password)`` for the first Admin
+    user.  Everything happens in one transaction, so a failure leaves nothing
+    behind.
+    """
+    if not slug or not SLUG_PATTERN.match(slug):
+        raise TenantError("Use 1-40 lowercase letters, digits or _, starting with a letter.")
+    if not name:
+        raise TenantError("Give the tenant a name.")
+    schema = schema_name(slug)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_db.sql")) as f:
+        ddl = f.read()
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT 1 FROM {SHARED_SCHEMA}.tenants WHERE slug = %s", (slug,))
+        if cursor.fetchone():
+            raise TenantError(f"Tenant {slug} already exists.")
+        cursor.execute(f'CREATE SCHEMA "{schema}"')
+        cursor.execute(f'SET LOCAL search_path TO "{schema}"')
+        # Run the script in one go, as init_db.py does.
+        cursor.execute(ddl)
+        for table in SHARED_TABLES:
+            cursor.execute(f'DROP TABLE "{schema}".{table}')
+        if admin:
+            cursor.execute(
+                f"""INSERT INTO "{schema}".users (username, password, account_type) VALUES (%s, %s, 'Admin')""",
+                admin
+            )
+        cursor.execute(f"INSERT INTO {SHARED_SCHEMA}.tenants (slug, name) VALUES (%s, %s)", (slug, name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def list_tenants(execute):
+    return execute(
+        text(f"SELECT slug, name, active, created_at FROM {SHARED_SCHEMA}.tenants ORDER BY slug")
+    ).fetchall()
+
+
+def set_active(execute, slug, active):
+    """Suspend or resume a tenant; its data is kept either way."""
+    updated = execute(
+        text(f"UPDATE {SHARED_SCHEMA}.tenants SET active = :active WHERE slug = :slug RETURNING id"),
+        {"slug": slug, "active": active}
+    ).scalar()
+    if updated is None:
+        raise TenantError(f"No tenant {slug}.")
+    _lookups.pop(slug)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description="Manage tenants (TENANCY=schema).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create")
+    create.add_argument("slug")
+    create.add_argument("name")
+    create.add_argument("--admin", nargs=2, metavar=("USERNAME", "PASSWORD"))
+    commands.add_parser("list")
+    for command in ("suspend", "resume"):
+        commands.add_parser(command).add_argument("slug")
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == "create":
+                create_tenant(db.engine, args.slug, args.name, args.admin)
+                print(f"Tenant {args.slug} created in schema {schema_name(args.slug)}")
+            elif args.command == "list":
+                for tenant in list_tenants(db.session.execute):
+                    print(f"{tenant.slug:<20} {'active' if tenant.active else 'suspended':<10} {tenant.name}")
+            else:
+                set_active(db.session.execute, args.slug, args.command == "resume")
+                db.session.commit()
+                print(f"Tenant {args.slug} {args.command}d")
+        except TenantError as e:
+            raise SystemExit(str(e))
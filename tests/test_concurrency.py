@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+
+from concurrency import PAYROLL_EDIT_FIELDS, merge
+
+BASE = {
+    "employee_id": 1, "project_id": 2, "pay_period_start": "2026-01-01",
+    "pay_period_end": "2026-01-15", "basic_salary": "1000.00", "overtime": "0.00",
+    "deductions": "50.00", "status": "Pending",
+}
+
+
+def _by_name(merged):
+    return {field["name"]: field for field in merged}
+
+
+def test_changes_to_different_fields_merge():
+    mine = dict(BASE, basic_salary="1200")
+    theirs = dict(BASE, status="Paid")
+    merged = _by_name(merge(PAYROLL_EDIT_FIELDS, BASE, mine, theirs))
+
+    assert not any(field["conflict"] for field in merged.values())
+    assert merged["basic_salary"]["value"] == "1200.00"
+    assert merged["status"]["value"] == "Paid"
+    assert merged["deductions"]["value"] == "50.00"
+
+
+def test_different_changes_to_one_field_conflict():
+    mine = dict(BASE, overtime="125.00")
+    theirs = dict(BASE, overtime="150.00", status="Paid")
+    merged = _by_name(merge(PAYROLL_EDIT_FIELDS, BASE, mine, theirs))
+
+    assert merged["overtime"]["conflict"]
+    assert merged["overtime"]["value"] == "125.00"
+    assert (merged["overtime"]["base"], merged["overtime"]["theirs"]) == ("0.00", "150.00")
+    assert not merged["status"]["conflict"]
+    assert merged["status"]["value"] == "Paid"
+
+
+def test_same_change_on_both_sides_is_not_a_conflict():
+    mine = dict(BASE, deductions="75")
+    theirs = dict(BASE, deductions=Decimal("75.00"))
+    merged = _by_name(merge(PAYROLL_EDIT_FIELDS, BASE, mine, theirs))
+
+    assert not merged["deductions"]["conflict"]
+    assert merged["deductions"]["value"] == "75.00"
+
+
+def test_values_compare_across_form_and_database_types():
+    theirs = dict(BASE, basic_salary=Decimal("1000.00"), pay_period_start=date(2026, 1, 1), employee_id="1")
+    merged = merge(PAYROLL_EDIT_FIELDS, BASE, BASE, theirs)
+
+    assert not any(field["changed"] or field["conflict"] for field in merged)
+
+
+def test_unknown_base_makes_every_difference_a_conflict():
+    mine = dict(BASE, basic_salary="1200")
+    theirs = dict(BASE, status="Paid")
+    merged = _by_name(merge(PAYROLL_EDIT_FIELDS, None, mine, theirs))
+
+    assert merged["basic_salary"]["conflict"] and merged["status"]["conflict"]
+    assert not merged["deductions"]["conflict"]
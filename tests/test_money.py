@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+import money
+
+
+@pytest.mark.parametrize("value, cents", [
+    ("1,234.565", 123457),
+    ("0.005", 1),
+    ("0.004", 0),
+    ("-0.005", -1),
+    (Decimal("19.995"), 2000),
+    (0.1 + 0.2, 30),
+    (7, 700),
+    ("", 0),
+    (None, 0),
+])
+def test_to_cents_rounds_half_up(value, cents):
+    assert money.to_cents(value) == cents
+
+
+@pytest.mark.parametrize("value", ["abc", "nan", "inf", "1.2.3"])
+def test_to_money_rejects_non_amounts(value):
+    with pytest.raises(money.MoneyError):
+        money.to_money(value)
+
+
+def test_from_cents_round_trips():
+    assert money.from_cents(np.int64(123457)) == Decimal("1234.57")
+    assert money.to_cents(money.from_cents(-5)) == -5
+
+
+def test_round_div_rounds_half_away_from_zero():
+    assert money.round_div([5, 15, 14, 16, -5, -15, -14, 0], 10).tolist() == [1, 2, 1, 2, -1, -2, -1, 0]
+    assert int(money.round_div(7, 2)) == 4
+    assert int(money.round_div(-7, 2)) == -4
+
+
+def test_round_div_matches_to_money():
+    # A cents x hours x multiplier product, as pay_rules.price builds it.
+    rate, hours, multiplier = 53733, 137, 1690
+    exact = Decimal(rate * hours * multiplier) / (800 * 1000)
+    assert int(money.round_div(rate * hours * multiplier, 800 * 1000)) == money.to_cents(exact.scaleb(-2))
@@ -0,0 +1,101 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import pay_rules
+from pay_rules import CompiledRules, RuleError, price
+
+# The default rows seeded by system_db.sql, in thousandths:
+# (worked, OT, night, unworked) per day type.
+DEFAULTS = np.array([
+    # Regular, Rest, Special, Regular Holiday
+    [1000, 1300, 1300, 2000],
+    [1250, 1690, 1690, 2600],
+    [100, 130, 130, 200],
+    [0, 0, 0, 1000],
+], dtype=np.int64)
+
+# Monday 5 to Sunday 11 January 2026, with Wednesday a regular holiday.
+START, END = date(2026, 1, 5), date(2026, 1, 11)
+HOLIDAY = date(2026, 1, 7)
+
+
+@pytest.fixture
+def rules():
+    override = DEFAULTS.copy()
+    override[pay_rules.OT, pay_rules.REGULAR_DAY] = 1500
+    return CompiledRules(None, DEFAULTS, {7: override}, {HOLIDAY: pay_rules.REGULAR_HOLIDAY})
+
+
+def attendance(*rows):
+    """(employee id, date, hours, night hours) rows as load_attendance returns them."""
+    return np.array([(e, (day - START).days, round(h * 100), round(n * 100)) for e, day, h, n in rows],
+                    dtype=np.int64).reshape(-1, 4)
+
+
+def test_calendar_marks_rest_days_and_holidays(rules):
+    types = rules.calendar(START, END, rest_days=(6,))
+    assert types.tolist() == [0, 0, 3, 0, 0, 0, 1]
+
+
+def test_price_matches_a_hand_computed_row(rules):
+    # ₱800/day, so ₱100/hour:
+    #   Mon 10h: 2 OT hours x 1.25 = ₱250
+    #   Tue 8h, 1 of them at night: 1h x 0.10 = ₱10 night differential
+    #   Wed (regular holiday) 8h: premium 2.00 - 1.00 = ₱800
+    #   Sun (rest day) 9h: premium 0.30 = ₱240, 1 OT hour x 1.69 = ₱169
+    worked = attendance(
+        (1, date(2026, 1, 5), 10, 0),
+        (1, date(2026, 1, 6), 8, 1),
+        (1, date(2026, 1, 7), 8, 0),
+        (1, date(2026, 1, 11), 9, 0),
+    )
+    priced = price(rules, rules.calendar(START, END), worked, [1], [None], [80000])
+
+    assert priced["days_worked"].tolist() == [4]
+    assert priced["total_ot_hours"].tolist() == [300]
+    assert priced["ot_amount"].tolist() == [41900]
+    assert priced["night_diff"].tolist() == [1000]
+    assert priced["holiday_pay_amount"].tolist() == [104000]
+
+
+def test_price_pays_an_unworked_holiday_and_rounds_half_up(rules):
+    # ₱537.33/day: one OT hour is 537.33 / 8 x 1.25 = 83.958 -> ₱83.96, and
+    # the unworked regular holiday pays one day.
+    worked = attendance((2, date(2026, 1, 5), 9, 0))
+    priced = price(rules, rules.calendar(START, END), worked, [2], [0], [53733])
+
+    assert priced["days_worked"].tolist() == [1]
+    assert priced["ot_amount"].tolist() == [8396]
+    assert priced["holiday_pay_amount"].tolist() == [53733]
+    assert priced["night_diff"].tolist() == [0]
+
+
+def test_price_uses_project_overrides_per_row(rules):
+    worked = attendance(
+        (1, date(2026, 1, 5), 10, 0),
+        (2, date(2026, 1, 5), 10, 0),
+    )
+    priced = price(rules, rules.calendar(START, END), worked, [1, 2], [7, 3], [80000, 80000])
+
+    # 2 OT hours at ₱100: x 1.50 on project 7, x 1.25 by default on project 3.
+    assert priced["ot_amount"].tolist() == [30000, 25000]
+
+
+def test_price_refuses_an_employee_on_two_rows(rules):
+    worked = attendance((1, date(2026, 1, 5), 8, 0))
+    with pytest.raises(RuleError):
+        price(rules, rules.calendar(START, END), worked, [1, 1], [1, 2], [80000, 80000])
+
+
+@pytest.mark.parametrize("bad", ["nan", "inf", "-1", "11", "1.2345", "", None])
+def test_save_rule_rejects_bad_multipliers(bad):
+    multipliers = {m: "1.00" for m in pay_rules.MULTIPLIERS}
+    multipliers["ot_multiplier"] = bad
+
+    def execute(*args):
+        raise AssertionError("nothing should be written")
+
+    with pytest.raises(RuleError):
+        pay_rules.save_rule(execute, None, "Regular Day", multipliers)
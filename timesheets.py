@@ -0,0 +1,281 @@
+"""Clock-in/clock-out events and the timesheets derived from them.
+
+Kiosks and biometric devices POST batches of punches to
+``/api/clock_events``.  A whole batch is written by one statement that
+unnests column arrays into ``clock_events``, skips punches a device has
+already sent (same ``device_id`` and ``device_event_id``) and queues every
+employee-day it touched in ``clock_dirty_days``.
+
+The aggregator claims queued days with ``FOR UPDATE SKIP LOCKED``, replays
+each day's punches in time order (every ``in`` paired with the ``out`` that
+follows it) and upserts the result into ``attendance``: first in, last out
+and worked hours, plus Present/Late for days without a status yet.  Only
+touched days are recomputed, so a punch that arrives late just fixes its day.
+Punches count towards the calendar day they happen on, so an ``in`` left
+open at midnight earns no hours; overnight shifts are not supported.
+
+Payroll reads days worked and OT hours per pay period from those attendance
+rows (``period_totals``).
+
+In multi-tenant mode a wake-up folds the tenants it came from and the
+periodic pass folds them all.
+"""
+import hmac
+import threading
+from datetime import datetime, time as dt_time
+
+from sqlalchemy import text
+
+import tenants
+
+MAX_BATCH = 5000
+FOLD_BATCH = 500
+KINDS = ("in", "out")
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class EventError(ValueError):
+    """A punch in an ingested batch that cannot be stored."""
+
+
+def parse_time(value):
+    moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        # Stored as server-local wall time, like every other timestamp here.
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def parse_events(payload, device_id=None):
+    """Column arrays for ``ingest`` from a JSON batch.
+
+    ``payload`` is a list of punches or ``{"device_id": ..., "events": [...]}``;
+    each punch has ``employee_id``, ``time`` (ISO 8601), ``kind`` (in/out)
+    and optionally its own ``device_id`` and ``event_id``.
+    """
+    if isinstance(payload, dict):
+        device_id = payload.get("device_id") or device_id
+        payload = payload.get("events")
+    if not isinstance(payload, list) or not payload:
+        raise EventError("Send a non-empty list of events.")
+    if len(payload) > MAX_BATCH:
+        raise EventError(f"At most {MAX_BATCH} events per request.")
+
+    columns = {"employee_ids": [], "event_times": [], "kinds": [], "device_ids": [], "device_event_ids": []}
+    for i, event in enumerate(payload):
+        try:
+            kind = str(event["kind"]).lower()
+            if kind not in KINDS:
+                raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+            device = event.get("device_id") or device_id
+            if not device:
+                raise ValueError("device_id is required")
+            columns["employee_ids"].append(int(event["employee_id"]))
+            columns["event_times"].append(parse_time(event["time"]))
+            columns["kinds"].append(kind)
+            columns["device_ids"].append(str(device))
+            event_id = event.get("event_id")
+            columns["device_event_ids"].append(None if event_id is None else str(event_id))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise EventError(f"Event {i}: {e}") from None
+    return columns
+
+
+def ingest(execute, columns):
+    """Store one parsed batch on the caller's transaction; returns punches stored.
+
+    Punches for unknown or archived employees and resent punches are skipped.
+    """
+    return execute(
+        text("""
+            WITH incoming AS (
+                SELECT *
+                FROM unnest(
+                    CAST(:employee_ids AS INT[]), CAST(:event_times AS TIMESTAMP[]),
+                    CAST(:kinds AS TEXT[]), CAST(:device_ids AS TEXT[]),
+                    CAST(:device_event_ids AS TEXT[])
+                ) AS t(employee_id, event_time, kind, device_id, device_event_id)
+                WHERE employee_id IN (SELECT id FROM employees WHERE archived_at IS NULL)
+            ), inserted AS (
+                INSERT INTO clock_events (employee_id, event_time, kind, device_id, device_event_id)
+                SELECT employee_id, event_time, kind, device_id, device_event_id FROM incoming
+                ON CONFLICT (device_id, device_event_id) DO NOTHING
+                RETURNING employee_id, event_time
+            ), queued AS (
+                INSERT INTO clock_dirty_days (employee_id, work_date)
+                SELECT DISTINCT employee_id, event_time::date FROM inserted
+                ON CONFLICT DO NOTHING
+            )
+            SELECT COUNT(*) FROM inserted
+        """),
+        columns
+    ).scalar()
+
+
+def fold_batch(conn, late_after, limit=FOLD_BATCH):
+    """Recompute up to ``limit`` queued employee-days into ``attendance``.
+
+    Returns the number of days claimed; ``0`` means the queue is empty.
+    """
+    conn.execute(text("SELECT set_config('app.user', 'timesheets', true)"))
+    return conn.execute(
+        text("""
+            WITH claimed AS (
+                DELETE FROM clock_dirty_days
+                WHERE (employee_id, work_date) IN (
+                    SELECT employee_id, work_date FROM clock_dirty_days
+                    ORDER BY work_date, employee_id
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING employee_id, work_date
+            ), punches AS (
+                SELECT c.employee_id, c.work_date, e.kind, e.event_time,
+                       LEAD(e.kind) OVER w AS next_kind,
+                       LEAD(e.event_time) OVER w AS next_time
+                FROM claimed c
+                JOIN clock_events e
+                  ON e.employee_id = c.employee_id
+                 AND e.event_time >= c.work_date AND e.event_time < c.work_date + 1
+                WINDOW w AS (PARTITION BY c.employee_id, c.work_date ORDER BY e.event_time, e.id)
+            ), days AS (
+                SELECT employee_id, work_date,
+                       MIN(event_time) FILTER (WHERE kind = 'in') AS clock_in,
+                       MAX(event_time) FILTER (WHERE kind = 'out') AS clock_out,
+                       ROUND(COALESCE(SUM(EXTRACT(EPOCH FROM next_time - event_time))
+                             FILTER (WHERE kind = 'in' AND next_kind = 'out'), 0) / 3600, 2) AS worked_hours
+                FROM punches
+                GROUP BY employee_id, work_date
+            ), upserted AS (
+                INSERT INTO attendance (employee_id, date, status, clock_in, clock_out, worked_hours)
+                SELECT d.employee_id, d.work_date,
+                       CASE WHEN d.clock_in::time > :late_after THEN 'Late' ELSE 'Present' END,
+                       d.clock_in, d.clock_out, d.worked_hours
+                FROM days d
+                JOIN employees emp ON emp.id = d.employee_id AND emp.archived_at IS NULL
+                ON CONFLICT (employee_id, date) DO UPDATE
+                    SET clock_in = EXCLUDED.clock_in,
+                        clock_out = EXCLUDED.clock_out,
+                        worked_hours = EXCLUDED.worked_hours,
+                        status = CASE WHEN attendance.status = 'Absent' THEN EXCLUDED.status
+                                      ELSE attendance.status END,
+                        version = attendance.version + 1
+            )
+            SELECT COUNT(*) FROM claimed
+        """),
+        {"limit": limit, "late_after": late_after}
+    ).scalar()
+
+
+def run_pending(engine, late_after=dt_time(8, 15), batch_size=FOLD_BATCH):
+    """Fold queued days until the queue is empty; returns days folded."""
+    folded = 0
+    while True:
+        with engine.begin() as conn:
+            count = fold_batch(conn, late_after, batch_size)
+        folded += count
+        if count < batch_size:
+            return folded
+
+
+def period_totals(execute, employee_id, period_start, period_end, regular_hours=8):
+    """Days worked and OT hours of one employee over a pay period.
+
+    A day counts as worked if it has clocked hours or, for manual entries,
+    a Present/Late/Work From Home status; hours beyond ``regular_hours`` a
+    day are overtime.
+    """
+    return execute(
+        text("""
+            SELECT COUNT(*) FILTER (
+                       WHERE worked_hours > 0
+                          OR (worked_hours IS NULL AND status IN ('Present', 'Late', 'Work From Home'))
+                   ) AS days_worked,
+                   COALESCE(SUM(GREATEST(worked_hours - :regular_hours, 0)), 0) AS total_ot_hours,
+                   COALESCE(SUM(worked_hours), 0) AS worked_hours,
+                   COUNT(*) FILTER (WHERE clock_in IS NOT NULL) AS clocked_days
+            FROM attendance
+            WHERE employee_id = :employee_id AND date BETWEEN :start AND :end
+        """),
+        {"employee_id": employee_id, "start": period_start, "end": period_end,
+         "regular_hours": regular_hours}
+    ).mappings().first()
+
+
+def device_authorized(token, tokens, tenant=None):
+    """Whether ``token`` is one of the configured device tokens for ``tenant``.
+
+    In multi-tenant mode each entry is ``slug:token`` and only lets a device
+    post for that tenant; plain entries are for single-tenant deployments.
+    """
+    if not token:
+        return False
+    # As bytes: compare_digest rejects non-ASCII str, and headers may carry any byte.
+    token = token.encode("utf-8")
+    authorized = False
+    for entry in tokens:
+        slug, _, known = entry.rpartition(":")
+        # Compare every entry, so timing does not tell which tenant matched.
+        if hmac.compare_digest(token, known.encode("utf-8")) and (slug or None) == tenant:
+            authorized = True
+    return authorized
+
+
+class ClockAggregator(threading.Thread):
+    """Daemon thread that folds queued days whenever it is woken."""
+
+    def __init__(self, app, db, interval=30):
+        super().__init__(name="clock-aggregator", daemon=True)
+        self.app = app
+        self.db = db
+        self.interval = interval
+        self.wake = threading.Event()
+        self.woken_for = tenants.Wakeups()
+
+    def run(self):
+        only = None
+        while True:
+            try:
+                with self.app.app_context():
+                    for _ in tenants.each_tenant(self.app, self.db.engine, only):
+                        run_pending(self.db.engine, late_after=self.app.config["CLOCK_LATE_AFTER"])
+            except Exception as e:
+                self.app.logger.warning("Clock aggregator failed: %s", e)
+            woken = self.wake.wait(self.interval)
+            self.wake.clear()
+            only = self.woken_for.take() if woken else None
+
+
+def init_app(app, db):
+    app.config.setdefault("CLOCK_AGGREGATOR", "thread")
+    app.config.setdefault("CLOCK_LATE_AFTER", dt_time(8, 15))
+    app.config.setdefault("CLOCK_DEVICE_TOKENS", ())
+    app.config.setdefault("REGULAR_HOURS_PER_DAY", 8)
+    app.extensions["timesheets"] = db
+
+
+def kick(app):
+    """Wake this process's aggregator, starting it on first use."""
+    global _worker
+    if app.config.get("CLOCK_AGGREGATOR") != "thread":
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = ClockAggregator(app, app.extensions["timesheets"])
+            _worker.start()
+        _worker.woken_for.add(tenants.current())
+        _worker.wake.set()
+
+
+if __name__ == "__main__":
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    with app.app_context():
+        folded = sum(run_pending(db.engine, app.config["CLOCK_LATE_AFTER"])
+                     for _ in tenants.each_tenant(app, db.engine))
+        print(f"Folded {folded} day(s)")
@@ -0,0 +1,12 @@
+"""Blueprints holding every page and API route.
+
+Endpoints are named ``<blueprint>.<view>``, e.g. ``url_for('payroll.payroll')``.
+"""
+from views import admin, attendance, auth, employees, main, payroll, projects, reports
+
+BLUEPRINTS = (auth.bp, main.bp, employees.bp, attendance.bp, projects.bp, payroll.bp, reports.bp, admin.bp)
+
+
+def init_app(app):
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
@@ -0,0 +1,197 @@
+"""Admin panel: user accounts, roles, sessions and the audit log."""
+from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from sqlalchemy import text
+
+import audit
+import session_store
+from extensions import db, replica
+from rows import fetch_records
+from session_store import active_session_counts, revoke_user_sessions
+from views.auth import roles_required
+
+bp = Blueprint("admin", __name__)
+
+
+@bp.route('/admin/settings')
+@roles_required("Admin")
+def admin_settings():
+    """Admin panel: manage user accounts and roles."""
+    result = db.session.execute(text("SELECT id, username, account_type FROM users ORDER BY username"))
+    users = fetch_records(result)
+
+    return render_template(
+        'admin_settings.html',
+        users=users,
+        session_counts=active_session_counts(),
+        username=session.get('username'),
+    )
+
+
+@bp.route('/admin/audit')
+@roles_required("Admin")
+def audit_log():
+    """Change history filtered by entity, record and/or user."""
+    table_name = request.args.get('table') or None
+    if table_name not in audit.AUDITED_TABLES:
+        table_name = None
+    row_id = request.args.get('row_id', type=int)
+    changed_by = request.args.get('user', '').strip() or None
+    page = request.args.get('page', 1, type=int)
+
+    entries, has_more = audit.query_audit(
+        replica.execute, table_name=table_name, row_id=row_id, changed_by=changed_by, page=page
+    )
+
+    return render_template(
+        'audit_log.html',
+        entries=entries,
+        has_more=has_more,
+        page=max(page, 1),
+        tables=audit.AUDITED_TABLES,
+        filters={'table': table_name, 'row_id': row_id, 'user': changed_by},
+        username=session.get('username'),
+    )
+
+
+@bp.route('/admin/users/add', methods=['POST'])
+@roles_required("Admin")
+def add_user():
+    """Add a new user account."""
+    username = request.form.get('username', '').strip()
+    password = request.form.get('password', '').strip()
+    account_type = request.form.get('account_type', 'Employee')
+
+    if not username or not password:
+        flash("Username and password are required.", "danger")
+        return redirect(url_for('admin.admin_settings'))
+
+    try:
+        # Check if username already exists
+        existing_user = db.session.execute(
+            text("SELECT 1 FROM users WHERE username=:username"),
+            {"username": username}
+        ).fetchone()
+
+        if existing_user:
+            flash("Username already taken!", "danger")
+            return redirect(url_for('admin.admin_settings'))
+
+        # Insert new user
+        db.session.execute(
+            text("INSERT INTO users (username, password, account_type) VALUES (:username, :password, :account_type)"),
+            {"username": username, "password": password, "account_type": account_type}
+        )
+        db.session.commit()
+        flash(f"User '{username}' added successfully!", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error adding user: {e}", "danger")
+
+    return redirect(url_for('admin.admin_settings'))
+
+
+@bp.route('/admin/users/<int:user_id>/update', methods=['POST'])
+@roles_required("Admin")
+def update_user(user_id: int):
+    """Update username, password and/or role for a user."""
+    new_username = request.form.get('username')
+    new_password = request.form.get('password')
+    new_role = request.form.get('account_type')
+
+    fields = {}
+    if new_username:
+        fields['username'] = new_username
+    if new_password:
+        fields['password'] = new_password
+    if new_role:
+        fields['account_type'] = new_role
+
+    if not fields:
+        flash("No changes to update.", "info")
+        return redirect(url_for('admin.admin_settings'))
+
+    set_clause = ", ".join(f"{k} = :{k}" for k in fields)
+    fields['id'] = user_id
+
+    try:
+        old_username = db.session.execute(
+            text("SELECT username FROM users WHERE id = :id"),
+            {"id": user_id}
+        ).scalar()
+        db.session.execute(
+            text(f"UPDATE users SET {set_clause} WHERE id = :id"),
+            fields
+        )
+        db.session.commit()
+
+        # Existing sessions carry the old name/role: make the user sign in again
+        if old_username and old_username != session.get('username'):
+            revoke_user_sessions(old_username)
+        elif old_username:
+            # Editing yourself: carry the change over to a fresh session id.
+            session_store.regenerate(session)
+            if new_username:
+                session['username'] = new_username
+            if new_role:
+                session['role'] = (new_role.strip() or 'Employee').upper()
+        flash("User updated successfully.", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error updating user: {e}", "danger")
+
+    return redirect(url_for('admin.admin_settings'))
+
+
+@bp.route('/admin/users/<int:user_id>/delete', methods=['POST'])
+@roles_required("Admin")
+def delete_user(user_id: int):
+    """Delete a user account."""
+    try:
+        # Check if user exists
+        user = db.session.execute(
+            text("SELECT username FROM users WHERE id = :id"),
+            {"id": user_id}
+        ).fetchone()
+
+        if not user:
+            flash("User not found.", "danger")
+            return redirect(url_for('admin.admin_settings'))
+
+        # Prevent deleting yourself
+        if session.get('username') == user.username:
+            flash("You cannot delete your own account!", "danger")
+            return redirect(url_for('admin.admin_settings'))
+
+        # Delete the user
+        db.session.execute(
+            text("DELETE FROM users WHERE id = :id"),
+            {"id": user_id}
+        )
+        db.session.commit()
+        revoke_user_sessions(user.username)
+        flash(f"User '{user.username}' deleted successfully!", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error deleting user: {e}", "danger")
+
+    return redirect(url_for('admin.admin_settings'))
+
+
+@bp.route('/admin/users/<int:user_id>/sessions/revoke', methods=['POST'])
+@roles_required("Admin")
+def revoke_user_sessions_route(user_id: int):
+    """Sign a user out of every active session."""
+    username = db.session.execute(
+        text("SELECT username FROM users WHERE id = :id"),
+        {"id": user_id}
+    ).scalar()
+
+    if not username:
+        flash("User not found.", "danger")
+    elif username == session.get('username'):
+        flash("You cannot revoke your own sessions here. Log out instead.", "danger")
+    else:
+        count = revoke_user_sessions(username)
+        flash(f"Signed '{username}' out of {count} session(s).", "success")
+
+    return redirect(url_for('admin.admin_settings'))
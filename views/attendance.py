@@ -0,0 +1,253 @@
+"""Attendance records, clock devices, the offline kiosk and timesheets."""
+from datetime import date
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, session, url_for
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import kiosk
+import notifications
+import tenants
+import timesheets
+from attendance_analytics import attendance_matrix, parse_range
+from concurrency import last_change
+from extensions import db, replica
+from http_cache import conditional_get
+from idempotency import idempotent
+from rows import LazyRecords
+from views.auth import login_required, roles_required
+
+bp = Blueprint("attendance", __name__)
+
+
+@bp.route('/attendance')
+@login_required
+@conditional_get("employees", "attendance", "departments")
+def attendance():
+    selected_date = request.args.get('date') or date.today().isoformat()
+
+    employees = LazyRecords(
+        db.session.execute,
+        text("SELECT id, name FROM employees WHERE archived_at IS NULL ORDER BY name ASC")
+    )
+
+    attendance_records = LazyRecords(
+        db.session.execute,
+        text("""
+            SELECT a.id, a.employee_id, e.name, d.name AS department, a.date, a.status, a.version,
+                   a.clock_in, a.clock_out, a.worked_hours
+            FROM attendance a
+            JOIN employees e ON a.employee_id = e.id
+            JOIN departments d ON d.id = e.department_id
+            WHERE a.date = :selected_date
+            ORDER BY e.name ASC
+        """),
+        {"selected_date": selected_date}
+    )
+
+    return render_template('attendance.html',
+                           employees=employees,
+                           attendance_records=attendance_records,
+                           date_today=selected_date,
+                           username=session.get('username'))
+
+
+@bp.route('/add_attendance', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager", "Employee")
+@idempotent
+def add_attendance():
+    inserted = db.session.execute(
+        text("""
+            INSERT INTO attendance (employee_id, date, status, recorded_by_supervisor)
+            VALUES (:employee_id, :date, :status, :supervisor)
+            ON CONFLICT (employee_id, date) DO NOTHING
+            RETURNING id
+        """),
+        {"employee_id": request.form['employee_id'],
+         "date": request.form['date'],
+         "status": request.form['status'],
+         "supervisor": (session.get('role') or '').upper() in kiosk.SUPERVISOR_ROLES}
+    ).scalar()
+    if inserted is not None:
+        notifications.publish(db.session.execute, "attendance.added", attendance_id=inserted,
+                              employee_id=int(request.form['employee_id']), date=request.form['date'],
+                              status=request.form['status'])
+    db.session.commit()
+    if inserted is None:
+        flash('Attendance for this employee and date is already recorded.', 'warning')
+        return redirect(url_for('attendance.attendance'))
+    notifications.kick(current_app._get_current_object())
+    flash('Attendance added successfully!', 'success')
+    return redirect(url_for('attendance.attendance'))
+
+
+@bp.route('/edit_attendance/<int:id>', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def edit_attendance(id):
+    version = request.form.get('version', type=int)
+    if version is None:
+        flash('This attendance form is out of date. Please reopen the record and try again.', 'warning')
+        return redirect(url_for('attendance.attendance'))
+
+    try:
+        updated = db.session.execute(
+            text("""
+                UPDATE attendance
+                SET employee_id=:employee_id, date=:date, status=:status, version = version + 1,
+                    recorded_at = CURRENT_TIMESTAMP, recorded_by_supervisor = TRUE
+                WHERE id=:id AND version=:version
+                RETURNING id
+            """),
+            {"employee_id": request.form['employee_id'],
+             "date": request.form['date'],
+             "status": request.form['status'],
+             "id": id,
+             "version": version}
+        ).scalar()
+        if updated is not None:
+            notifications.publish(db.session.execute, "attendance.updated", attendance_id=id,
+                                  employee_id=int(request.form['employee_id']), date=request.form['date'],
+                                  status=request.form['status'])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash('Attendance for this employee and date is already recorded.', 'warning')
+        return redirect(url_for('attendance.attendance'))
+
+    if updated is None:
+        current = db.session.execute(
+            text("SELECT status, date FROM attendance WHERE id=:id"), {"id": id}
+        ).fetchone()
+        if current is None:
+            flash('This attendance record was deleted by someone else; your change was not saved.', 'danger')
+        else:
+            changed_by, _ = last_change(db.session.execute, "attendance", id)
+            flash(f'This attendance record was changed by {changed_by or "another user"} while you were editing '
+                  f'(now {current[1]}, {current[0]}); your change was not saved. Please review and edit again.',
+                  'warning')
+        return redirect(url_for('attendance.attendance'))
+
+    notifications.kick(current_app._get_current_object())
+    flash('Attendance updated successfully!', 'success')
+    return redirect(url_for('attendance.attendance'))
+
+
+@bp.route('/delete_attendance/<int:id>', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def delete_attendance(id):
+    db.session.execute(text("DELETE FROM attendance WHERE id = :id"), {"id": id})
+    db.session.commit()
+    flash('Attendance record deleted successfully!', 'success')
+    return redirect(url_for('attendance.attendance'))
+
+
+@bp.route('/api/attendance/analytics')
+@roles_required("Admin", "Manager", "Assistant Manager")
+def attendance_analytics():
+    """Attendance counts per department, period and status as JSON."""
+    try:
+        start, end, grain, department_id = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(attendance_matrix(replica.execute, start, end, grain, department_id))
+
+
+@bp.route('/api/clock_events', methods=['POST'])
+def ingest_clock_events():
+    """Batched clock-in/out punches from kiosks and biometric devices.
+
+    Devices authenticate with an ``X-Device-Token`` listed in
+    ``CLOCK_DEVICE_TOKENS`` (as ``slug:token`` for the tenant in ``X-Tenant``
+    in multi-tenant mode); logged-in managers may post batches as well.
+    """
+    role = (session.get('role') or '').upper()
+    if not (timesheets.device_authorized(request.headers.get('X-Device-Token'), current_app.config['CLOCK_DEVICE_TOKENS'],
+                                         tenants.current())
+            or role in ('ADMIN', 'MANAGER', 'ASSISTANT MANAGER')):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        columns = timesheets.parse_events(request.get_json(silent=True), request.headers.get('X-Device-Id'))
+    except timesheets.EventError as e:
+        return jsonify({'error': str(e)}), 400
+
+    stored = timesheets.ingest(db.session.execute, columns)
+    db.session.commit()
+    timesheets.kick(current_app._get_current_object())
+    received = len(columns['kinds'])
+    return jsonify({'received': received, 'stored': stored, 'skipped': received - stored}), 202
+
+
+@bp.route('/kiosk')
+@roles_required("Admin", "Manager", "Assistant Manager")
+def kiosk_page():
+    employees = LazyRecords(
+        db.session.execute,
+        text("SELECT id, name FROM employees WHERE archived_at IS NULL ORDER BY name ASC")
+    )
+    return render_template('kiosk.html',
+                           employees=employees,
+                           statuses=kiosk.STATUSES,
+                           today=date.today().isoformat(),
+                           sync_batch=current_app.config['KIOSK_SYNC_BATCH'],
+                           sync_seconds=current_app.config['KIOSK_SYNC_SECONDS'],
+                           max_batch=kiosk.MAX_BATCH)
+
+
+@bp.route('/kiosk/sw.js')
+def kiosk_service_worker():
+    # Served under /kiosk rather than /static so that it may control the kiosk page.
+    response = current_app.send_static_file('js/kiosk-sw.js')
+    response.headers['Service-Worker-Allowed'] = url_for('attendance.kiosk_page')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@bp.route('/kiosk/sync', methods=['POST'])
+def kiosk_sync():
+    """A batch of attendance entries queued by an offline kiosk, possibly gzipped.
+
+    Answers JSON rather than redirecting, so the kiosk can tell a lost
+    session from a lost connection and keep its queue either way.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Entries may overwrite existing rows, which only supervisors may edit.
+    supervisor = (session.get('role') or '').upper() in kiosk.SUPERVISOR_ROLES
+    if not supervisor:
+        return jsonify({'error': 'Only supervisors may sync kiosk entries'}), 403
+
+    try:
+        payload = kiosk.decode(request.get_data(), request.headers.get('Content-Encoding'))
+        columns, rejected = kiosk.parse_entries(payload)
+    except kiosk.SyncError as e:
+        return jsonify({'error': str(e)}), 400
+
+    received = len(columns['indexes']) + len(rejected)
+    applied, unknown = kiosk.sync(db.session.execute, columns, supervisor, current_app.config['KIOSK_CONFLICT_RULE'])
+    if applied:
+        notifications.publish(db.session.execute, "attendance.synced", device_id=payload.get('device_id'),
+                              applied=applied, recorded_by=session.get('username'))
+    db.session.commit()
+    if applied:
+        notifications.kick(current_app._get_current_object())
+
+    rejected += [{'index': i, 'error': 'unknown or deleted employee'} for i in unknown]
+    return jsonify({'received': received, 'applied': applied,
+                    'kept': received - applied - len(rejected), 'rejected': rejected})
+
+
+@bp.route('/api/timesheet/<int:employee_id>')
+@roles_required("Admin", "Manager", "Assistant Manager")
+def employee_timesheet(employee_id):
+    """Days worked and OT hours of one employee over ``start``..``end``."""
+    try:
+        start = date.fromisoformat(request.args['start'])
+        end = date.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+
+    totals = timesheets.period_totals(replica.execute, employee_id, start, end,
+                                      current_app.config['REGULAR_HOURS_PER_DAY'])
+    return jsonify(dict(totals))
@@ -0,0 +1,143 @@
+"""Login, registration and the access-control decorators every view uses."""
+from functools import wraps
+
+from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from sqlalchemy import text
+
+import session_store
+import tenants
+from extensions import db
+
+bp = Blueprint("auth", __name__)
+
+
+def login_required(view_func):
+    """Require a logged-in user."""
+
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        if "username" not in session:
+            flash("Please log in to continue.", "danger")
+            return redirect(url_for("auth.home"))
+        return view_func(*args, **kwargs)
+
+    return wrapper
+
+
+def roles_required(*allowed_roles):
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            if "username" not in session:
+                flash("Please log in to continue.", "danger")
+                return redirect(url_for("auth.home"))
+
+            role = (session.get("role") or "EMPLOYEE").upper()
+            allowed = {r.upper() for r in allowed_roles}
+            if allowed and role not in allowed:
+                flash("You do not have permission to access this page.", "danger")
+                return redirect(url_for("main.dashboard"))
+
+            return view_func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@bp.route('/')
+def home():
+    return render_template('login.html')
+
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        if tenants.enabled():
+            try:
+                tenants.activate(request.form.get('company', '').strip().lower())
+            except tenants.TenantError as e:
+                flash(str(e), "danger")
+                return redirect(url_for('auth.register'))
+
+        # Check if username already exists
+        result = db.session.execute(
+            text("SELECT 1 FROM users WHERE username = :username"),
+            {"username": username}
+        )
+        existing_user = result.first()
+
+        if existing_user:
+            flash("Username already taken!", "danger")
+            return redirect(url_for('auth.register'))
+
+        # Insert new user
+        db.session.execute(
+            text("""
+                INSERT INTO users (username, password)
+                VALUES (:username, :password)
+            """),
+            {
+                "username": username,
+                "password": password
+            }
+        )
+        db.session.commit()
+
+        flash("Account created successfully! You can now log in.", "success")
+        return redirect(url_for('auth.home'))
+
+    return render_template('register.html')
+
+
+@bp.route('/login', methods=['POST'])
+def login():
+    username = request.form['username']
+    password = request.form['password']
+    if tenants.enabled():
+        try:
+            tenants.activate(request.form.get('company', '').strip().lower())
+        except tenants.TenantError as e:
+            flash(str(e), "danger")
+            return redirect(url_for('auth.home'))
+
+    result = db.session.execute(
+        text("""
+            SELECT username, account_type
+            FROM users
+            WHERE username = :username
+              AND password = :password
+        """),
+        {
+            "username": username,
+            "password": password
+        }
+    )
+
+    user = result.mappings().first()
+
+    if user:
+        # Never promote an id the browser had before logging in.
+        session_store.regenerate(session)
+        session['username'] = user['username']
+        if tenants.enabled():
+            session['tenant'] = tenants.current()
+
+        # Normalize role from DB
+        raw_role = user.get('account_type') or 'Employee'
+        session['role'] = (raw_role.strip() or 'Employee').upper()
+
+        return redirect(url_for('main.dashboard'))
+
+    flash("Invalid username or password.", "danger")
+    return redirect(url_for('auth.home'))
+
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    flash("You have been logged out successfully.", "info")
+    return redirect(url_for('auth.home'))
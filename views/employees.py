@@ -0,0 +1,141 @@
+"""Employees and the department tree they belong to."""
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+from sqlalchemy import text
+
+import archival
+import departments as org
+from extensions import db
+from http_cache import conditional_get
+from idempotency import idempotent
+from rows import LazyRecords
+from views.auth import login_required, roles_required
+
+bp = Blueprint("employees", __name__)
+
+
+@bp.route('/employees')
+@login_required
+@conditional_get("employees", "departments")
+def employees():
+    # Streamed into the template; never queried while the rows are cached
+    employees = LazyRecords(db.session.execute, text("""
+        SELECT e.id, e.name, e.position, e.department_id, d.name AS department, e.email, e.status
+        FROM employees e
+        JOIN departments d ON d.id = e.department_id
+        WHERE e.archived_at IS NULL ORDER BY e.name ASC
+    """))
+
+    return render_template('employees.html', employees=employees, departments=org.tree(db.session.execute),
+                           username=session.get('username'))
+
+
+@bp.route('/add_employee', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+@idempotent
+def add_employee():
+    name = request.form['name']
+    position = request.form['position']
+    department_id = request.form.get('department_id', type=int)
+    status = request.form['status']
+    if department_id is None:
+        flash("Choose a department for the employee.", "danger")
+        return redirect(url_for('employees.employees'))
+
+    # Insert new employee using parameter binding
+    db.session.execute(
+        text("""
+            INSERT INTO employees (name, position, department_id, email, status)
+            VALUES (:name, :position, :department_id, :email, :status)
+        """),
+        {"name": name, "position": position, "department_id": department_id,
+         "email": request.form.get('email', '').strip() or None, "status": status}
+    )
+    db.session.commit()  # commit the transaction
+
+    flash("Employee added successfully!", "success")
+    return redirect(url_for('employees.employees'))
+
+
+@bp.route('/update_employee', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def update_employee():
+    db.session.execute(
+        text("""
+            UPDATE employees 
+            SET name=:name, position=:position, department_id=:department_id, email=:email, status=:status 
+            WHERE id=:id
+        """),
+        {"id": request.form['id'],
+         "name": request.form['name'],
+         "position": request.form['position'],
+         "department_id": request.form['department_id'],
+         "email": request.form.get('email', '').strip() or None,
+         "status": request.form['status']}
+    )
+    db.session.commit()
+    flash("Employee updated successfully!", "success")
+    return redirect(url_for('employees.employees'))
+
+
+@bp.route('/departments', methods=['GET', 'POST'])
+@roles_required("Admin", "Manager")
+def departments_page():
+    if request.method == 'POST':
+        try:
+            org.create(db.session.execute, request.form.get('name', '').strip(),
+                       request.form.get('parent_id', type=int))
+        except org.DepartmentError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('employees.departments_page'))
+        db.session.commit()
+        flash('Department added.', 'success')
+        return redirect(url_for('employees.departments_page'))
+
+    return render_template('departments.html',
+                           departments=org.rollup(db.session.execute),
+                           username=session.get('username'))
+
+
+@bp.route('/departments/<int:id>', methods=['POST'])
+@roles_required("Admin", "Manager")
+def update_department(id):
+    try:
+        org.update(db.session.execute, id, request.form.get('name', '').strip(),
+                   request.form.get('parent_id', type=int))
+    except org.DepartmentError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('employees.departments_page'))
+    db.session.commit()
+    flash('Department updated.', 'success')
+    return redirect(url_for('employees.departments_page'))
+
+
+@bp.route('/departments/<int:id>/delete', methods=['POST'])
+@roles_required("Admin", "Manager")
+def delete_department(id):
+    try:
+        org.delete(db.session.execute, id)
+    except org.DepartmentError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('employees.departments_page'))
+    db.session.commit()
+    flash('Department removed.', 'success')
+    return redirect(url_for('employees.departments_page'))
+
+
+@bp.route('/delete_employee/<int:id>', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def delete_employee(id):
+    # Soft delete; attendance, payroll and assignments move to the archive
+    # tables in the background instead of one long cascading DELETE.
+    archived = archival.archive(db.session.execute, "employee", id, session.get('username'))
+    db.session.commit()
+    if not archived:
+        flash("Employee not found!", "danger")
+        return redirect(url_for('employees.employees'))
+    archival.kick(current_app._get_current_object())
+    flash("Employee deleted successfully!", "success")
+    return redirect(url_for('employees.employees'))
@@ -0,0 +1,125 @@
+"""Dashboard, notifications inbox and search: the pages every user lands on."""
+from datetime import date
+
+from flask import Blueprint, redirect, render_template, request, session, url_for
+from sqlalchemy import text
+
+import departments as org
+import notifications
+import search
+from extensions import db, replica
+from http_cache import conditional_get
+from views.auth import login_required
+
+bp = Blueprint("main", __name__)
+
+
+@bp.route('/dashboard')
+@login_required
+@conditional_get("employees", "projects", "attendance", "payroll", "departments")
+def dashboard():
+    # Every figure can be narrowed to a department and its sub-units.
+    department_id = request.args.get('department_id', type=int)
+    params = {"department_id": department_id}
+
+    # Total employees
+    result = replica.execute(
+        text(f"""
+            SELECT COUNT(*) AS total FROM employees
+            WHERE archived_at IS NULL {org.subtree_filter('department_id', department_id)}
+        """),
+        params
+    )
+    total_employees = result.scalar()
+
+    # Active projects
+    result = replica.execute(
+        text(f"""
+            SELECT COUNT(*) AS total FROM projects
+            WHERE status = 'Active' AND archived_at IS NULL {org.subtree_filter('department_id', department_id)}
+        """),
+        params
+    )
+    active_projects = result.scalar()
+
+    # Attendance rate today
+    today = date.today()
+
+    result = replica.execute(
+        text(f"""
+            SELECT COUNT(*) FROM attendance a
+            JOIN employees e ON e.id = a.employee_id
+            WHERE a.date = :today {org.subtree_filter('e.department_id', department_id)}
+        """),
+        {"today": today, **params}
+    )
+    total_attendance = result.scalar()
+
+    result = replica.execute(
+        text(f"""
+            SELECT COUNT(*)
+            FROM attendance a
+            JOIN employees e ON e.id = a.employee_id
+            WHERE a.date = :today AND a.status = 'Present' {org.subtree_filter('e.department_id', department_id)}
+        """),
+        {"today": today, **params}
+    )
+    present = result.scalar()
+
+    attendance_rate = 0
+    if total_attendance and total_attendance > 0:
+        attendance_rate = round((present / total_attendance) * 100, 2)
+
+    # Payroll this month (PostgreSQL-compatible)
+    result = replica.execute(
+        text(f"""
+            SELECT COALESCE(SUM(p.net_pay), 0)
+            FROM payroll p
+            JOIN employees e ON e.id = p.employee_id
+            WHERE p.pay_period_end >= date_trunc('month', CURRENT_DATE)
+              AND p.pay_period_end < date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+              {org.subtree_filter('e.department_id', department_id)}
+        """),
+        params
+    )
+    payroll_month = result.scalar()
+
+    return render_template(
+        'dashboard.html',
+        username=session['username'],
+        total_employees=total_employees,
+        active_projects=active_projects,
+        attendance_rate=attendance_rate,
+        payroll_month=payroll_month,
+        departments=org.tree(replica.execute),
+        department_id=department_id
+    )
+
+
+@bp.route('/notifications', methods=['GET', 'POST'])
+@login_required
+def notifications_page():
+    # In-app messages delivered by the notification dispatcher.
+    if request.method == 'POST':
+        notifications.mark_read(db.session.execute, session['username'])
+        db.session.commit()
+        return redirect(url_for('main.notifications_page'))
+    return render_template('notifications.html',
+                           messages=notifications.inbox(db.session.execute, session['username']),
+                           username=session.get('username'))
+
+
+@bp.route('/search')
+@login_required
+def search_page():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+    role = session.get('role')
+
+    hits, total, counts = search.search(replica.execute, query, search.kinds_for(role, kind), page)
+    return render_template('search.html',
+                           query=query, kind=kind, page=page, hits=hits, total=total, counts=counts,
+                           kinds={k: search.KINDS[k] for k in search.kinds_for(role)},
+                           pages=-(-total // search.PER_PAGE),
+                           username=session.get('username'))
@@ -0,0 +1,712 @@
+"""Payroll records, pay periods, pay rules and holidays, and payslip runs."""
+import os
+from datetime import date
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, send_file, session, url_for
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import money
+import notifications
+import pay_periods as periods
+import pay_rules
+import payslips
+import timesheets
+from concurrency import PAYROLL_EDIT_FIELDS, last_change, load_base, merge
+from extensions import db, replica
+from http_cache import conditional_get
+from idempotency import idempotent
+from rows import LazyRecords, as_record, fetch_records
+from views.auth import login_required, roles_required
+from views.projects import flash_staffing_conflicts
+
+bp = Blueprint("payroll", __name__)
+
+
+@bp.route('/payroll')
+@login_required
+@conditional_get("payroll", "employees", "projects")
+def payroll():
+    # Only the columns the table shows, streamed; the edit modal loads the rest
+    # from /get_payroll.
+    payroll_records = LazyRecords(
+        db.session.execute,
+        text("""
+            SELECT p.id, e.name, e.position, pr.project_name,
+                   p.pay_period_start, p.pay_period_end, p.basic_salary, p.overtime,
+                   p.deductions, p.net_pay, p.status, p.period_closed
+            FROM payroll p
+            JOIN employees e ON p.employee_id = e.id
+            LEFT JOIN projects pr ON p.project_id = pr.id
+            ORDER BY p.pay_period_end DESC, p.created_at DESC
+        """)
+    )
+
+    employees = LazyRecords(
+        db.session.execute,
+        text("SELECT id, name, position FROM employees WHERE archived_at IS NULL ORDER BY name")
+    )
+
+    projects = LazyRecords(
+        db.session.execute,
+        text("SELECT id, project_name FROM projects WHERE archived_at IS NULL ORDER BY project_name")
+    )
+
+    # Closed periods come from payroll_period_totals; only open rows are summed live.
+    summary = periods.payroll_summary(db.session.execute)
+
+    return render_template('payroll.html',
+                           payroll_records=payroll_records,
+                           employees=employees,
+                           projects=projects,
+                           summary=summary,
+                           username=session.get('username'))
+
+
+@bp.route('/add_payroll', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+@idempotent
+def add_payroll():
+    employee_id = request.form['employee_id']
+    project_id = request.form.get('project_id') or None
+    pay_period_start = request.form['pay_period_start']
+    pay_period_end = request.form['pay_period_end']
+    position = request.form.get('position', '')
+
+    # Amounts are Decimals rounded to the cent as typed, and every total
+    # below is an exact sum of them, so net pay always equals gross pay
+    # minus deductions to the cent.
+    try:
+        # Excel-style fields
+        daily_rate = money.form_money(request.form, 'daily_rate')
+        meal = money.form_money(request.form, 'meal')
+        transpo = money.form_money(request.form, 'transpo')
+        days_worked = int(request.form.get('days_worked', 0) or 0)
+        total_ot_hours = money.form_money(request.form, 'total_ot_hours')
+        holiday_pay = money.form_money(request.form, 'holiday_pay')
+        holiday_pay_amount = money.form_money(request.form, 'holiday_pay_amount')
+        others = money.form_money(request.form, 'others')
+        cash_advance = money.form_money(request.form, 'cash_advance')
+        # Legacy/simple fields
+        basic_salary = money.form_money(request.form, 'basic_salary')
+        overtime = money.form_money(request.form, 'overtime')
+        deductions = money.form_money(request.form, 'deductions')
+    except money.MoneyError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+    from_timesheet = not request.form.get('days_worked') and not request.form.get('total_ot_hours')
+    if from_timesheet and db.session.execute(
+        text("""
+            SELECT 1 FROM payroll
+            WHERE employee_id = :employee_id AND pay_period_start = :start AND pay_period_end = :end
+              AND project_id IS DISTINCT FROM CAST(:project_id AS INT)
+        """),
+        {"employee_id": employee_id, "project_id": project_id,
+         "start": pay_period_start, "end": pay_period_end}
+    ).first():
+        # Attendance has no project: the timesheet is already paid on the other row.
+        flash('This employee already has payroll for that period on another project; '
+              'enter Days Worked and OT Hours for this one.', 'danger')
+        return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+    if from_timesheet:
+        # Not typed in: take them from the clocked timesheet of the period.
+        sheet = timesheets.period_totals(db.session.execute, employee_id,
+                                         request.form['pay_period_start'], request.form['pay_period_end'],
+                                         current_app.config['REGULAR_HOURS_PER_DAY'])
+        days_worked, total_ot_hours = sheet['days_worked'], money.to_money(sheet['total_ot_hours'])
+
+    # OT, holiday premiums and night differential follow the pay rules.  From
+    # a timesheet every day is priced by its day type; typed-in OT hours are
+    # priced at the regular-day rate.
+    night_diff = money.ZERO
+    regular_hours = current_app.config['REGULAR_HOURS_PER_DAY']
+    if from_timesheet and daily_rate > 0:
+        priced = pay_rules.price_payroll(
+            db.session.execute,
+            date.fromisoformat(pay_period_start), date.fromisoformat(pay_period_end),
+            [int(employee_id)], [project_id], [money.to_cents(daily_rate)],
+            regular_hours, current_app.config['REST_DAYS']
+        )
+        rule_ot_amount = money.from_cents(priced['ot_amount'][0])
+        night_diff = money.from_cents(priced['night_diff'][0])
+        if not request.form.get('holiday_pay_amount'):
+            holiday_pay_amount = money.from_cents(priced['holiday_pay_amount'][0])
+    else:
+        rule_ot_amount = pay_rules.ot_amount(db.session.execute, project_id, daily_rate, total_ot_hours,
+                                             regular_hours)
+
+    if basic_salary > 0:  # Legacy mode
+        net_pay = basic_salary + overtime - deductions
+        total_daily_salary = (daily_rate + meal + transpo if daily_rate > 0
+                              else money.average(basic_salary, max(days_worked, 1)))
+        ot_amount = rule_ot_amount if total_ot_hours > 0 and daily_rate > 0 else overtime
+        total_deductions = cash_advance if cash_advance > 0 else deductions
+        gross_pay = basic_salary + overtime
+    else:  # Excel-style mode
+        total_daily_salary = daily_rate + meal + transpo
+        ot_amount = rule_ot_amount if daily_rate > 0 else money.ZERO
+        total_deductions = cash_advance
+        gross_pay = (total_daily_salary * days_worked) + ot_amount + holiday_pay_amount + night_diff + others
+        net_pay = gross_pay - total_deductions
+        basic_salary = total_daily_salary * days_worked
+        overtime = ot_amount
+        deductions = total_deductions
+
+    status = request.form.get('status', 'Pending')
+
+    if periods.period_is_closed(db.session.execute, pay_period_start, pay_period_end):
+        flash('That pay period is closed; its payroll can no longer change.', 'danger')
+        return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+
+    # Insert payroll record; a second row for the same employee, project and
+    # period is rejected by uq_payroll_employee_project_period.
+    inserted = db.session.execute(
+        text("""
+            INSERT INTO payroll (
+                employee_id, project_id, pay_period_start, pay_period_end, position,
+                daily_rate, meal, transpo, total_daily_salary, days_worked,
+                total_ot_hours, ot_amount, holiday_pay, holiday_pay_amount, night_diff, others,
+                cash_advance, total_deductions, gross_pay, net_pay,
+                basic_salary, overtime, deductions, status
+            ) VALUES (
+                :employee_id, :project_id, :pay_period_start, :pay_period_end, :position,
+                :daily_rate, :meal, :transpo, :total_daily_salary, :days_worked,
+                :total_ot_hours, :ot_amount, :holiday_pay, :holiday_pay_amount, :night_diff, :others,
+                :cash_advance, :total_deductions, :gross_pay, :net_pay,
+                :basic_salary, :overtime, :deductions, :status
+            )
+            ON CONFLICT (employee_id, (COALESCE(project_id, 0)), pay_period_start, pay_period_end) DO NOTHING
+            RETURNING id
+        """),
+        {
+            "employee_id": employee_id,
+            "project_id": project_id,
+            "pay_period_start": pay_period_start,
+            "pay_period_end": pay_period_end,
+            "position": position,
+            "daily_rate": daily_rate,
+            "meal": meal,
+            "transpo": transpo,
+            "total_daily_salary": total_daily_salary,
+            "days_worked": days_worked,
+            "total_ot_hours": total_ot_hours,
+            "ot_amount": ot_amount,
+            "holiday_pay": holiday_pay,
+            "holiday_pay_amount": holiday_pay_amount,
+            "night_diff": night_diff,
+            "others": others,
+            "cash_advance": cash_advance,
+            "total_deductions": total_deductions,
+            "gross_pay": gross_pay,
+            "net_pay": net_pay,
+            "basic_salary": basic_salary,
+            "overtime": overtime,
+            "deductions": deductions,
+            "status": status
+        }
+    ).scalar()
+    if inserted is None:
+        db.session.rollback()
+        flash('A payroll record for this employee, project and pay period already exists.', 'warning')
+        return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+
+    # Ensure employee is assigned to project if project_id provided
+    if project_id:
+        exists_result = db.session.execute(
+            text("SELECT 1 FROM project_employees WHERE employee_id=:employee_id AND project_id=:project_id"),
+            {"employee_id": employee_id, "project_id": project_id}
+        ).fetchone()
+        if not exists_result:
+            db.session.execute(
+                text("INSERT INTO project_employees (employee_id, project_id) VALUES (:employee_id, :project_id)"),
+                {"employee_id": employee_id, "project_id": project_id}
+            )
+
+    notifications.publish(db.session.execute, "payroll.added", payroll_id=inserted, employee_id=int(employee_id),
+                          project_id=project_id, start=pay_period_start, end=pay_period_end, net_pay=net_pay)
+    db.session.commit()
+    notifications.kick(current_app._get_current_object())
+
+    flash_msg = 'Payroll record added successfully!'
+    if project_id:
+        flash_msg += ' Employee assigned to project.'
+    flash(flash_msg, 'success')
+    if project_id and not exists_result:
+        flash_staffing_conflicts(project_id, [employee_id])
+
+    # Redirect
+    return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+
+
+@bp.route('/edit_payroll', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def edit_payroll():
+    try:
+        id = int(request.form['id'])
+        version = request.form.get('version', type=int)
+        if version is None:
+            flash('This payroll form is out of date. Please reopen the record and try again.', 'warning')
+            return redirect(url_for('payroll.payroll'))
+        employee_id = request.form['employee_id']
+        project_id = request.form.get('project_id') or None
+        pay_period_start = request.form['pay_period_start']
+        pay_period_end = request.form['pay_period_end']
+        basic_salary = money.form_money(request.form, 'basic_salary')
+        overtime = money.form_money(request.form, 'overtime')
+        deductions = money.form_money(request.form, 'deductions')
+        status = request.form.get('status', 'Pending')
+
+        gross_pay = basic_salary + overtime
+        total_deductions = deductions
+        net_pay = gross_pay - total_deductions
+
+        if periods.period_is_closed(db.session.execute, pay_period_start, pay_period_end):
+            flash('That pay period is closed; its payroll can no longer change.', 'danger')
+            return redirect(url_for('payroll.payroll'))
+
+        updated = db.session.execute(
+            text("""
+                UPDATE payroll 
+                SET employee_id=:employee_id,
+                    project_id=:project_id,
+                    pay_period_start=:pay_period_start,
+                    pay_period_end=:pay_period_end,
+                    basic_salary=:basic_salary,
+                    overtime=:overtime,
+                    deductions=:deductions,
+                    gross_pay=:gross_pay,
+                    total_deductions=:total_deductions,
+                    net_pay=:net_pay,
+                    status=:status,
+                    version = version + 1
+                WHERE id=:id AND version=:version AND NOT period_closed
+                RETURNING id
+            """),
+            {
+                "employee_id": employee_id,
+                "project_id": project_id,
+                "pay_period_start": pay_period_start,
+                "pay_period_end": pay_period_end,
+                "basic_salary": basic_salary,
+                "overtime": overtime,
+                "deductions": deductions,
+                "gross_pay": gross_pay,
+                "total_deductions": total_deductions,
+                "net_pay": net_pay,
+                "status": status,
+                "id": id,
+                "version": version
+            }
+        ).scalar()
+        if updated is None:
+            db.session.rollback()
+            return payroll_edit_conflict(id, version)
+        notifications.publish(db.session.execute, "payroll.updated", payroll_id=id, employee_id=int(employee_id),
+                              project_id=project_id, start=pay_period_start, end=pay_period_end, net_pay=net_pay)
+        db.session.commit()
+        notifications.kick(current_app._get_current_object())
+        flash('Payroll record updated successfully!', 'success')
+        return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error updating payroll: {str(e)}', 'danger')
+        return redirect(url_for('payroll.payroll'))
+
+
+def payroll_edit_conflict(id, version):
+    """Merge view for an edit that lost the race to a concurrent update."""
+    current = db.session.execute(
+        text("SELECT * FROM payroll WHERE id=:id"), {"id": id}
+    ).mappings().first()
+    if current is None:
+        flash('This payroll record was deleted by someone else; your changes were not saved.', 'danger')
+        return redirect(url_for('payroll.payroll'))
+    if current['period_closed']:
+        flash('This payroll record belongs to a closed pay period and can no longer change.', 'danger')
+        return redirect(url_for('payroll.payroll'))
+
+    base = load_base(db.session.execute, "payroll", id, version)
+    fields = merge(PAYROLL_EDIT_FIELDS, base, request.form, current)
+    changed_by, changed_at = last_change(db.session.execute, "payroll", id)
+
+    employees = db.session.execute(
+        text("SELECT id, name, position FROM employees ORDER BY name")
+    ).mappings().all()
+    projects = db.session.execute(
+        text("SELECT id, project_name FROM projects ORDER BY project_name")
+    ).mappings().all()
+
+    return render_template('edit_payroll.html',
+                           payroll_record=current,
+                           fields=fields,
+                           changed_by=changed_by,
+                           changed_at=changed_at,
+                           employees=employees,
+                           projects=projects,
+                           username=session.get('username')), 409
+
+
+@bp.route('/get_payroll/<int:id>', methods=['GET'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def get_payroll(id):
+    result = db.session.execute(
+        text("SELECT * FROM payroll WHERE id=:id"),
+        {"id": id}
+    )
+    record = result.mappings().first()
+    if record:
+        return jsonify(dict(record))
+    return jsonify({'error': 'Record not found'}), 404
+
+
+@bp.route('/delete_payroll/<int:id>', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def delete_payroll(id):
+    # Get project_id before deleting (for redirect)
+    project_result = db.session.execute(
+        text("SELECT project_id FROM payroll WHERE id=:id"),
+        {"id": id}
+    ).fetchone()
+    project_id = project_result.project_id if project_result else None
+
+    deleted = db.session.execute(
+        text("DELETE FROM payroll WHERE id=:id AND NOT period_closed RETURNING id"),
+        {"id": id}
+    ).scalar()
+    db.session.commit()
+    if deleted is None and project_result:
+        flash('This payroll record belongs to a closed pay period and cannot be deleted.', 'danger')
+    else:
+        flash('Payroll record deleted successfully!', 'success')
+    return redirect(url_for('payroll.project_payroll', project_id=project_id)) if project_id else redirect(url_for('payroll.payroll'))
+
+
+@bp.route('/payroll_overview')
+@login_required
+@conditional_get("projects", "payroll", "project_employees", "departments")
+def payroll_overview():
+    result = replica.execute(text("""
+        SELECT 
+            pr.id,
+            pr.project_name,
+            (SELECT name FROM departments WHERE id = pr.department_id) AS department,
+            pr.status,
+            COALESCE((SELECT COUNT(DISTINCT employee_id) FROM project_employees WHERE project_id = pr.id), 0) AS employee_count,
+            COALESCE((SELECT COUNT(DISTINCT employee_id) FROM payroll WHERE project_id = pr.id), 0) AS employees_with_payroll
+        FROM projects pr
+        WHERE pr.archived_at IS NULL
+        ORDER BY pr.project_name
+    """))
+    totals = periods.totals_by(replica.execute, "project")
+    projects = []
+    for project in fetch_records(result, extra=('total_payroll_cost', 'payroll_record_count')):
+        project_totals = totals.get(project.id)
+        projects.append(project._replace(
+            total_payroll_cost=project_totals['net_pay'] if project_totals else money.ZERO,
+            payroll_record_count=project_totals['records'] if project_totals else 0,
+        ))
+    return render_template('payroll_overview.html', projects=projects, username=session.get('username'))
+
+
+@bp.route('/pay_periods', methods=['GET', 'POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def pay_periods():
+    if request.method == 'POST':
+        if session.get('role') not in ("ADMIN", "MANAGER"):
+            flash("Access denied.", "danger")
+            return redirect(url_for('payroll.pay_periods'))
+        try:
+            periods.create_period(
+                db.session.execute,
+                date.fromisoformat(request.form['period_start']),
+                date.fromisoformat(request.form['period_end'])
+            )
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('payroll.pay_periods'))
+        db.session.commit()
+        flash('Pay period added.', 'success')
+        return redirect(url_for('payroll.pay_periods'))
+
+    return render_template('pay_periods.html',
+                           periods=periods.list_periods(db.session.execute),
+                           username=session.get('username'))
+
+
+def _pay_period_step(step, id, message):
+    try:
+        result = step(id)
+    except (periods.PeriodError, pay_rules.RuleError) as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('payroll.pay_periods'))
+    db.session.commit()
+    flash(message.format(result=result), 'success')
+    return redirect(url_for('payroll.pay_periods'))
+
+
+@bp.route('/pay_periods/<int:id>/approve', methods=['POST'])
+@roles_required("Admin", "Manager")
+def approve_pay_period(id):
+    return _pay_period_step(
+        lambda pid: periods.approve_period(db.session.execute, pid, session.get('username')),
+        id, 'Pay period approved.'
+    )
+
+
+@bp.route('/pay_periods/<int:id>/reopen', methods=['POST'])
+@roles_required("Admin", "Manager")
+def reopen_pay_period(id):
+    return _pay_period_step(
+        lambda pid: periods.reopen_period(db.session.execute, pid),
+        id, 'Pay period reopened.'
+    )
+
+
+@bp.route('/pay_periods/<int:id>/close', methods=['POST'])
+@roles_required("Admin", "Manager")
+def close_pay_period(id):
+    def close(pid):
+        frozen = periods.close_period(db.session.execute, pid, session.get('username'))
+        notifications.publish(db.session.execute, "pay_period.closed", pay_period_id=pid, records=frozen)
+        return frozen
+
+    response = _pay_period_step(close, id, 'Pay period closed; {result} payroll record(s) frozen.')
+    notifications.kick(current_app._get_current_object())
+    return response
+
+
+@bp.route('/pay_periods/<int:id>/reprice', methods=['POST'])
+@roles_required("Admin", "Manager")
+def reprice_pay_period(id):
+    return _pay_period_step(
+        lambda pid: pay_rules.reprice_period(db.session.execute, pid, current_app.config['REGULAR_HOURS_PER_DAY'],
+                                             current_app.config['REST_DAYS']),
+        id, '{result[0]} payroll record(s) re-priced from attendance; {result[1]} skipped because '
+            'their employee has payroll on several projects in the period.'
+    )
+
+
+@bp.route('/pay_rules', methods=['GET', 'POST'])
+@roles_required("Admin", "Manager")
+def pay_rules_page():
+    if request.method == 'POST':
+        try:
+            pay_rules.save_rule(db.session.execute, request.form.get('project_id', type=int),
+                                request.form.get('day_type'), request.form)
+        except pay_rules.RuleError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('payroll.pay_rules_page'))
+        db.session.commit()
+        flash('Pay rule saved.', 'success')
+        return redirect(url_for('payroll.pay_rules_page'))
+
+    year = request.args.get('year', date.today().year, type=int)
+    return render_template('pay_rules.html',
+                           rules=pay_rules.list_rules(db.session.execute),
+                           holidays=pay_rules.list_holidays(db.session.execute, year),
+                           year=year,
+                           day_types=pay_rules.DAY_TYPES,
+                           holiday_kinds=pay_rules.HOLIDAY_KINDS,
+                           projects=fetch_records(db.session.execute(text(
+                               "SELECT id, project_name FROM projects WHERE archived_at IS NULL ORDER BY project_name"
+                           ))),
+                           username=session.get('username'))
+
+
+@bp.route('/pay_rules/<int:id>/delete', methods=['POST'])
+@roles_required("Admin", "Manager")
+def delete_pay_rule(id):
+    try:
+        pay_rules.delete_rule(db.session.execute, id)
+    except pay_rules.RuleError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('payroll.pay_rules_page'))
+    db.session.commit()
+    flash('Project override removed.', 'success')
+    return redirect(url_for('payroll.pay_rules_page'))
+
+
+@bp.route('/holidays', methods=['POST'])
+@roles_required("Admin", "Manager")
+def save_holiday():
+    try:
+        holiday_date = date.fromisoformat(request.form['holiday_date'])
+        pay_rules.save_holiday(db.session.execute, holiday_date,
+                               request.form.get('name', '').strip(), request.form.get('kind'))
+    except (KeyError, ValueError) as e:
+        db.session.rollback()
+        flash(str(e) if isinstance(e, pay_rules.RuleError) else 'Give the holiday a valid date.', 'danger')
+        return redirect(url_for('payroll.pay_rules_page'))
+    db.session.commit()
+    flash('Holiday saved.', 'success')
+    return redirect(url_for('payroll.pay_rules_page', year=holiday_date.year))
+
+
+@bp.route('/holidays/delete', methods=['POST'])
+@roles_required("Admin", "Manager")
+def delete_holiday():
+    try:
+        holiday_date = date.fromisoformat(request.form.get('holiday_date', ''))
+    except ValueError:
+        flash('Give the holiday a valid date.', 'danger')
+        return redirect(url_for('payroll.pay_rules_page'))
+    pay_rules.delete_holiday(db.session.execute, holiday_date)
+    db.session.commit()
+    flash('Holiday removed.', 'success')
+    return redirect(url_for('payroll.pay_rules_page', year=holiday_date.year))
+
+
+@bp.route('/payslips', methods=['GET', 'POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+@idempotent
+def payslip_jobs():
+    if request.method == 'POST':
+        try:
+            job_id = payslips.create_job(
+                db.session.execute,
+                pay_period_id=request.form.get('pay_period_id', type=int),
+                project_id=request.form.get('project_id', type=int),
+                requested_by=session.get('username')
+            )
+            db.session.commit()
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('payroll.payslip_jobs'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('That pay period or project no longer exists.', 'danger')
+            return redirect(url_for('payroll.payslip_jobs'))
+        payslips.start(current_app._get_current_object(), job_id)
+        flash('Payslip batch queued; it can be downloaded here when it finishes.', 'success')
+        return redirect(url_for('payroll.payslip_jobs'))
+
+    return render_template('payslips.html',
+                           jobs=payslips.recent_jobs(db.session.execute),
+                           username=session.get('username'))
+
+
+@bp.route('/api/payslip_jobs/<int:id>')
+@roles_required("Admin", "Manager", "Assistant Manager")
+def payslip_job_progress(id):
+    job = payslips.get_job(db.session.execute, id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'total': job['total'],
+        'rendered': job['rendered'],
+        'percent': round(100 * job['rendered'] / job['total']) if job['total'] else (100 if job['status'] == 'done' else 0),
+        'error': job['error'],
+        'download_url': url_for('payroll.download_payslips', id=id) if job['status'] == 'done' else None,
+    })
+
+
+@bp.route('/payslips/<int:id>/download')
+@roles_required("Admin", "Manager", "Assistant Manager")
+def download_payslips(id):
+    job = payslips.get_job(db.session.execute, id)
+    if job is None or job['status'] != 'done' or not os.path.exists(job['file_path'] or ''):
+        flash('That payslip batch is not available.', 'danger')
+        return redirect(url_for('payroll.payslip_jobs'))
+    return send_file(job['file_path'], mimetype='application/zip', as_attachment=True,
+                     download_name=f"payslips-{id}.zip")
+
+
+@bp.route('/project_payroll/<int:project_id>')
+@login_required
+@conditional_get("projects", "employees", "project_employees", "payroll", "departments")
+def project_payroll(project_id):
+    # Get project details
+    project_result = db.session.execute(
+        text("""
+            SELECT p.*, d.name AS department FROM projects p
+            JOIN departments d ON d.id = p.department_id
+            WHERE p.id=:id AND p.archived_at IS NULL
+        """),
+        {"id": project_id}
+    ).fetchone()
+    if not project_result:
+        flash('Project not found!', 'danger')
+        return redirect(url_for('payroll.payroll_overview'))
+    project = as_record(project_result)
+
+    # Assigned employees
+    assigned_result = db.session.execute(
+        text("""
+            SELECT e.id AS employee_id, e.name, e.position
+            FROM employees e
+            JOIN project_employees pe ON e.id = pe.employee_id
+            WHERE pe.project_id=:project_id
+            ORDER BY e.name
+        """),
+        {"project_id": project_id}
+    )
+    assigned_employees = fetch_records(assigned_result)
+
+    # Latest payroll per employee
+    payroll_result = db.session.execute(
+        text("""
+            SELECT e.id AS employee_id, e.name, e.position,
+                   p.id, p.pay_period_start, p.pay_period_end,
+                   p.basic_salary, p.overtime, p.deductions, p.net_pay,
+                   p.status, p.gross_pay, p.total_deductions,
+                   p.daily_rate, p.meal, p.transpo, p.total_daily_salary,
+                   p.days_worked, p.total_ot_hours, p.ot_amount,
+                   p.holiday_pay, p.holiday_pay_amount, p.others, p.cash_advance,
+                   p.created_at, p.period_closed
+            FROM employees e
+            JOIN project_employees pe ON e.id = pe.employee_id
+            LEFT JOIN (
+                SELECT p1.*, ROW_NUMBER() OVER (PARTITION BY p1.employee_id ORDER BY p1.pay_period_end DESC, p1.created_at DESC) AS rn
+                FROM payroll p1
+                WHERE p1.project_id=:project_id
+            ) p ON e.id = p.employee_id AND p.rn = 1
+            WHERE pe.project_id=:project_id
+            ORDER BY e.name
+        """),
+        {"project_id": project_id}
+    )
+    # Build combined records
+    combined_records = []
+    for r in fetch_records(payroll_result):
+        if r.id is None:
+            combined_records.append(r._replace(
+                basic_salary=0, overtime=0, deductions=0, net_pay=0, status='No Payroll'
+            ))
+        else:
+            combined_records.append(r)
+
+    # Summary
+    summary = periods.payroll_summary(db.session.execute, project_id)
+
+    # All employees for dropdown
+    all_employees_result = db.session.execute(
+        text("SELECT id, name, position FROM employees WHERE archived_at IS NULL ORDER BY name")
+    )
+    all_employees = fetch_records(all_employees_result)
+
+    return render_template('project_payroll.html',
+                           project=project,
+                           payroll_records=combined_records,
+                           assigned_employees=assigned_employees,
+                           all_employees=all_employees,
+                           summary=summary,
+                           username=session.get('username'))
+
+
+@bp.route('/get_project_payroll/<int:id>', methods=['GET'])
+def get_project_payroll(id):
+    result = db.session.execute(
+        text("SELECT * FROM payroll WHERE id=:id"),
+        {"id": id}
+    ).mappings().first()
+
+    if result:
+        return jsonify(dict(result))
+    return jsonify({'error': 'Payroll record not found'}), 404
@@ -0,0 +1,246 @@
+"""Projects, their staff and the staffing overview."""
+from datetime import date
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, session, url_for
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import archival
+import departments as org
+import staffing
+from extensions import db, replica
+from http_cache import conditional_get
+from idempotency import idempotent
+from rows import LazyRecords, as_record
+from views.auth import login_required, roles_required
+
+bp = Blueprint("projects", __name__)
+
+
+@bp.route('/projects')
+@login_required
+@conditional_get("projects", "employees", "departments")
+def projects():
+    projects = LazyRecords(db.session.execute, text("""
+        SELECT p.id, p.project_name, p.department_id, d.name AS department, p.start_date, p.end_date, p.status
+        FROM projects p
+        JOIN departments d ON d.id = p.department_id
+        WHERE p.archived_at IS NULL
+    """))
+
+    employees = LazyRecords(
+        db.session.execute,
+        text("SELECT id, name FROM employees WHERE archived_at IS NULL ORDER BY name")
+    )
+
+    return render_template('projects.html', projects=projects, employees=employees,
+                           departments=org.tree(db.session.execute), username=session.get('username'))
+
+
+@bp.route('/project_employees/<int:project_id>')
+@login_required
+def project_employees(project_id):
+    result = db.session.execute(
+        text("""
+            SELECT e.id, e.name, e.position
+            FROM project_employees pe
+            JOIN employees e ON pe.employee_id = e.id
+            WHERE pe.project_id = :project_id
+            ORDER BY e.name
+        """),
+        {"project_id": project_id}
+    )
+    return jsonify([dict(row) for row in result.mappings()])
+
+
+@bp.route('/edit_project/<int:id>', methods=['GET', 'POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def edit_project(id):
+    if request.method == 'POST':
+        db.session.execute(
+            text("""
+                UPDATE projects
+                SET project_name=:project_name, department_id=:department_id,
+                    start_date=:start_date, end_date=:end_date, status=:status
+                WHERE id=:id
+            """),
+            {"project_name": request.form['project_name'],
+             "department_id": request.form['department_id'],
+             "start_date": request.form['start_date'],
+             "end_date": request.form['end_date'],
+             "status": request.form['status'],
+             "id": id}
+        )
+
+        # Remove old assignments
+        db.session.execute(text("DELETE FROM project_employees WHERE project_id=:id"), {"id": id})
+
+        # Add new assignments
+        for emp_id in request.form.getlist('employees'):
+            db.session.execute(
+                text("INSERT INTO project_employees (project_id, employee_id) VALUES (:project_id, :emp_id)"),
+                {"project_id": id, "emp_id": emp_id}
+            )
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('A project with this name already exists.', 'warning')
+            return redirect(url_for('projects.projects'))
+        flash('Project and assigned employees updated successfully!', 'success')
+        flash_staffing_conflicts(id)
+        return redirect(url_for('projects.projects'))
+
+    project_result = db.session.execute(text("""
+        SELECT p.*, d.name AS department FROM projects p
+        JOIN departments d ON d.id = p.department_id
+        WHERE p.id=:id AND p.archived_at IS NULL
+    """), {"id": id})
+    project = as_record(project_result.fetchone())
+
+    employees = LazyRecords(
+        db.session.execute,
+        text("SELECT id, name FROM employees WHERE archived_at IS NULL ORDER BY name")
+    )
+
+    assigned_result = db.session.execute(text("SELECT employee_id FROM project_employees WHERE project_id=:id"), {"id": id})
+    assigned = [row.employee_id for row in assigned_result]
+
+    return render_template('edit_project.html', project=project, employees=employees, assigned=assigned,
+                           departments=org.tree(db.session.execute))
+
+
+@bp.route('/add_project', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+@idempotent
+def add_project():
+    project_id = db.session.execute(
+        text("""
+            INSERT INTO projects (project_name, department_id, start_date, end_date, status)
+            VALUES (:project_name, :department_id, :start_date, :end_date, :status)
+            ON CONFLICT (project_name) WHERE archived_at IS NULL DO NOTHING
+            RETURNING id
+        """),
+        {"project_name": request.form['project_name'],
+         "department_id": request.form['department_id'],
+         "start_date": request.form['start_date'],
+         "end_date": request.form['end_date'],
+         "status": request.form['status']}
+    ).scalar()
+    if project_id is None:
+        db.session.rollback()
+        flash('A project with this name already exists.', 'warning')
+        return redirect(url_for('projects.projects'))
+
+    for emp_id in request.form.getlist('employees'):
+        db.session.execute(
+            text("INSERT INTO project_employees (project_id, employee_id) VALUES (:project_id, :emp_id)"),
+            {"project_id": project_id, "emp_id": emp_id}
+        )
+
+    db.session.commit()
+    flash('Project and employees added successfully!', 'success')
+    flash_staffing_conflicts(project_id)
+    return redirect(url_for('projects.projects'))
+
+
+@bp.route('/update_project', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def update_project():
+    db.session.execute(
+        text("""
+            UPDATE projects
+            SET project_name=:project_name, department_id=:department_id,
+                start_date=:start_date, end_date=:end_date, status=:status
+            WHERE id=:id
+        """),
+        {"id": request.form['id'],
+         "project_name": request.form['project_name'],
+         "department_id": request.form['department_id'],
+         "start_date": request.form['start_date'],
+         "end_date": request.form['end_date'],
+         "status": request.form['status']}
+    )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash('A project with this name already exists.', 'warning')
+        return redirect(url_for('projects.projects'))
+    flash('Project updated successfully!', 'success')
+    flash_staffing_conflicts(request.form['id'])
+    return redirect(url_for('projects.projects'))
+
+
+def flash_staffing_conflicts(project_id, employee_ids=None):
+    """Warn about assignments of this project's staff that overlap other projects."""
+    message = staffing.describe(staffing.project_conflicts(db.session.execute, project_id, employee_ids))
+    if message:
+        flash(message, 'warning')
+
+
+@bp.route('/staffing')
+@roles_required("Admin", "Manager", "Assistant Manager")
+def staffing_page():
+    today = date.today().isoformat()
+    start = request.args.get('start', today)
+    end = request.args.get('end', today)
+    department_id = request.args.get('department_id', type=int)
+    try:
+        start_date, end_date = staffing.window(start, end)
+    except staffing.StaffingError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('projects.staffing_page'))
+
+    return render_template('staffing.html',
+                           start=start, end=end, department_id=department_id,
+                           free=staffing.free_employees(db.session.execute, start_date, end_date, department_id),
+                           conflicts=staffing.conflicts(db.session.execute, start_date, end_date),
+                           departments=org.tree(db.session.execute),
+                           username=session.get('username'))
+
+
+@bp.route('/delete_project/<int:id>', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def delete_project(id):
+    # Soft delete; payroll, assignments and reports move to the archive tables
+    # in the background instead of one long cascading DELETE.
+    archived = archival.archive(db.session.execute, "project", id, session.get('username'))
+    db.session.commit()
+    if not archived:
+        flash('Project not found!', 'danger')
+        return redirect(url_for('projects.projects'))
+    archival.kick(current_app._get_current_object())
+    flash('Project deleted successfully!', 'success')
+    return redirect(url_for('projects.projects'))
+
+
+@bp.route('/api/projects/<int:project_id>/forecast', methods=['GET', 'POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+def project_forecast(project_id):
+    """Monte Carlo forecast of a project's remaining payroll cost.
+
+    POST a JSON body with ``draws`` and a list of ``scenarios`` to compare
+    several at once; GET takes a single scenario from the query string.
+    """
+    # Imported here: workers that never forecast skip it and its process pool.
+    from payroll_forecast import forecast_project
+
+    payload = request.get_json(silent=True) or {}
+    if request.method == 'GET':
+        payload = {
+            "draws": request.args.get('draws', 10000),
+            "workdays_per_week": request.args.get('workdays_per_week', 6),
+            "scenarios": [{k: request.args[k] for k in ('attendance_rate', 'attendance_sd', 'ot_hours_per_day')
+                           if k in request.args}],
+        }
+
+    try:
+        result = forecast_project(replica.execute, project_id, payload)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if result is None:
+        return jsonify({'error': 'Project not found'}), 404
+    return jsonify(result)
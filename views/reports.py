@@ -0,0 +1,497 @@
+"""Saved reports: generating, viewing and downloading them."""
+import csv
+from datetime import date, datetime
+from io import BytesIO, StringIO
+
+from flask import Blueprint, flash, redirect, render_template, request, send_file, session, url_for
+from sqlalchemy import text
+
+import departments as org
+import money
+import pay_periods as periods
+import query_cache
+from extensions import db, replica
+from http_cache import conditional_get
+from idempotency import idempotent
+from rows import LazyRecords, as_record, fetch_records
+from views.auth import roles_required
+
+bp = Blueprint("reports", __name__)
+
+
+@bp.route('/reports')
+@roles_required("Admin", "Manager", "Assistant Manager")
+@conditional_get("reports", "projects", "departments")
+def reports():
+    report_result = db.session.execute(
+        text("SELECT * FROM reports ORDER BY report_date DESC")
+    )
+    report_list = fetch_records(report_result)
+
+    projects_result = db.session.execute(
+        text("SELECT id, project_name FROM projects WHERE archived_at IS NULL ORDER BY project_name")
+    )
+    projects = fetch_records(projects_result)
+
+    return render_template(
+        'reports.html',
+        reports=report_list,
+        projects=projects,
+        departments=org.tree(db.session.execute),
+        username=session.get('username'),
+        date=date
+    )
+
+
+@bp.route('/generate_report', methods=['POST'])
+@roles_required("Admin", "Manager", "Assistant Manager")
+@idempotent
+def generate_report():
+    report_type = request.form['report_type']
+    created_by = session.get('username', 'Unknown')
+    project_id = request.form.get('project_id')
+    title = ""
+    description = ""
+
+    if report_type == "employees":
+        title = "Employee Master List"
+        description = "Complete list of all employees."
+
+    elif report_type == "attendance_daily":
+        date_selected = request.form.get('date', date.today().isoformat())
+        title = f"Daily Attendance Report - {date_selected}"
+        description = f"Employee attendance for {date_selected}"
+
+    elif report_type == "attendance_monthly":
+        month_selected = request.form.get('month', date.today().strftime('%Y-%m'))
+        month_obj = datetime.strptime(month_selected, '%Y-%m')
+        month_display = month_obj.strftime('%B %Y')
+        title = "Monthly Attendance Summary"
+        description = f"Summary of employee attendance for {month_display} (Month: {month_selected})"
+
+    elif report_type == "payroll_employee":
+        title = "Payroll Per Employee"
+        description = "Payroll records grouped by employee with totals and averages."
+
+    elif report_type == "payroll_project":
+        if not project_id:
+            flash("Please select a project for payroll report", "danger")
+            return redirect(url_for('reports.reports'))
+
+        project = db.session.execute(
+            text("SELECT project_name FROM projects WHERE id=:id"),
+            {"id": project_id}
+        ).fetchone()
+        project_name = project.project_name if project else f"Project {project_id}"
+        title = f"Payroll Report - {project_name}"
+        description = f"Detailed payroll analysis for {project_name}"
+
+    elif report_type == "project_list":
+        if not project_id:
+            flash("Please select a project for employee list", "danger")
+            return redirect(url_for('reports.reports'))
+
+        project = db.session.execute(
+            text("SELECT project_name FROM projects WHERE id=:id"),
+            {"id": project_id}
+        ).fetchone()
+        project_name = project.project_name if project else f"Project {project_id}"
+        title = f"Project Employee List - {project_name}"
+        description = f"Employees assigned to {project_name}"
+
+    # Any report can be limited to a department and its sub-units.
+    department_id = request.form.get('department_id', type=int)
+    if department_id:
+        department = org.get(db.session.execute, department_id)
+        if department is None:
+            flash("That department no longer exists.", "danger")
+            return redirect(url_for('reports.reports'))
+        title = f"{title} ({department.path})"[:150]
+
+    # Insert report into DB and return the inserted id
+    inserted_id = db.session.execute(
+        text("""
+            INSERT INTO reports (title, description, created_by, project_id, department_id)
+            VALUES (:title, :description, :created_by, :project_id, :department_id)
+            RETURNING id
+        """),
+        {"title": title, "description": description, "created_by": created_by, "project_id": project_id,
+         "department_id": department_id}
+    ).scalar()
+
+    db.session.commit()
+    flash(f'Report "{title}" generated successfully!', 'success')
+    return redirect(url_for('reports.view_report', id=inserted_id))
+
+
+@bp.route('/report/view/<int:id>')
+@roles_required("Admin", "Manager", "Assistant Manager")
+@conditional_get("reports", "employees", "attendance", "payroll", "projects", "project_employees", "departments")
+def view_report(id):
+    # Fetch report
+    report_row = replica.execute(
+        text("SELECT * FROM reports WHERE id = :id"), {"id": id}
+    ).fetchone()
+
+    if not report_row:
+        flash("Report not found!", "danger")
+        return redirect(url_for('reports.reports'))
+
+    report = as_record(report_row)
+    title = report.title
+    project_id = report.get('project_id')
+    department_id = report.get('department_id')
+    in_department = org.subtree_filter('e.department_id', department_id)
+
+    # 1. EMPLOYEE MASTER LIST
+    if "Employee Master List" in title:
+        employees = query_cache.fetch(replica.execute, f"""
+                SELECT e.*, d.name AS department FROM employees e
+                JOIN departments d ON d.id = e.department_id
+                WHERE e.archived_at IS NULL {in_department}
+                ORDER BY e.name
+            """, {"department_id": department_id})
+        return render_template("report_employee_list.html", employees=employees, report=report)
+
+    # 2. DAILY ATTENDANCE
+    if "Daily Attendance" in title:
+        date_str = report.get("description", "").split("for ")[-1] or date.today().isoformat()
+        attendance_data = query_cache.fetch(replica.execute, f"""
+                SELECT e.name, d.name AS department, e.position, a.status, a.date
+                FROM attendance a
+                JOIN employees e ON a.employee_id = e.id
+                JOIN departments d ON d.id = e.department_id
+                WHERE a.date = :date {in_department}
+                ORDER BY e.name
+            """, {"date": date_str, "department_id": department_id})
+        return render_template("report_attendance_daily.html", attendance_data=attendance_data, date=date_str, report=report)
+
+    # 3. MONTHLY ATTENDANCE
+    if "Monthly Attendance" in title:
+        month = date.today().strftime("%Y-%m")
+        description = report.get("description", "")
+        if "Month:" in description:
+            month = description.split("Month:")[-1].strip().rstrip(")")
+
+        monthly_data = query_cache.fetch(replica.execute, f"""
+                SELECT
+                    e.id,
+                    e.name,
+                    d.name AS department,
+                    e.position,
+                    COUNT(a.id) AS days_recorded,
+                    SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END) AS days_present,
+                    SUM(CASE WHEN a.status = 'Absent' THEN 1 ELSE 0 END) AS days_absent,
+                    SUM(CASE WHEN a.status = 'Late' THEN 1 ELSE 0 END) AS days_late,
+                    CASE 
+                        WHEN COUNT(a.id) > 0 THEN ROUND((SUM(CASE WHEN a.status='Present' THEN 1 ELSE 0 END)::numeric / COUNT(a.id)) * 100, 2)
+                        ELSE 0
+                    END AS attendance_rate
+                FROM employees e
+                JOIN departments d ON d.id = e.department_id
+                LEFT JOIN attendance a ON e.id = a.employee_id AND TO_CHAR(a.date, 'YYYY-MM') = :month
+                WHERE e.archived_at IS NULL {in_department}
+                GROUP BY e.id, e.name, d.name, e.position
+                ORDER BY d.name, e.name
+            """, {"month": month, "department_id": department_id})
+        return render_template("report_attendance_monthly.html", monthly_data=monthly_data, month=month, report=report, now=datetime.now())
+
+    # 4. PAYROLL PER EMPLOYEE
+    if "Payroll Per Employee" in title:
+        totals = periods.totals_by(replica.execute, "employee")
+        payroll_summary = []
+        for employee in query_cache.fetch(
+            replica.execute, f"""
+                SELECT e.id, e.name, d.name AS department, e.position FROM employees e
+                JOIN departments d ON d.id = e.department_id
+                WHERE e.archived_at IS NULL {in_department}
+            """, {"department_id": department_id},
+            extra=('pay_records', 'total_earned', 'avg_pay', 'latest_pay_period')
+        ):
+            employee_totals = totals.get(employee.id)
+            pay_records = employee_totals['records'] if employee_totals else 0
+            total_earned = employee_totals['net_pay'] if employee_totals else money.ZERO
+            payroll_summary.append(employee._replace(
+                pay_records=pay_records,
+                total_earned=total_earned,
+                avg_pay=money.average(total_earned, pay_records),
+                latest_pay_period=employee_totals['latest_pay_period_end'] if employee_totals else None,
+            ))
+        payroll_summary.sort(key=lambda r: (-r.total_earned, r.name))
+
+        payroll_entries = LazyRecords(
+            replica.execute,
+            text(f"""
+                SELECT e.name, d.name AS department, e.position, p.pay_period_start, p.pay_period_end,
+                       p.basic_salary, p.overtime, p.deductions, p.net_pay, p.status
+                FROM payroll p
+                JOIN employees e ON e.id = p.employee_id
+                JOIN departments d ON d.id = e.department_id
+                WHERE TRUE {in_department}
+                ORDER BY p.pay_period_end DESC, e.name
+            """),
+            {"department_id": department_id}
+        )
+
+        total_payroll_cost = money.total(r.total_earned for r in payroll_summary)
+        total_employees = len(payroll_summary)
+        employees_with_payroll = len([r for r in payroll_summary if r.total_earned > 0])
+        avg_employee_pay = money.average(total_payroll_cost, employees_with_payroll)
+        latest_pay_period = max((r.latest_pay_period for r in payroll_summary if r.latest_pay_period), default=None)
+
+        return render_template("report_payroll_employee.html",
+                               payroll_summary=payroll_summary,
+                               payroll_entries=payroll_entries,
+                               total_payroll_cost=total_payroll_cost,
+                               total_employees=total_employees,
+                               employees_with_payroll=employees_with_payroll,
+                               avg_employee_pay=avg_employee_pay,
+                               latest_pay_period=latest_pay_period,
+                               report=report,
+                               now=datetime.now())
+
+    # 5. PAYROLL PER PROJECT
+    if "Payroll Per Project" in title or "Payroll Report -" in title:
+        project_filter = "AND p.id=:project_id" if project_id else ""
+        project_data = query_cache.fetch(replica.execute, f"""
+                SELECT 
+                    p.id as project_id,
+                    p.project_name,
+                    d.name AS department,
+                    p.status as project_status,
+                    COUNT(DISTINCT pe.employee_id) as assigned_employees
+                FROM projects p
+                JOIN departments d ON d.id = p.department_id
+                LEFT JOIN project_employees pe ON p.id = pe.project_id
+                WHERE p.archived_at IS NULL {project_filter} {org.subtree_filter('p.department_id', department_id)}
+                GROUP BY p.id, p.project_name, d.name, p.status
+            """, {"project_id": project_id, "department_id": department_id}, extra=('payroll_records', 'total_payroll_cost', 'avg_employee_pay'))
+
+        totals = periods.totals_by(replica.execute, "project")
+        for i, p in enumerate(project_data):
+            project_totals = totals.get(p.project_id)
+            payroll_records = project_totals['records'] if project_totals else 0
+            total_payroll_cost = project_totals['net_pay'] if project_totals else money.ZERO
+            project_data[i] = p._replace(
+                payroll_records=payroll_records,
+                total_payroll_cost=total_payroll_cost,
+                avg_employee_pay=money.average(total_payroll_cost, payroll_records),
+            )
+        project_data.sort(key=lambda p: p.total_payroll_cost, reverse=True)
+
+        total_payroll_cost = money.total(p.total_payroll_cost for p in project_data)
+        total_employees = sum(p.assigned_employees for p in project_data)
+        total_payroll_records = sum(p.payroll_records for p in project_data)
+        avg_employee_cost = money.average(total_payroll_cost, total_employees)
+
+        return render_template("report_payroll_project.html",
+                               project_data=project_data,
+                               total_payroll_cost=total_payroll_cost,
+                               total_employees=total_employees,
+                               total_payroll_records=total_payroll_records,
+                               avg_employee_cost=avg_employee_cost,
+                               report=report,
+                               now=datetime.now())
+
+    # 6. PROJECT EMPLOYEE LIST
+    if "Project Employee List" in title:
+        rows = query_cache.fetch(replica.execute, f"""
+                SELECT 
+                    p.id AS project_id, p.project_name, pd.name AS project_department, p.status AS project_status,
+                    e.id AS employee_id, e.name AS employee_name, e.position AS employee_position, ed.name AS employee_department
+                FROM projects p
+                JOIN departments pd ON pd.id = p.department_id
+                LEFT JOIN project_employees pe ON p.id = pe.project_id
+                LEFT JOIN employees e ON pe.employee_id = e.id AND e.archived_at IS NULL
+                LEFT JOIN departments ed ON ed.id = e.department_id
+                WHERE p.archived_at IS NULL {org.subtree_filter('p.department_id', department_id)}
+                ORDER BY p.project_name, e.name
+            """, {"department_id": department_id})
+
+        projects_map = {}
+        for row in rows:
+            pid = row.project_id
+            if pid not in projects_map:
+                projects_map[pid] = {
+                    'project_id': pid,
+                    'project_name': row.project_name,
+                    'project_department': row.project_department,
+                    'project_status': row.project_status,
+                    'employees': []
+                }
+            if row.employee_id:
+                projects_map[pid]['employees'].append({
+                    'employee_id': row.employee_id,
+                    'name': row.employee_name,
+                    'position': row.employee_position,
+                    'department': row.employee_department
+                })
+
+        projects_data = list(projects_map.values())
+        total_projects = len(projects_data)
+        total_assignments = sum(len(proj['employees']) for proj in projects_data)
+        projects_with_staff = len([proj for proj in projects_data if proj['employees']])
+
+        return render_template("report_project_employee.html",
+                               projects_data=projects_data,
+                               total_projects=total_projects,
+                               total_assignments=total_assignments,
+                               projects_with_staff=projects_with_staff,
+                               report=report,
+                               now=datetime.now())
+
+    flash("Unknown report type.", "warning")
+    return redirect(url_for('reports.reports'))
+
+
+@bp.route('/download_report/<int:id>')
+@roles_required("Admin", "Manager", "Assistant Manager")
+@conditional_get("reports", "employees", "attendance", "departments")
+def download_report(id):
+    try:
+        with replica.connect() as conn:
+            # Fetch the report
+            result = conn.execute(
+                text("SELECT * FROM reports WHERE id = :id"),
+                {"id": id}
+            )
+            report = result.mappings().first()
+
+            if not report:
+                flash("Report not found!", "danger")
+                return redirect(url_for('reports.reports'))
+
+            report_title = report["title"]
+            department_id = report["department_id"]
+            in_department = org.subtree_filter('e.department_id', department_id)
+
+            # -------------------------
+            # EMPLOYEE MASTER LIST
+            # -------------------------
+            if "Employee Master List" in report_title:
+                result = conn.execute(
+                    text(f"""
+                        SELECT e.*, d.name AS department FROM employees e
+                        JOIN departments d ON d.id = e.department_id
+                        WHERE e.archived_at IS NULL {in_department}
+                        ORDER BY e.name
+                    """),
+                    {"department_id": department_id}
+                )
+                data = result.mappings().all()
+                return generate_text_report(
+                    f"Employee Master List - {date.today()}",
+                    data,
+                    ["name", "position", "department", "status"]
+                )
+
+            # -------------------------
+            # DAILY ATTENDANCE
+            # -------------------------
+            elif "Daily Attendance" in report_title:
+                date_str = report["description"].split("for ")[-1] if "for " in report["description"] else date.today().isoformat()
+                result = conn.execute(
+                    text(f"""
+                        SELECT e.name, d.name AS department, e.position, a.status, a.date
+                        FROM attendance a
+                        JOIN employees e ON a.employee_id = e.id
+                        JOIN departments d ON d.id = e.department_id
+                        WHERE a.date = :date_str {in_department}
+                        ORDER BY e.name
+                    """),
+                    {"date_str": date_str, "department_id": department_id}
+                )
+                data = result.mappings().all()
+                return generate_text_report(
+                    f"Daily Attendance - {date_str}",
+                    data,
+                    ["name", "department", "position", "status", "date"]
+                )
+
+            # -------------------------
+            # MONTHLY ATTENDANCE
+            # -------------------------
+            elif "Monthly Attendance Summary" in report_title:
+                current_month = date.today().strftime('%Y-%m')
+                result = conn.execute(
+                    text(f"""
+                        SELECT e.name, d.name AS department, e.position,
+                               COUNT(a.id) AS days_recorded,
+                               SUM(CASE WHEN a.status = 'Present' THEN 1 ELSE 0 END) AS days_present,
+                               SUM(CASE WHEN a.status = 'Absent' THEN 1 ELSE 0 END) AS days_absent,
+                               SUM(CASE WHEN a.status = 'Late' THEN 1 ELSE 0 END) AS days_late
+                        FROM employees e
+                        JOIN departments d ON d.id = e.department_id
+                        LEFT JOIN attendance a 
+                               ON e.id = a.employee_id AND TO_CHAR(a.date, 'YYYY-MM') = :month
+                        WHERE e.archived_at IS NULL {in_department}
+                        GROUP BY e.id, e.name, d.name, e.position
+                        HAVING COUNT(a.id) > 0
+                        ORDER BY d.name, e.name
+                    """),
+                    {"month": current_month, "department_id": department_id}
+                )
+                data = result.mappings().all()
+                return generate_text_report(
+                    f"Monthly Attendance Summary - {current_month}",
+                    data,
+                    ["name", "department", "position", "days_recorded", "days_present", "days_absent", "days_late"]
+                )
+
+            # -------------------------
+            # GENERIC FALLBACK
+            # -------------------------
+            else:
+                content = f"Report: {report['title']}\n"
+                content += f"Description: {report['description']}\n"
+                content += f"Created By: {report['created_by']}\n"
+                content += f"Date: {report['report_date']}\n"
+                return generate_simple_text(content, f"report_{id}.txt")
+
+    except Exception as e:
+        print(f"Error downloading report: {e}")
+        flash("Error downloading report", "danger")
+        return redirect(url_for('reports.reports'))
+
+
+def generate_text_report(title, data, columns):
+    """Generate a CSV report from data."""
+    output = StringIO()
+    writer = csv.writer(output)
+
+    # Header
+    writer.writerow([title])
+    writer.writerow([])
+    writer.writerow(columns)
+
+    # Data
+    for row in data:
+        writer.writerow([row.get(col, '') for col in columns])
+
+    content = output.getvalue()
+    output.close()
+
+    buffer = BytesIO()
+    buffer.write(content.encode('utf-8'))
+    buffer.seek(0)
+
+    return send_file(
+        buffer,
+        as_attachment=True,
+        download_name=f"{title.replace(' ', '_')}_{date.today()}.csv",
+        mimetype='text/csv'
+    )
+
+
+def generate_simple_text(content, filename):
+    """Generate a simple text file download."""
+    buffer = BytesIO()
+    buffer.write(content.encode('utf-8'))
+    buffer.seek(0)
+
+    return send_file(
+        buffer,
+        as_attachment=True,
+        download_name=filename,
+        mimetype='text/plain'
+    )